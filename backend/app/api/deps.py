@@ -4,6 +4,7 @@ from app.core.security import verify_token
 from app.services.user_service import UserService
 from app.models.user import UserModel
 from typing import Optional
+from datetime import datetime
 
 security = HTTPBearer()
 
@@ -29,7 +30,8 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = await UserService.get_user_by_id(user_id)
+    # 鉴权只需要账户状态，允许从从库读取；刚写入过的用户自动走主库
+    user = await UserService.get_user_by_id(user_id, tolerant=True)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -50,9 +52,20 @@ async def get_current_active_user(current_user: UserModel = Depends(get_current_
 
 async def get_current_vip_user(current_user: UserModel = Depends(get_current_active_user)):
     """获取当前VIP用户"""
-    if not current_user.is_vip:
+    # 过期清理任务按周期运行，到期后、被降级前的这段时间同样拒绝
+    expired = current_user.vip_expire_time is not None and current_user.vip_expire_time < datetime.utcnow()
+    if not current_user.is_vip or expired:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="需要VIP会员权限"
         )
-    return current_user 
\ No newline at end of file
+    return current_user
+
+async def get_current_admin_user(current_user: UserModel = Depends(get_current_active_user)):
+    """获取当前管理员用户"""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限"
+        )
+    return current_user
\ No newline at end of file
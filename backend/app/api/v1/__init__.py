@@ -1,8 +1,10 @@
 from fastapi import APIRouter
 from .auth import router as auth_router
 from .users import router as users_router
+from .admin import router as admin_router
 
 router = APIRouter()
 
 router.include_router(auth_router)
-router.include_router(users_router) 
\ No newline at end of file
+router.include_router(users_router)
+router.include_router(admin_router)
\ No newline at end of file
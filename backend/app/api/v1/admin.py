@@ -0,0 +1,140 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import date, datetime
+import asyncio
+from app.api.deps import get_current_admin_user
+from app.core.database import failed_unique_indexes
+from app.core.profiler import profiler
+from app.services.analytics_service import AnalyticsService
+from app.services.subscription_service import SubscriptionService
+from app.services.user_service import UserService
+from app.schemas.user import VIPSubscriptionCreate
+from app.services.admin_service import AdminService, MAX_PAGE_SIZE
+from app.services.import_service import ImportService, iter_lines
+from app.services.export_service import ExportService, FORMATS, export_filename, user_export_targets
+from app.repositories.base import EXPORT_COLLECTIONS
+from bson import ObjectId
+
+router = APIRouter(prefix="/admin", tags=["管理"], dependencies=[Depends(get_current_admin_user)])
+
+class ProfilingStart(BaseModel):
+    sample_rate: Optional[float] = Field(None, ge=0, le=1)
+    duration_seconds: Optional[float] = Field(None, gt=0, le=3600)
+    reset: bool = False  # 清除之前累计的样本
+
+@router.get("/profiling", response_model=dict)
+async def profiling_status():
+    """当前worker的剖析状态"""
+    return profiler.status()
+
+@router.post("/profiling/start", response_model=dict)
+async def start_profiling(options: ProfilingStart):
+    """在处理本请求的worker上开始采样剖析"""
+    if profiler.enabled:
+        raise HTTPException(status_code=409, detail="剖析已在进行中")
+    if options.reset:
+        profiler.reset()
+    profiler.start(sample_rate=options.sample_rate, duration=options.duration_seconds)
+    return profiler.status()
+
+@router.post("/profiling/stop", response_model=dict)
+async def stop_profiling():
+    """停止剖析并写出各路由的折叠栈文件"""
+    # 等待采样线程退出并写文件，放到线程中执行，不阻塞事件循环
+    files = await asyncio.to_thread(profiler.stop)
+    return {**profiler.status(), "files": files}
+
+@router.get("/analytics/summary", response_model=dict)
+async def analytics_summary(day: Optional[date] = None):
+    """某一天（UTC，默认今天）的注册、登录、VIP转化计数和DAU/WAU/MAU"""
+    return await AnalyticsService.summary(day or datetime.utcnow().date())
+
+@router.get("/analytics/series", response_model=dict)
+async def analytics_series(granularity: str, start: datetime, end: datetime):
+    """按 hour / day / month 返回区间内各时间桶的计数器和活跃用户数"""
+    points, message = await AnalyticsService.series(granularity, start, end)
+    if points is None:
+        raise HTTPException(status_code=400, detail=message)
+    return {"granularity": granularity, "points": points}
+
+@router.get("/users", response_model=dict)
+async def list_users(
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: str = "_id",
+    q: Optional[str] = Query(None, max_length=64),
+    search_field: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    is_vip: Optional[bool] = None,
+    vip_level: Optional[int] = None
+):
+    """用户目录：按 is_active / is_vip / vip_level 筛选，q 按用户名、昵称、邮箱或手机号前缀搜索（不区分大小写），
+    用上一页返回的 next_cursor 翻页"""
+    result, message = await AdminService.list_users(
+        limit, cursor, sort, q, search_field, is_active, is_vip, vip_level
+    )
+    if result is None:
+        raise HTTPException(status_code=400, detail=message)
+    return result
+
+@router.post("/users/backfill-search", response_model=dict)
+async def backfill_user_search():
+    """为存量用户补齐搜索字段"""
+    return {"updated": await AdminService.backfill_search_fields()}
+
+@router.post("/users/{user_id}/vip/subscriptions", response_model=dict)
+async def grant_vip(user_id: str, subscription: VIPSubscriptionCreate):
+    """为已在外部渠道确认付款的订单开通VIP（补单），transaction_id 为外部支付流水号"""
+    if not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="无效的用户ID")
+    user = await UserService.get_user_by_id(user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    expire_time = user.vip_expire_time
+    conversion = not user.is_vip or (expire_time is not None and expire_time < datetime.utcnow())
+    result, message = await SubscriptionService.purchase(user_id, subscription, conversion, payment_verified=True)
+    if not result:
+        raise HTTPException(status_code=400, detail=message)
+    return result
+
+@router.post("/users/import", response_model=dict)
+async def import_users(request: Request, format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """批量导入用户，请求体为NDJSON或CSV，边接收边按批写入；重复的用户跳过并在结果中列出"""
+    if failed_unique_indexes("users"):
+        raise HTTPException(status_code=503, detail="用户唯一索引未建立（存在重复数据），暂不能导入")
+    stats = await ImportService.import_users(iter_lines(request.stream()), format)
+    return stats.as_dict()
+
+@router.get("/export")
+async def export_data(
+    collection: Optional[str] = None,
+    user_id: Optional[str] = None,
+    format: str = "ndjson",
+    redact: Optional[str] = Query(None, description="逗号分隔的字段，导出为HMAC假名")
+):
+    """流式导出 users / user_sessions / vipsubscriptions 为NDJSON或gzip
+
+    只给 user_id 时导出该用户在所有集合中的数据，每行为 {"collection", "document"}。
+    密码哈希和刷新令牌始终不导出。
+    """
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail="不支持的导出格式")
+    if user_id is not None and not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="无效的用户ID")
+    if collection is None:
+        if user_id is None:
+            raise HTTPException(status_code=400, detail="需要指定 collection 或 user_id")
+        targets, name = user_export_targets(user_id), f"user-{user_id}"
+    elif collection in EXPORT_COLLECTIONS:
+        targets, name = [(collection, user_id)], collection if user_id is None else f"{collection}-{user_id}"
+    else:
+        raise HTTPException(status_code=400, detail="不支持导出该集合")
+
+    fields = [field.strip() for field in (redact or "").split(",") if field.strip()]
+    return StreamingResponse(
+        ExportService.stream(targets, format, fields),
+        media_type="application/gzip" if format == "gzip" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(name, format)}"'}
+    )
@@ -7,9 +7,29 @@ from app.services.auth_service import AuthService
 from app.services.user_service import UserService
 from app.api.deps import get_current_active_user
 from app.models.user import UserModel
+from app.core.config import settings
+from app.core.rate_limit import RateLimiter
 
 router = APIRouter(prefix="/auth", tags=["认证"])
 
+# 登录按用户名/手机号/邮箱和IP限流，在bcrypt校验之前拒绝
+login_rate_limit = RateLimiter(
+    "login",
+    settings.login_rate_limit,
+    settings.login_rate_period,
+    fields=("username", "phone", "email"),
+    ip_limit=settings.login_ip_rate_limit
+)
+
+# 验证码按手机号/邮箱和IP限流，在写入验证码之前拒绝
+verification_code_rate_limit = RateLimiter(
+    "verification_code",
+    settings.verification_code_rate_limit,
+    settings.verification_code_rate_period,
+    fields=("phone", "email"),
+    ip_limit=settings.verification_code_ip_rate_limit
+)
+
 @router.post("/register", response_model=LoginResponse)
 async def register(user_data: UserRegister):
     """用户注册"""
@@ -32,7 +52,7 @@ async def register(user_data: UserRegister):
         user=user
     )
 
-@router.post("/login", response_model=LoginResponse)
+@router.post("/login", response_model=LoginResponse, dependencies=[Depends(login_rate_limit)])
 async def login(login_data: UserLogin):
     """用户登录"""
     user, message = await AuthService.login_user(login_data)
@@ -70,7 +90,8 @@ async def wechat_login(wechat_data: WechatLogin):
         user=user
     )
 
-@router.post("/verification-code", response_model=VerificationCodeResponse)
+@router.post("/verification-code", response_model=VerificationCodeResponse,
+             dependencies=[Depends(verification_code_rate_limit)])
 async def send_verification_code(code_request: VerificationCodeRequest):
     """发送验证码"""
     if code_request.phone:
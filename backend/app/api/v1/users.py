@@ -1,37 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from app.schemas.user import (
-    UserUpdate, PasswordChange, MessageResponse
+    UserUpdate, PasswordChange, MessageResponse, VIPSubscriptionCreate
 )
 from app.services.user_service import UserService
+from app.services.avatar_service import AvatarService, UploadTooLarge
+from app.services.subscription_service import SubscriptionService
+from app.core.config import settings
 from app.api.deps import get_current_active_user
 from app.models.user import UserModel
+from datetime import datetime
 
 router = APIRouter(prefix="/users", tags=["用户管理"])
 
+def user_profile(user: UserModel) -> dict:
+    """用户资料（不包含密码哈希等内部字段）"""
+    return {
+        "id": str(user.id),
+        "username": user.username,
+        "email": user.email,
+        "phone": user.phone,
+        "nickname": user.nickname,
+        "avatar": user.avatar,
+        "gender": user.gender,
+        "birthday": user.birthday,
+        "bio": user.bio,
+        "is_active": user.is_active,
+        "is_verified": user.is_verified,
+        "email_verified": user.email_verified,
+        "phone_verified": user.phone_verified,
+        "is_vip": user.is_vip,
+        "vip_level": user.vip_level,
+        "vip_expire_time": user.vip_expire_time,
+        "vip_balance": user.vip_balance,
+        "created_at": user.created_at,
+        "last_login": user.last_login
+    }
+
 @router.get("/profile", response_model=dict)
 async def get_user_profile(current_user: UserModel = Depends(get_current_active_user)):
     """获取用户资料"""
-    return {
-        "id": str(current_user.id),
-        "username": current_user.username,
-        "email": current_user.email,
-        "phone": current_user.phone,
-        "nickname": current_user.nickname,
-        "avatar": current_user.avatar,
-        "gender": current_user.gender,
-        "birthday": current_user.birthday,
-        "bio": current_user.bio,
-        "is_active": current_user.is_active,
-        "is_verified": current_user.is_verified,
-        "email_verified": current_user.email_verified,
-        "phone_verified": current_user.phone_verified,
-        "is_vip": current_user.is_vip,
-        "vip_level": current_user.vip_level,
-        "vip_expire_time": current_user.vip_expire_time,
-        "vip_balance": current_user.vip_balance,
-        "created_at": current_user.created_at,
-        "last_login": current_user.last_login
-    }
+    return user_profile(current_user)
 
 @router.put("/profile", response_model=dict)
 async def update_user_profile(
@@ -42,7 +50,23 @@ async def update_user_profile(
     user, message = await UserService.update_user_profile(str(current_user.id), user_data)
     if not user:
         raise HTTPException(status_code=400, detail=message)
-    return user
+    return user_profile(user)
+
+@router.put("/avatar", response_model=dict)
+async def upload_avatar(request: Request, current_user: UserModel = Depends(get_current_active_user)):
+    """上传头像，请求体为图片原始字节（JPEG/PNG/WebP/GIF）"""
+    too_large = f"文件大小不能超过{settings.max_file_size / 1024 / 1024:.3g}MB"
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > settings.max_file_size:
+        raise HTTPException(status_code=413, detail=too_large)
+    
+    try:
+        result, message = await AvatarService.upload_avatar(str(current_user.id), request.stream())
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=too_large)
+    if not result:
+        raise HTTPException(status_code=400, detail=message)
+    return result
 
 @router.post("/change-password", response_model=MessageResponse)
 async def change_password(
@@ -58,4 +82,29 @@ async def change_password(
 @router.get("/vip/info", response_model=dict)
 async def get_vip_info(current_user: UserModel = Depends(get_current_active_user)):
     """获取VIP信息"""
-    return await UserService.get_vip_info(str(current_user.id)) 
\ No newline at end of file
+    return await UserService.get_vip_info(str(current_user.id))
+
+@router.post("/vip/subscriptions", response_model=dict)
+async def purchase_vip(
+    subscription: VIPSubscriptionCreate,
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """用VIP余额购买套餐，payment_method 必须为 balance"""
+    expire_time = current_user.vip_expire_time
+    conversion = not current_user.is_vip or (expire_time is not None and expire_time < datetime.utcnow())
+    result, message = await SubscriptionService.purchase(str(current_user.id), subscription, conversion)
+    if not result:
+        raise HTTPException(status_code=400, detail=message)
+    return result
+
+@router.get("/vip/subscriptions", response_model=dict)
+async def list_vip_subscriptions(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str = None,
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """订阅记录，按时间倒序，用上一页返回的 next_cursor 翻页"""
+    result, message = await SubscriptionService.list_subscriptions(str(current_user.id), limit, cursor)
+    if result is None:
+        raise HTTPException(status_code=400, detail=message)
+    return result
@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+import asyncio
+import time
+from .deadline import remaining_time
+from .metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DELAY, ADMISSION_REJECTED, ADMISSION_WAITING
+
+class OverloadedError(Exception):
+    """排队时间将超过延迟预算时抛出，由全局异常处理器转换为503"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("服务繁忙，请稍后再试")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """CPU密集操作的准入控制
+
+    同时最多执行 concurrency 个任务，任务在专用线程池中运行，不阻塞事件循环，
+    因此 /health 和只需校验令牌的读接口在过载时仍能保持低延迟。
+    根据平均执行耗时估算新任务的排队时间，超过 latency_budget 秒或当前请求的剩余时间预算时
+    直接拒绝，而不是让请求排队直到超时。
+    """
+
+    # 指数加权移动平均的平滑系数
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, name: str, concurrency: int, latency_budget: float,
+                 initial_service_time: float = 0.25):
+        self.name = name
+        self.concurrency = concurrency
+        self.latency_budget = latency_budget
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=name)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._active = 0
+        self._waiting = 0
+        self.rejected = 0
+        self.service_time = initial_service_time
+        self.queue_delay = 0.0
+        self._active_gauge = ADMISSION_ACTIVE.labels(name)
+        self._waiting_gauge = ADMISSION_WAITING.labels(name)
+        self._rejected_counter = ADMISSION_REJECTED.labels(name)
+        self._queue_delay_histogram = ADMISSION_QUEUE_DELAY.labels(name)
+
+    def estimated_wait(self) -> float:
+        """估算新任务的排队时间（秒）"""
+        if self._active < self.concurrency and self._waiting == 0:
+            return 0.0
+        return (self._waiting + 1) / self.concurrency * self.service_time
+
+    def _update(self, attr: str, value: float):
+        setattr(self, attr, (1 - self.EWMA_ALPHA) * getattr(self, attr) + self.EWMA_ALPHA * value)
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """在准入控制下执行 fn(*args)"""
+        wait = self.estimated_wait()
+        remaining = remaining_time()
+        if wait > self.latency_budget or (remaining is not None and wait > remaining):
+            self.rejected += 1
+            self._rejected_counter.inc()
+            raise OverloadedError(retry_after=wait)
+
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        self._waiting_gauge.inc()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+            self._waiting_gauge.dec()
+
+        self._active += 1
+        self._active_gauge.inc()
+        started_at = time.perf_counter()
+        self._update("queue_delay", started_at - queued_at)
+        self._queue_delay_histogram.observe(started_at - queued_at)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._update("service_time", time.perf_counter() - started_at)
+            self._active -= 1
+            self._active_gauge.dec()
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        """当前状态，便于监控"""
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "rejected": self.rejected,
+            "service_time_ms": round(self.service_time * 1000, 2),
+            "queue_delay_ms": round(self.queue_delay * 1000, 2),
+        }
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 import os
 
 class Settings(BaseSettings):
@@ -8,9 +8,57 @@ class Settings(BaseSettings):
     app_version: str = "1.0.0"
     debug: bool = True
     
+    # 请求截止时间（秒），剩余预算会传递给MongoDB操作，0表示不限制
+    request_timeout_seconds: float = 10.0
+    route_timeouts: Dict[str, float] = {
+        "/api/v1/auth/login": 5.0,
+        "/api/v1/auth/register": 5.0,
+        "/api/v1/auth/verification-code": 3.0,
+        "/api/v1/users/avatar": 30.0,
+        "/api/v1/admin/users/import": 600.0,
+        "/api/v1/admin/export": 0,  # 流式导出不设截止时间，客户端断开时停止
+    }
+    
+    # 监控配置
+    metrics_enabled: bool = True
+    
+    # 采样剖析（可通过管理接口在运行中的worker上开启/关闭）
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.01  # 被剖析的请求比例
+    profiling_interval_ms: float = 5.0  # 栈采样间隔
+    profiling_header: str = "x-profile"  # 请求头值与 profiling_token 一致时必定剖析
+    profiling_token: str = ""  # 为空时不接受请求头触发
+    profiling_output_dir: str = "profiles"
+    
+    # 链路追踪（W3C traceparent）
+    tracing_enabled: bool = False
+    tracing_sample_ratio: float = 0.01  # 上游没有采样决定时的采样比例
+    tracing_max_traces_per_second: float = 50  # 每个进程每秒最多采样的链路数，限制高负载下的开销
+    tracing_exporter: str = "file"  # file: 写入JSON Lines文件, console: 输出到标准错误
+    tracing_file: str = "traces.jsonl"
+    tracing_service_name: str = "user-auth-system"
+    
+    # 存储后端：mongo 为生产环境；memory 为进程内存储，用于无MongoDB环境下的基准测试和调试
+    storage_backend: str = "mongo"
+    
     # MongoDB配置
     mongodb_url: str = "mongodb://localhost:27017"
     mongodb_database: str = "user_auth_system"
+    mongodb_max_pool_size: int = 100  # 每个服务器的连接数上限，按 worker数 × 并发请求 估算
+    mongodb_min_pool_size: int = 0
+    mongodb_wait_queue_timeout_ms: int = 2000  # 连接池耗尽时等待连接的最长时间
+    mongodb_server_selection_timeout_ms: int = 5000
+    mongodb_connect_timeout_ms: int = 5000
+    mongodb_socket_timeout_ms: Optional[int] = None  # None表示不限制
+    mongodb_compressors: str = ""  # 逗号分隔，如 "zstd,snappy,zlib"
+    mongodb_read_preference: str = "primary"  # primary, primaryPreferred, secondary, secondaryPreferred, nearest
+    # 容忍复制延迟的读（资料、VIP信息、批量查询）使用的读偏好，单节点部署时自动回落到主库
+    mongodb_tolerant_read_preference: str = "secondaryPreferred"
+    mongodb_max_staleness_seconds: int = -1  # -1表示不限制，否则至少为90
+    mongodb_primary_pin_seconds: int = 10  # 用户数据写入后该时间内的读取固定走主库
+    mongodb_primary_pin_backend: str = "memory"  # memory: 只对同一worker生效, redis: 多worker共享最近写入记录
+    mongodb_slow_query_ms: int = 100  # 超过该耗时的命令记录为慢查询
+    mongodb_explain_sample_rate: float = 0.0  # 慢查询抓取执行计划的采样比例，每种查询形状最多一次
     
     # JWT配置
     secret_key: str = "your-secret-key-here-change-in-production"
@@ -35,9 +83,74 @@ class Settings(BaseSettings):
     # Redis配置
     redis_url: str = "redis://localhost:6379"
     
+    # 验证码配置
+    verification_code_backend: str = "memory"  # memory: 单进程部署, redis: 多worker部署
+    verification_code_expire_seconds: int = 300
+    verification_code_max_attempts: int = 5
+    
+    # 限流配置（令牌桶：period秒内最多limit次）
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "memory"  # memory: 单进程部署, redis: 多worker共享
+    trust_forwarded_for: bool = False  # 部署在反向代理后时从X-Forwarded-For取客户端IP
+    login_rate_limit: int = 10  # 每个用户名/手机号/邮箱
+    login_ip_rate_limit: int = 50  # 每个IP
+    login_rate_period: int = 60
+    verification_code_rate_limit: int = 3
+    verification_code_ip_rate_limit: int = 20
+    verification_code_rate_period: int = 300
+    
+    # 幂等键配置（注册/登录接口的 Idempotency-Key）
+    idempotency_backend: str = "memory"  # memory: 单进程部署, redis: 多worker共享
+    idempotency_ttl_seconds: int = 120
+    idempotency_wait_timeout_seconds: int = 10
+    
+    # 密码哈希策略
+    password_hash_scheme: str = "bcrypt"  # bcrypt, argon2；旧方案的哈希在登录成功后自动迁移
+    bcrypt_rounds: int = 12
+    password_hash_target_ms: int = 0  # >0时启动时按本机性能校准bcrypt cost，使单次验证接近该耗时
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536  # KiB
+    argon2_parallelism: int = 2
+    
+    # 密码哈希准入控制
+    password_hash_concurrency: int = 0  # 0表示使用CPU核数
+    password_hash_latency_budget_ms: int = 1000  # 预计排队超过该时间直接返回503
+    
+    # VIP过期清理（后台定时任务）
+    vip_sweep_enabled: bool = True
+    vip_sweep_interval_seconds: int = 60
+    vip_sweep_batch_size: int = 1000
+    
+    # 运营统计：事件在进程内累加，定期合并写入 analytics_rollups
+    analytics_enabled: bool = True
+    analytics_flush_interval_seconds: int = 10
+    analytics_hourly_retention_days: int = 14
+    
+    # 批量导入用户
+    import_chunk_size: int = 1000
+    import_hash_workers: int = 2  # 管理后台导入时计算密码哈希的进程数；import_users.py 默认使用全部CPU核
+    
+    # 数据导出
+    export_batch_size: int = 1000
+    
+    # 数据维护（maintain_db.py）：按 _id 区间分批清理过期验证码和失效会话
+    maintenance_batch_size: int = 1000  # 每批扫描的 _id 数
+    maintenance_batches_per_second: float = 5.0  # 0表示不限速
+    session_retention_days: int = 30  # 已登出或已过期的会话保留天数
+    
     # 文件上传配置
     upload_dir: str = "uploads"
     max_file_size: int = 5 * 1024 * 1024  # 5MB
+    uploads_cache_max_bytes: int = 32 * 1024 * 1024  # /uploads 小文件内存缓存容量，0表示关闭
+    uploads_cache_max_file_size: int = 256 * 1024
+    
+    # 头像处理
+    avatar_sizes: List[int] = [256, 128, 64]  # 第一个为默认尺寸
+    avatar_max_pixels: int = 25_000_000  # 解码前检查像素数，防止解压炸弹
+    avatar_webp_quality: int = 80
+    avatar_jpeg_quality: int = 85
+    image_processing_concurrency: int = 0  # 0表示使用CPU核数
+    image_processing_latency_budget_ms: int = 5000
     
     class Config:
         env_file = ".env"
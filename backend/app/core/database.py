@@ -1,18 +1,183 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Iterable
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from redis.exceptions import RedisError
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 from .config import settings
+from .metrics import MongoMetricsListener
+from .db_monitor import CommandMonitor, PoolMonitor
+from .tracing import TracingCommandListener
+from .redis_client import get_redis
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("app.db")
 
 class Database:
     client: AsyncIOMotorClient = None
     database = None
+    tolerant_database = None
+    pool_monitor: PoolMonitor = None
+    # ensure_indexes 因重复数据未能建立的唯一索引: {集合: [索引名]}
+    failed_indexes: dict = {}
 
 db = Database()
 
+_READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# 当前请求是否已写入数据，写入后的读取固定走主库
+_pinned_to_primary: ContextVar[bool] = ContextVar("pinned_to_primary", default=False)
+
+# 最近写入过的用户及写入时间（进程内），用于跨请求的读己之写；
+# 只对同一worker处理的请求生效，多worker部署时用 mongodb_primary_pin_backend=redis 共享
+_recent_writes = {}
+PIN_KEY_PREFIX = "ryw:"
+
+def client_options() -> dict:
+    """根据配置生成连接池和超时参数"""
+    options = {
+        "maxPoolSize": settings.mongodb_max_pool_size,
+        "minPoolSize": settings.mongodb_min_pool_size,
+        "waitQueueTimeoutMS": settings.mongodb_wait_queue_timeout_ms,
+        "serverSelectionTimeoutMS": settings.mongodb_server_selection_timeout_ms,
+        "connectTimeoutMS": settings.mongodb_connect_timeout_ms,
+        "socketTimeoutMS": settings.mongodb_socket_timeout_ms,
+        "readPreference": settings.mongodb_read_preference,
+    }
+    if settings.mongodb_compressors:
+        options["compressors"] = settings.mongodb_compressors
+    return options
+
+def tolerant_read_preference():
+    """容忍复制延迟的读偏好"""
+    mode = _READ_PREFERENCES[settings.mongodb_tolerant_read_preference]
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=settings.mongodb_max_staleness_seconds)
+
 async def connect_to_mongo():
     """连接到MongoDB数据库"""
-    db.client = AsyncIOMotorClient(settings.mongodb_url)
+    command_monitor = CommandMonitor()
+    db.pool_monitor = PoolMonitor()
+    event_listeners = [MongoMetricsListener(), command_monitor, db.pool_monitor]
+    if settings.tracing_enabled:
+        event_listeners.append(TracingCommandListener())
+    db.client = AsyncIOMotorClient(
+        settings.mongodb_url,
+        event_listeners=event_listeners,
+        **client_options()
+    )
+    command_monitor.client = db.client.delegate
     db.database = db.client[settings.mongodb_database]
+    db.tolerant_database = db.client.get_database(
+        settings.mongodb_database, read_preference=tolerant_read_preference()
+    )
     print(f"✅ 已连接到MongoDB数据库: {settings.mongodb_database}")
 
+# 各集合需要的索引，启动时创建（已存在时为空操作）
+INDEXES = {
+    "users": [
+        # 只包含VIP用户的部分索引，过期清理按到期时间做范围扫描，索引大小与VIP人数而非总用户数相关
+        IndexModel(
+            [("vip_expire_time", ASCENDING), ("_id", ASCENDING)],
+            name="vip_expire_time_1__id_1",
+            partialFilterExpression={"is_vip": True}
+        ),
+        # 登录标识唯一，只约束有值的文档；批量导入依赖它在插入时识别重复用户
+        *[
+            IndexModel(
+                [(field, ASCENDING)],
+                name=f"{field}_1",
+                unique=True,
+                partialFilterExpression={field: {"$type": "string"}}
+            )
+            for field in ("username", "email", "phone", "wechat_openid")
+        ],
+        # 管理后台按注册时间倒序的键集分页
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_-1__id_-1"),
+        # 小写冗余字段上的前缀搜索，结果按 (字段值, _id) 翻页
+        *[
+            IndexModel([(f"search.{field}", ASCENDING), ("_id", ASCENDING)], name=f"search.{field}_1__id_1")
+            for field in ("username", "nickname", "email", "phone")
+        ],
+    ],
+    "vipsubscriptions": [
+        # 购买按 transaction_id 幂等，重复提交在写入时被唯一索引拒绝
+        IndexModel(
+            [("transaction_id", ASCENDING)],
+            name="transaction_id_1",
+            unique=True,
+            partialFilterExpression={"transaction_id": {"$type": "string"}}
+        ),
+        # 订阅历史按 (created_at, _id) 倒序翻页
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_id_1_created_at_-1__id_-1"
+        ),
+    ],
+    "user_sessions": [
+        # 按用户导出会话
+        IndexModel([("user_id", ASCENDING)], name="user_id_1"),
+    ],
+    "analytics_rollups": [
+        # 小时级统计桶按 expire_at 自动过期，天/月级桶长期保留
+        IndexModel([("expire_at", ASCENDING)], name="expire_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# 建唯一索引时已有重复值的错误码
+DUPLICATE_KEY = 11000
+
+async def duplicate_values(collection: str, index: IndexModel, limit: int = 10) -> list:
+    """唯一索引键上重复的值及出现次数，用于排查无法建立唯一索引的原因"""
+    spec = index.document
+    fields = list(spec["key"].keys())
+    pipeline = [
+        {"$match": spec.get("partialFilterExpression", {})},
+        {"$group": {"_id": {field.replace(".", "_"): f"${field}" for field in fields}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": limit},
+    ]
+    return await db.database[collection].aggregate(pipeline, allowDiskUse=True).to_list(limit)
+
+async def ensure_indexes() -> list:
+    """创建 INDEXES 中定义的索引，返回因已有重复数据而未能建立的唯一索引名
+
+    逐个创建，一个唯一索引失败不影响其他索引和应用启动；重复的值会写入日志，清理后重新执行即可。
+    """
+    failed = []
+    db.failed_indexes = {}
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                await db.database[collection].create_indexes([index])
+            except OperationFailure as e:
+                if e.code != DUPLICATE_KEY:
+                    raise
+                name = index.document["name"]
+                failed.append(name)
+                db.failed_indexes.setdefault(collection, []).append(name)
+                logger.error("无法建立唯一索引 %s.%s，存在重复数据: %s",
+                             collection, name, await duplicate_values(collection, index))
+    if failed:
+        print(f"⚠️  以下唯一索引因重复数据未建立: {', '.join(failed)}")
+    print(f"✅ 已确认索引: {', '.join(INDEXES)}")
+    return failed
+
+def failed_unique_indexes(collection: str) -> list:
+    """collection 上因重复数据未能建立的唯一索引"""
+    return db.failed_indexes.get(collection, [])
+
 async def close_mongo_connection():
     """关闭MongoDB连接"""
     if db.client:
@@ -21,4 +186,83 @@ async def close_mongo_connection():
 
 def get_database():
     """获取数据库实例"""
-    return db.database 
\ No newline at end of file
+    return db.database
+
+def get_read_database(user_id: str = None):
+    """获取容忍复制延迟的读库（从库优先）
+
+    当前请求已有写入，或 user_id 在 mongodb_primary_pin_seconds 内被写入过时返回主库，
+    保证读到自己刚写入的数据。
+    """
+    if _pinned_to_primary.get():
+        return db.database
+    if user_id is not None:
+        written_at = _recent_writes.get(user_id)
+        if written_at is not None and time.monotonic() - written_at < settings.mongodb_primary_pin_seconds:
+            return db.database
+    return db.tolerant_database
+
+def pin_to_primary(user_id: str = None):
+    """标记当前请求（及该用户的后续请求）读取走主库"""
+    _pinned_to_primary.set(True)
+    if user_id is not None:
+        now = time.monotonic()
+        if len(_recent_writes) > 10000:
+            for key in [k for k, v in _recent_writes.items() if now - v >= settings.mongodb_primary_pin_seconds]:
+                del _recent_writes[key]
+        _recent_writes[user_id] = now
+
+async def record_writes(user_ids: Iterable[str]):
+    """写入用户数据后调用：当前请求及这些用户在 mongodb_primary_pin_seconds 内的后续请求读主库
+
+    mongodb_primary_pin_backend=redis 时写入记录同时保存到Redis，其他worker也能看到；
+    Redis不可用时只保留进程内记录。
+    """
+    user_ids = list(user_ids)
+    for user_id in user_ids:
+        pin_to_primary(user_id)
+    if not user_ids or settings.mongodb_primary_pin_backend != "redis":
+        return
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.set(f"{PIN_KEY_PREFIX}{user_id}", 1, ex=settings.mongodb_primary_pin_seconds)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning("记录最近写入失败，其他worker可能读到从库的旧数据: %s", e)
+
+async def record_write(user_id: str):
+    await record_writes([user_id])
+
+async def get_user_read_database(user_id: str):
+    """读取某个用户的数据时使用的读库
+
+    在 get_read_database 的基础上，mongodb_primary_pin_backend=redis 时还检查其他worker记录的最近写入；
+    无法确认时读主库。
+    """
+    database = get_read_database(user_id)
+    if database is db.database or settings.mongodb_primary_pin_backend != "redis":
+        return database
+    try:
+        if await get_redis().exists(f"{PIN_KEY_PREFIX}{user_id}"):
+            return db.database
+    except RedisError:
+        return db.database
+    return database
+
+@asynccontextmanager
+async def causal_session():
+    """因果一致性会话：会话内先写后读，即使读落在从库也能读到之前的写入"""
+    async with await db.client.start_session(causal_consistency=True) as session:
+        yield session
+
+async def check_database() -> dict:
+    """检查数据库是否可用，返回延迟和连接池状态；不可用时抛出异常"""
+    if db.client is None:
+        raise RuntimeError("数据库未连接")
+    started = asyncio.get_running_loop().time()
+    await db.client.admin.command("ping")
+    return {
+        "ping_ms": round((asyncio.get_running_loop().time() - started) * 1000, 2),
+        "pool": db.pool_monitor.stats(),
+    } 
\ No newline at end of file
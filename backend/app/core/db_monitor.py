@@ -0,0 +1,275 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Optional
+import json
+import logging
+import random
+import threading
+import time
+from pymongo import monitoring
+from .config import settings
+from .metrics import MONGO_POOL_CHECKOUT_WAIT, MONGO_POOL_IN_USE
+
+logger = logging.getLogger("app.db")
+
+# 需要分析执行计划的命令及其查询条件所在字段
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+# 发给服务器的内部字段，既不属于查询形状，也不能出现在explain中
+_INTERNAL_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+
+
+class RequestDBStats:
+    """单个请求内的数据库访问统计"""
+
+    __slots__ = ("count", "total_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+
+_request_stats: ContextVar[Optional[RequestDBStats]] = ContextVar("request_db_stats", default=None)
+
+def current_db_stats() -> Optional[RequestDBStats]:
+    """当前请求的数据库统计，不在请求上下文中时返回None"""
+    return _request_stats.get()
+
+
+def redact(value):
+    """把查询中的具体值替换为 ?，只保留字段名和操作符"""
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # 标量数组（如$in）折叠为一个元素，使不同长度的参数得到同一形状
+        if all(not isinstance(v, (dict, list, tuple)) for v in value):
+            return ["?"] if value else []
+        return [redact(v) for v in value]
+    return "?"
+
+def command_shape(command_name: str, command: dict) -> dict:
+    """提取命令中决定执行计划的部分并脱敏"""
+    shape = {}
+    for key, value in command.items():
+        if key == command_name or key.startswith("$") or key in _INTERNAL_FIELDS:
+            continue
+        if key in ("documents", "cursor"):
+            continue
+        if key in ("updates", "deletes"):
+            value = [{k: v for k, v in item.items() if k in ("q", "u", "multi", "limit")} for item in value]
+        shape[key] = redact(value)
+    return shape
+
+def documents_returned(reply: dict) -> int:
+    """从响应中估算返回/影响的文档数"""
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if "values" in reply:
+        return len(reply["values"])
+    return int(reply.get("n", 0))
+
+def summarize_plan(plan: dict) -> str:
+    """把执行计划压缩为阶段链，如 FETCH <- IXSCAN(username_1)"""
+    stages = []
+    while isinstance(plan, dict):
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages)
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """MongoDB命令监控
+
+    记录每条命令的耗时、集合、脱敏后的查询形状和返回文档数，
+    超过 mongodb_slow_query_ms 的命令记为慢查询，并累计到当前请求的统计中。
+    开启 mongodb_explain_sample_rate 时按比例对慢查询形状抓取一次执行计划。
+    """
+
+    MAX_EXPLAINED_SHAPES = 1000
+
+    def __init__(self):
+        self.client = None  # 同步MongoClient，用于执行explain
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._explained = set()
+        self._explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mongo-explain")
+
+    @staticmethod
+    def _key(event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        if event.command_name == "explain":
+            return
+        with self._lock:
+            self._pending[self._key(event)] = (event.database_name, event.command)
+
+    def _finish(self, event, reply: Optional[dict]):
+        with self._lock:
+            pending = self._pending.pop(self._key(event), None)
+        if pending is None:
+            return
+        database_name, command = pending
+        duration_ms = event.duration_micros / 1000
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.total_ms += duration_ms
+
+        if duration_ms < settings.mongodb_slow_query_ms:
+            return
+
+        collection = command.get(event.command_name)
+        shape = json.dumps(command_shape(event.command_name, command), sort_keys=True, default=str)
+        logger.warning(
+            "慢查询 %.1fms %s.%s %s shape=%s docs=%s",
+            duration_ms, database_name, collection, event.command_name, shape,
+            documents_returned(reply) if reply is not None else "failed"
+        )
+        self._maybe_explain(database_name, event.command_name, collection, shape, command)
+
+    def succeeded(self, event):
+        self._finish(event, event.reply)
+
+    def failed(self, event):
+        self._finish(event, None)
+
+    def _maybe_explain(self, database_name, command_name, collection, shape, command):
+        if (self.client is None or command_name not in EXPLAINABLE_COMMANDS
+                or random.random() >= settings.mongodb_explain_sample_rate):
+            return
+        shape_key = (collection, command_name, shape)
+        with self._lock:
+            if shape_key in self._explained or len(self._explained) >= self.MAX_EXPLAINED_SHAPES:
+                return
+            self._explained.add(shape_key)
+        # 在独立线程中执行，不拖慢被监控的命令
+        self._explain_executor.submit(self._explain, database_name, command, shape)
+
+    def _explain(self, database_name, command, shape):
+        explain_target = {
+            k: v for k, v in command.items()
+            if not k.startswith("$") and k not in _INTERNAL_FIELDS
+        }
+        try:
+            result = self.client[database_name].command(
+                {"explain": explain_target, "verbosity": "queryPlanner"}
+            )
+        except Exception as e:
+            logger.warning("慢查询explain失败 shape=%s: %s", shape, e)
+            return
+        winning_plan = result.get("queryPlanner", {}).get("winningPlan", {})
+        logger.warning("慢查询执行计划 shape=%s plan=%s", shape, summarize_plan(winning_plan))
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """连接池监控：记录正在使用的连接数、等待连接的耗时和获取失败次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.in_use = 0
+        self.open_connections = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_check_out_started(self, event):
+        # 同一线程中 started 与 checked_out/failed 成对出现
+        self._local.started_at = time.perf_counter()
+
+    def _waited(self) -> float:
+        started_at = getattr(self._local, "started_at", None)
+        return time.perf_counter() - started_at if started_at is not None else 0.0
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_WAIT.labels("failed").observe(self._waited())
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        waited = self._waited()
+        MONGO_POOL_CHECKOUT_WAIT.labels("success").observe(waited)
+        MONGO_POOL_IN_USE.inc()
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_IN_USE.dec()
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self) -> dict:
+        """连接池状态快照"""
+        with self._lock:
+            return {
+                "in_use": self.in_use,
+                "open_connections": self.open_connections,
+                "max_pool_size": settings.mongodb_max_pool_size,
+                "utilization": round(self.in_use / settings.mongodb_max_pool_size, 3),
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_checkout_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_checkout_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+
+class DBTimingMiddleware:
+    """统计每个请求的数据库访问次数和耗时，通过 Server-Timing 响应头返回"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestDBStats()
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries"'.encode("latin-1")
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
@@ -0,0 +1,104 @@
+from contextvars import ContextVar
+from typing import Dict, Optional
+import asyncio
+import time
+import pymongo
+from starlette.responses import JSONResponse
+
+# 当前请求的截止时间（time.monotonic()），不在请求上下文中时为None
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+def remaining_time() -> Optional[float]:
+    """当前请求剩余的时间预算（秒），没有截止时间时返回None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+def max_time_ms(default: Optional[int] = None) -> Optional[int]:
+    """剩余预算换算为maxTimeMS，供需要显式传参的调用使用"""
+    remaining = remaining_time()
+    if remaining is None:
+        return default
+    return max(1, int(remaining * 1000))
+
+
+class DeadlineMiddleware:
+    """请求截止时间中间件
+
+    按路径为每个请求设置时间预算，并通过 pymongo.timeout（CSOT）传递给请求内的所有MongoDB操作，
+    驱动会根据剩余时间自动设置 maxTimeMS 和网络超时。
+    预算耗尽时取消处理并返回504；客户端断开连接时立即取消处理，不再继续消耗资源。
+    """
+
+    def __init__(self, app, default_timeout: float, route_timeouts: Dict[str, float] = None):
+        self.app = app
+        self.default_timeout = default_timeout
+        self.route_timeouts = route_timeouts or {}
+
+    def _timeout_for(self, path: str) -> float:
+        return self.route_timeouts.get(path, self.default_timeout)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timeout = self._timeout_for(scope["path"])
+        if timeout <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+        disconnected = False
+        # 容量为1的队列：读取请求体时保持背压，请求体读完后继续等待断开事件
+        messages: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        async def app_receive():
+            if disconnected:
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        token = _deadline.set(time.monotonic() + timeout)
+        try:
+            with pymongo.timeout(timeout):
+                handler = asyncio.ensure_future(self.app(scope, app_receive, send_wrapper))
+        finally:
+            _deadline.reset(token)
+
+        async def pump():
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected = True
+                    handler.cancel()
+                    return
+                await messages.put(message)
+
+        pump_task = asyncio.ensure_future(pump())
+        try:
+            done, _ = await asyncio.wait({handler}, timeout=timeout)
+            if handler in done:
+                if not handler.cancelled():
+                    handler.result()
+                return
+
+            handler.cancel()
+            try:
+                await handler
+            except asyncio.CancelledError:
+                pass
+            if not response_started and not disconnected:
+                response = JSONResponse({"detail": "请求处理超时"}, status_code=504)
+                await response(scope, receive, send)
+        finally:
+            pump_task.cancel()
+            if not handler.done():
+                handler.cancel()
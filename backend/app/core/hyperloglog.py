@@ -0,0 +1,39 @@
+from typing import Dict, Iterable, Tuple
+import hashlib
+import math
+
+# 2^10 = 1024 个寄存器，标准误差约 1.04 / sqrt(1024) ≈ 3.3%
+# 寄存器在不同时间段、不同worker之间按最大值合并，精度一旦确定不能再修改
+HLL_PRECISION = 10
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+_HASH_BITS = 64
+_RANK_BITS = _HASH_BITS - HLL_PRECISION
+_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+
+
+def hll_register(value: str) -> Tuple[int, int]:
+    """返回 value 落入的寄存器编号和该寄存器的候选值（剩余位中前导零个数 + 1）"""
+    hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+    index = hashed >> _RANK_BITS
+    remainder = hashed & ((1 << _RANK_BITS) - 1)
+    return index, _RANK_BITS - remainder.bit_length() + 1
+
+def hll_merge(sketches: Iterable[Dict[str, int]]) -> Dict[str, int]:
+    """逐个寄存器取最大值，得到并集的草图"""
+    merged: Dict[str, int] = {}
+    for sketch in sketches:
+        for index, rank in sketch.items():
+            if rank > merged.get(index, 0):
+                merged[index] = rank
+    return merged
+
+def hll_estimate(sketch: Dict[str, int]) -> int:
+    """估算基数；草图只保存非零寄存器，键为寄存器编号的字符串"""
+    zeros = HLL_REGISTERS - len(sketch)
+    harmonic = zeros + sum(2.0 ** -rank for rank in sketch.values())
+    estimate = _ALPHA * HLL_REGISTERS * HLL_REGISTERS / harmonic
+    # 基数较小时空寄存器较多，改用线性计数
+    if estimate <= 2.5 * HLL_REGISTERS and zeros:
+        estimate = HLL_REGISTERS * math.log(HLL_REGISTERS / zeros)
+    return int(round(estimate))
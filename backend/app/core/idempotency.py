@@ -0,0 +1,280 @@
+from typing import Callable, Dict, Iterable, Optional
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from .config import settings
+from .metrics import record_cache
+from .rate_limit import get_client_ip
+from .security import verify_token
+
+class IdempotencyStore:
+    """幂等记录存储接口
+
+    每个键要么处于处理中（只记录请求指纹），要么已完成（记录完整响应）。
+    """
+
+    async def acquire(self, key: str, fingerprint: str, ttl: int) -> bool:
+        """尝试占用键；成功表示当前请求负责执行"""
+        raise NotImplementedError
+
+    async def get(self, key: str) -> Optional[dict]:
+        """返回 {"fingerprint", "response"}，处理中时 response 为 None"""
+        raise NotImplementedError
+
+    async def wait(self, key: str, timeout: float) -> Optional[dict]:
+        """等待处理中的请求完成，返回记录；键被释放或超时返回None"""
+        raise NotImplementedError
+
+    async def complete(self, key: str, fingerprint: str, response: dict, ttl: int) -> None:
+        """保存响应供后续重复请求重放"""
+        raise NotImplementedError
+
+    async def release(self, key: str) -> None:
+        """执行失败时释放键，允许客户端重试"""
+        raise NotImplementedError
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """进程内存储，处理中的请求用Future通知等待者"""
+
+    # 每写入多少次顺带清理一次过期数据
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._entries: Dict[str, dict] = {}
+        self._writes = 0
+
+    def _alive(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry and entry["expires_at"] <= self._clock():
+            del self._entries[key]
+            return None
+        return entry
+
+    def _purge(self):
+        now = self._clock()
+        for key in [k for k, v in self._entries.items() if v["expires_at"] <= now]:
+            del self._entries[key]
+
+    async def acquire(self, key: str, fingerprint: str, ttl: int) -> bool:
+        if self._alive(key):
+            return False
+        self._writes += 1
+        if self._writes % self.PURGE_INTERVAL == 0:
+            self._purge()
+        self._entries[key] = {
+            "fingerprint": fingerprint,
+            "response": None,
+            "done": asyncio.get_running_loop().create_future(),
+            "expires_at": self._clock() + ttl,
+        }
+        return True
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._alive(key)
+        if entry is None:
+            return None
+        return {"fingerprint": entry["fingerprint"], "response": entry["response"]}
+
+    async def wait(self, key: str, timeout: float) -> Optional[dict]:
+        entry = self._alive(key)
+        if entry is None:
+            return None
+        if entry["response"] is None:
+            try:
+                await asyncio.wait_for(asyncio.shield(entry["done"]), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return await self.get(key)
+
+    async def complete(self, key: str, fingerprint: str, response: dict, ttl: int) -> None:
+        entry = self._entries.get(key)
+        self._entries[key] = {
+            "fingerprint": fingerprint,
+            "response": response,
+            "done": entry["done"] if entry else None,
+            "expires_at": self._clock() + ttl,
+        }
+        if entry and entry["done"] and not entry["done"].done():
+            entry["done"].set_result(True)
+
+    async def release(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry and entry["done"] and not entry["done"].done():
+            entry["done"].set_result(False)
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """Redis存储，多worker之间共享；等待处理中的请求时轮询"""
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, client=None, prefix: str = "idem:"):
+        if client is None:
+            from .redis_client import get_redis
+            client = get_redis()
+        self._redis = client
+        self._prefix = prefix
+
+    async def acquire(self, key: str, fingerprint: str, ttl: int) -> bool:
+        record = json.dumps({"fingerprint": fingerprint, "response": None})
+        return bool(await self._redis.set(self._prefix + key, record, nx=True, ex=ttl))
+
+    async def get(self, key: str) -> Optional[dict]:
+        record = await self._redis.get(self._prefix + key)
+        return json.loads(record) if record else None
+
+    async def wait(self, key: str, timeout: float) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        while True:
+            record = await self.get(key)
+            if record is None or record["response"] is not None:
+                return record
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def complete(self, key: str, fingerprint: str, response: dict, ttl: int) -> None:
+        record = json.dumps({"fingerprint": fingerprint, "response": response})
+        await self._redis.set(self._prefix + key, record, ex=ttl)
+
+    async def release(self, key: str) -> None:
+        await self._redis.delete(self._prefix + key)
+
+
+_store: Optional[IdempotencyStore] = None
+
+def get_idempotency_store() -> IdempotencyStore:
+    """根据配置获取幂等记录存储"""
+    global _store
+    if _store is None:
+        if settings.idempotency_backend == "redis":
+            _store = RedisIdempotencyStore()
+        elif settings.idempotency_backend == "memory":
+            _store = MemoryIdempotencyStore()
+        else:
+            raise ValueError(f"不支持的幂等存储: {settings.idempotency_backend}")
+    return _store
+
+
+class IdempotencyMiddleware:
+    """Idempotency-Key 中间件
+
+    对指定的POST接口，携带相同 Idempotency-Key 和相同请求体的重复请求直接重放第一次的响应；
+    并发的重复请求等待第一次执行完成，不会重复执行密码校验或写库。
+    只记录2xx响应：限流、校验失败等错误响应和异常都会释放键，客户端用同一个键重试时重新执行。
+    键按客户端隔离（已登录用户按用户ID，否则按IP），其他客户端用相同的键取不到记录的响应（含令牌）。
+    """
+
+    HEADER = b"idempotency-key"
+    MAX_KEY_LENGTH = 255
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = dict(scope["headers"]).get(self.HEADER)
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+        if len(idempotency_key) > self.MAX_KEY_LENGTH:
+            await JSONResponse({"detail": "Idempotency-Key过长"}, status_code=400)(scope, receive, send)
+            return
+
+        # 读取完整请求体用于计算指纹，之后交给下游重放
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        key = f"{scope['path']}:{self._client_scope(scope)}:{idempotency_key.decode('latin-1')}"
+
+        store = get_idempotency_store()
+        deadline = time.monotonic() + settings.idempotency_wait_timeout_seconds
+        while not await store.acquire(key, fingerprint, settings.idempotency_ttl_seconds):
+            record = await store.get(key)
+            if record and record["fingerprint"] != fingerprint:
+                await JSONResponse(
+                    {"detail": "Idempotency-Key已用于不同的请求"}, status_code=422
+                )(scope, receive, send)
+                return
+            if record is not None and record["response"] is None:
+                record = await store.wait(key, max(0.0, deadline - time.monotonic()))
+            if record is not None and record["response"] is not None:
+                record_cache("idempotency", hit=True)
+                await self._replay(record["response"], send)
+                return
+            if time.monotonic() >= deadline:
+                await JSONResponse(
+                    {"detail": "相同请求正在处理中，请稍后重试"},
+                    status_code=409,
+                    headers={"Retry-After": "1"}
+                )(scope, receive, send)
+                return
+
+        record_cache("idempotency", hit=False)
+        await self._execute(key, fingerprint, body, scope, receive, send)
+
+    @staticmethod
+    def _client_scope(scope) -> str:
+        request = Request(scope)
+        authorization = request.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            payload = verify_token(authorization[7:])
+            if payload and payload.get("sub"):
+                return f"user:{payload['sub']}"
+        return f"ip:{get_client_ip(request)}"
+
+    async def _execute(self, key, fingerprint, body, scope, receive, send):
+        store = get_idempotency_store()
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response = {"status": 500, "headers": [], "body": ""}
+        chunks = []
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    [k.decode("latin-1"), v.decode("latin-1")] for k, v in message.get("headers", [])
+                ]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await store.release(key)
+            raise
+
+        if not 200 <= response["status"] < 300:
+            await store.release(key)
+            return
+        response["body"] = base64.b64encode(b"".join(chunks)).decode("ascii")
+        await store.complete(key, fingerprint, response, settings.idempotency_ttl_seconds)
+
+    async def _replay(self, response: dict, send):
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in response["headers"]]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": response["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": base64.b64decode(response["body"])})
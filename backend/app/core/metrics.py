@@ -0,0 +1,146 @@
+from contextlib import contextmanager
+import os
+import threading
+import time
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+)
+from prometheus_client import multiprocess
+from pymongo import monitoring
+from starlette.responses import Response
+
+# 覆盖从亚毫秒级的缓存命中到秒级的bcrypt排队
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP请求耗时",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds", "MongoDB命令耗时",
+    ["collection", "command", "outcome"], buckets=LATENCY_BUCKETS
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "密码哈希计算耗时",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+JWT_DURATION = Histogram(
+    "jwt_duration_seconds", "JWT编码/解码耗时",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "缓存查询次数，按命中结果区分",
+    ["cache", "result"]
+)
+MONGO_POOL_IN_USE = Gauge("mongo_pool_in_use", "正在使用的MongoDB连接数", multiprocess_mode="livesum")
+MONGO_POOL_CHECKOUT_WAIT = Histogram(
+    "mongo_pool_checkout_wait_seconds", "从连接池获取连接的等待耗时",
+    ["outcome"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_ACTIVE = Gauge("admission_active", "准入控制中正在执行的任务数", ["name"], multiprocess_mode="livesum")
+ADMISSION_WAITING = Gauge("admission_waiting", "准入控制中排队的任务数", ["name"], multiprocess_mode="livesum")
+ADMISSION_REJECTED = Counter("admission_rejected_total", "准入控制拒绝的任务数", ["name"])
+ADMISSION_QUEUE_DELAY = Histogram(
+    "admission_queue_delay_seconds", "准入控制排队耗时",
+    ["name"], buckets=LATENCY_BUCKETS
+)
+
+VIP_SWEEP_DOWNGRADED = Counter("vip_sweep_downgraded_total", "过期清理降级的VIP用户数")
+VIP_SWEEP_DURATION = Histogram(
+    "vip_sweep_duration_seconds", "一轮VIP过期清理的耗时",
+    buckets=LATENCY_BUCKETS
+)
+
+@contextmanager
+def observe(histogram: Histogram, *labels: str):
+    """记录代码块的耗时"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(*labels).observe(time.perf_counter() - started)
+
+def record_cache(cache: str, hit: bool):
+    """记录一次缓存命中或未命中"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """按集合和命令统计MongoDB耗时"""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "-"
+        with self._lock:
+            self._pending[self._key(event)] = collection
+
+    def _finish(self, event, outcome: str):
+        with self._lock:
+            collection = self._pending.pop(self._key(event), "-")
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name, outcome).observe(
+            event.duration_micros / 1_000_000
+        )
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+class MetricsMiddleware:
+    """按路由模板、方法和状态码记录请求耗时
+
+    使用路由模板（如 /api/v1/users/profile）而不是原始路径作为标签，避免标签基数失控。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                route_label = route.path
+            elif status_code == 404:
+                route_label = "unmatched"
+            else:
+                route_label = "other"
+            HTTP_REQUEST_DURATION.labels(scope["method"], route_label, str(status_code)).observe(
+                time.perf_counter() - started
+            )
+
+
+def metrics_response() -> Response:
+    """生成Prometheus文本格式的指标"""
+    # 多worker部署时设置 PROMETHEUS_MULTIPROC_DIR 汇总所有进程的指标
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,243 @@
+from collections import Counter
+from typing import Dict, Optional
+import os
+import random
+import re
+import sys
+import sysconfig
+import threading
+import time
+from .config import settings
+
+# 路径前缀替换为短名称，使火焰图中的帧名更易读
+_PATH_PREFIXES = sorted(
+    {
+        (sysconfig.get_paths()["purelib"], "site-packages"),
+        (sysconfig.get_paths()["stdlib"], "stdlib"),
+        (os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), ""),
+    },
+    key=lambda item: len(item[0]),
+    reverse=True
+)
+
+def _short_path(filename: str) -> str:
+    for prefix, name in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            rest = filename[len(prefix):].lstrip(os.sep)
+            return f"{name}/{rest}" if name else rest
+    return filename
+
+_frame_names: Dict[object, str] = {}
+
+def _frame_name(code) -> str:
+    """帧名按函数聚合：限定名 (文件:定义行)"""
+    name = _frame_names.get(code)
+    if name is None:
+        name = f"{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        # 折叠栈格式中 ; 是帧分隔符
+        name = _frame_names[code] = name.replace(";", ":")
+    return name
+
+
+class _ProfiledRequest:
+    """一个被剖析的请求：被包裹的协程、所在线程和采到的栈"""
+
+    __slots__ = ("coro", "thread_id", "samples")
+
+    def __init__(self, coro, thread_id: int):
+        self.coro = coro
+        self.thread_id = thread_id
+        self.samples: Counter = Counter()
+
+
+class SamplingProfiler:
+    """按请求归属的墙钟采样剖析器
+
+    后台线程每隔 interval 秒查看一次所有被剖析请求的调用栈：
+    请求的协程正在执行时，从事件循环线程的当前帧（sys._current_frames）向上回溯到该请求的入口帧；
+    协程挂起时，沿 cr_await 链向下得到它正在等待的位置（如数据库响应、线程池中的密码哈希）。
+    两种样本一起反映请求的墙钟时间都花在哪里。
+    结果按路由聚合为折叠栈格式，可直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+    """
+
+    FLUSH_INTERVAL = 10.0
+
+    def __init__(self, output_dir: str, interval: float, sample_rate: float):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.enabled = False
+        self._stop_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._active = set()
+        self._routes: Dict[str, Counter] = {}
+        self._requests: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    def start(self, sample_rate: float = None, duration: float = None):
+        """开始剖析，duration 秒后自动停止"""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        self._stop_at = time.monotonic() + duration if duration else None
+        self.enabled = True
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> list:
+        """停止剖析并写出结果，返回写出的文件"""
+        self.enabled = False
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        return self.flush()
+
+    def should_profile(self, headers) -> bool:
+        if not self.enabled:
+            return False
+        if settings.profiling_token:
+            header = settings.profiling_header.encode("latin-1")
+            for name, value in headers:
+                if name == header:
+                    return value.decode("latin-1") == settings.profiling_token
+        return random.random() < self.sample_rate
+
+    def begin(self, coro) -> _ProfiledRequest:
+        request = _ProfiledRequest(coro, threading.get_ident())
+        with self._lock:
+            self._active.add(request)
+        return request
+
+    def end(self, request: _ProfiledRequest, route: str):
+        with self._lock:
+            self._active.discard(request)
+            if request.samples:
+                self._routes.setdefault(route, Counter()).update(request.samples)
+            self._requests[route] += 1
+
+    def _running_stack(self, frame, entry_frame) -> Optional[tuple]:
+        names = []
+        while frame is not None:
+            names.append(_frame_name(frame.f_code))
+            if frame is entry_frame:
+                return tuple(reversed(names))
+            frame = frame.f_back
+        # 采样期间协程已让出，本次样本丢弃
+        return None
+
+    @staticmethod
+    def _suspended_stack(coro) -> tuple:
+        names = []
+        awaitable = coro
+        while awaitable is not None:
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                names.append(f"[await {type(awaitable).__name__}]")
+                break
+            names.append(_frame_name(frame.f_code))
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+        return tuple(names)
+
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            for request in self._active:
+                coro = request.coro
+                if coro.cr_frame is None:
+                    continue
+                if coro.cr_running:
+                    stack = self._running_stack(frames.get(request.thread_id), coro.cr_frame)
+                else:
+                    stack = self._suspended_stack(coro)
+                if stack:
+                    request.samples[stack] += 1
+                    self.samples += 1
+
+    def _run(self):
+        next_flush = time.monotonic() + self.FLUSH_INTERVAL
+        while self.enabled:
+            time.sleep(self.interval)
+            self._sample()
+            now = time.monotonic()
+            if self._stop_at is not None and now >= self._stop_at:
+                self.enabled = False
+            elif now >= next_flush:
+                self.flush()
+                next_flush = now + self.FLUSH_INTERVAL
+        self.flush()
+
+    @staticmethod
+    def _file_name(route: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_.-]+", "_", route).strip("_") + f".{os.getpid()}.folded"
+
+    def flush(self) -> list:
+        """把各路由的累计样本写为折叠栈文件（每行：帧;帧;帧 次数）"""
+        with self._lock:
+            routes = {route: Counter(samples) for route, samples in self._routes.items()}
+        if not routes:
+            return []
+        os.makedirs(self.output_dir, exist_ok=True)
+        written = []
+        for route, samples in routes.items():
+            path = os.path.join(self.output_dir, self._file_name(route))
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{route};{';'.join(stack)} {count}\n")
+            os.replace(tmp_path, path)
+            written.append(path)
+        return written
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._requests.clear()
+            self.samples = 0
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "pid": os.getpid(),
+                "sample_rate": self.sample_rate,
+                "interval_ms": round(self.interval * 1000, 3),
+                "remaining_seconds": round(max(0.0, self._stop_at - time.monotonic()), 1)
+                if self.enabled and self._stop_at else None,
+                "active_requests": len(self._active),
+                "samples": self.samples,
+                "requests": dict(self._requests),
+                "output_dir": os.path.abspath(self.output_dir),
+            }
+
+
+profiler = SamplingProfiler(
+    output_dir=settings.profiling_output_dir,
+    interval=settings.profiling_interval_ms / 1000,
+    sample_rate=settings.profiling_sample_rate
+)
+
+
+class ProfilerMiddleware:
+    """按比例或按请求头选择请求进行采样剖析
+
+    未开启剖析时每个请求只多一次属性判断；开启后未被选中的请求只多一次随机数判断。
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler = profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_profile(scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        coro = self.app(scope, receive, send)
+        request = self.profiler.begin(coro)
+        try:
+            await coro
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            self.profiler.end(request, f"{scope['method']} {path}")
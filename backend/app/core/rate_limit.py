@@ -0,0 +1,155 @@
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence, Tuple
+import logging
+import math
+import time
+from fastapi import HTTPException, Request, status
+from redis.exceptions import RedisError
+from .config import settings
+
+logger = logging.getLogger("app.rate_limit")
+
+class RateLimitBackend:
+    """限流存储接口"""
+
+    async def hit(self, key: str, limit: int, period: int) -> float:
+        """消耗一个令牌；允许时返回0，否则返回需要等待的秒数"""
+        raise NotImplementedError
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """进程内令牌桶，按LRU淘汰最久未访问的键以限制内存"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, max_keys: int = 100_000):
+        self._clock = clock
+        self._max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def hit(self, key: str, limit: int, period: int) -> float:
+        now = self._clock()
+        rate = limit / period
+        tokens, last = self._buckets.pop(key, (float(limit), now))
+        tokens = min(float(limit), tokens + (now - last) * rate)
+
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self._max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+# 令牌桶：使用Redis服务器时间，保证多个worker看到一致的时钟
+_TOKEN_BUCKET_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = limit / period
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or limit
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(limit, tokens + (now - ts) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(period))
+return tostring(retry_after)
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Redis令牌桶，多个worker共享限流状态"""
+
+    def __init__(self, client=None, prefix: str = "rl:"):
+        if client is None:
+            from .redis_client import get_redis
+            client = get_redis()
+        self._prefix = prefix
+        self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    async def hit(self, key: str, limit: int, period: int) -> float:
+        try:
+            retry_after = await self._script(keys=[self._prefix + key], args=[limit, period])
+        except RedisError as e:
+            # Redis不可用时放行，避免限流故障导致登录整体不可用
+            logger.warning("限流后端不可用，已放行请求: %s", e)
+            return 0.0
+        return float(retry_after)
+
+
+_backend: Optional[RateLimitBackend] = None
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    """根据配置获取限流存储"""
+    global _backend
+    if _backend is None:
+        if settings.rate_limit_backend == "redis":
+            _backend = RedisRateLimitBackend()
+        elif settings.rate_limit_backend == "memory":
+            _backend = MemoryRateLimitBackend()
+        else:
+            raise ValueError(f"不支持的限流存储: {settings.rate_limit_backend}")
+    return _backend
+
+def get_client_ip(request: Request) -> str:
+    """获取客户端IP"""
+    if settings.trust_forwarded_for:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    """限流依赖
+
+    在路由处理函数之前执行，按客户端IP以及请求体中的指定字段（手机号、邮箱、
+    用户名等）分别计数，任意一个键超限即返回429，不会进入密码校验或数据库操作。
+    """
+
+    def __init__(self, scope: str, limit: int, period: int,
+                 fields: Sequence[str] = (), ip_limit: Optional[int] = None):
+        self.scope = scope
+        self.limit = limit
+        self.period = period
+        self.fields = fields
+        self.ip_limit = ip_limit or limit
+
+    async def _identifiers(self, request: Request) -> Sequence[Tuple[str, int]]:
+        keys = [(f"ip:{get_client_ip(request)}", self.ip_limit)]
+        if not self.fields:
+            return keys
+        try:
+            body = await request.json()
+        except ValueError:
+            return keys
+        if not isinstance(body, dict):
+            return keys
+        for field in self.fields:
+            value = body.get(field)
+            if isinstance(value, str) and value.strip():
+                keys.append((f"{field}:{value.strip().lower()}", self.limit))
+        return keys
+
+    async def __call__(self, request: Request):
+        if not settings.rate_limit_enabled:
+            return
+
+        backend = get_rate_limit_backend()
+        for key, limit in await self._identifiers(request):
+            retry_after = await backend.hit(f"{self.scope}:{key}", limit, self.period)
+            if retry_after > 0:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="请求过于频繁，请稍后再试",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
@@ -0,0 +1,20 @@
+import redis.asyncio as aioredis
+from .config import settings
+
+class RedisClient:
+    client: aioredis.Redis = None
+
+redis_client = RedisClient()
+
+def get_redis() -> aioredis.Redis:
+    """获取Redis客户端（首次使用时创建）"""
+    if redis_client.client is None:
+        redis_client.client = aioredis.from_url(settings.redis_url, decode_responses=True)
+    return redis_client.client
+
+async def close_redis_connection():
+    """关闭Redis连接"""
+    if redis_client.client is not None:
+        await redis_client.client.close()
+        redis_client.client = None
+        print("🔌 已关闭Redis连接")
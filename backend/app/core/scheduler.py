@@ -0,0 +1,61 @@
+from typing import Awaitable, Callable, List
+import asyncio
+import logging
+import random
+
+logger = logging.getLogger("app.scheduler")
+
+
+class PeriodicTask:
+    """在事件循环中按固定间隔执行的后台任务，单次失败只记录日志不影响下一次执行"""
+
+    def __init__(self, name: str, interval: float, fn: Callable[[], Awaitable]):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self._task: asyncio.Task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def _run(self):
+        # 随机错开首次执行，多个worker不会同时开始
+        await asyncio.sleep(random.uniform(0, self.interval))
+        while True:
+            try:
+                await self.fn()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("定时任务 %s 执行失败", self.name)
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+class Scheduler:
+    """应用内的定时任务集合，随应用启动和关闭"""
+
+    def __init__(self):
+        self.tasks: List[PeriodicTask] = []
+
+    def add(self, name: str, interval: float, fn: Callable[[], Awaitable]):
+        self.tasks.append(PeriodicTask(name, interval, fn))
+
+    def start(self):
+        for task in self.tasks:
+            task.start()
+
+    async def stop(self):
+        for task in self.tasks:
+            await task.stop()
+
+scheduler = Scheduler()
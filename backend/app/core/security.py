@@ -3,18 +3,90 @@ from typing import Optional, Union
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from .config import settings
+from .admission import AdmissionController
+from .metrics import JWT_DURATION, PASSWORD_HASH_DURATION, observe
+import os
 import secrets
 import string
+import time
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 支持验证的全部哈希方案，非当前方案的哈希会被标记为需要更新
+PASSWORD_SCHEMES = ("bcrypt", "argon2")
+
+def build_pwd_context(scheme: str = None, bcrypt_rounds: int = None) -> CryptContext:
+    """按配置构建密码哈希策略"""
+    scheme = scheme or settings.password_hash_scheme
+    if scheme not in PASSWORD_SCHEMES:
+        raise ValueError(f"不支持的密码哈希方案: {scheme}")
+    bcrypt_rounds = bcrypt_rounds or settings.bcrypt_rounds
+    return CryptContext(
+        schemes=[scheme] + [s for s in PASSWORD_SCHEMES if s != scheme],
+        deprecated="auto",
+        # min_rounds 与 rounds 相同，cost 调高后旧哈希会在登录时被重新计算
+        bcrypt__rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        argon2__time_cost=settings.argon2_time_cost,
+        argon2__memory_cost=settings.argon2_memory_cost,
+        argon2__parallelism=settings.argon2_parallelism,
+    )
+
+pwd_context = build_pwd_context()
+
+def calibrate_bcrypt_rounds(target_ms: int, min_rounds: int = 10, max_rounds: int = 16) -> int:
+    """选择验证耗时不超过 target_ms 的最大bcrypt cost
+
+    cost 每加1耗时翻倍，只需测量 min_rounds 的耗时即可推算。
+    """
+    hasher = CryptContext(schemes=["bcrypt"], bcrypt__rounds=min_rounds)
+    hashed = hasher.hash("calibration")
+    samples = []
+    for _ in range(3):
+        started = time.perf_counter()
+        hasher.verify("calibration", hashed)
+        samples.append(time.perf_counter() - started)
+    base_ms = sorted(samples)[1] * 1000
+
+    rounds = min_rounds
+    while rounds < max_rounds and base_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    return rounds
+
+def configure_password_hashing():
+    """应用启动时确定哈希策略，需要时根据本机性能校准bcrypt cost"""
+    rounds = settings.bcrypt_rounds
+    if settings.password_hash_target_ms > 0:
+        rounds = calibrate_bcrypt_rounds(settings.password_hash_target_ms)
+    pwd_context.load(build_pwd_context(bcrypt_rounds=rounds))
+    print(f"🔐 密码哈希方案: {settings.password_hash_scheme}, bcrypt cost: {rounds}")
+
+# 限制同时进行的密码哈希运算，并在线程池中执行以免阻塞事件循环
+password_admission = AdmissionController(
+    "password-hash",
+    concurrency=settings.password_hash_concurrency or os.cpu_count() or 1,
+    latency_budget=settings.password_hash_latency_budget_ms / 1000
+)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
-    return pwd_context.verify(plain_password, hashed_password)
+    with observe(PASSWORD_HASH_DURATION, "verify"):
+        return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """生成密码哈希"""
-    return pwd_context.hash(password)
+    with observe(PASSWORD_HASH_DURATION, "hash"):
+        return pwd_context.hash(password)
+
+def password_needs_update(hashed_password: str) -> bool:
+    """哈希方案或参数与当前策略不一致时需要重新计算"""
+    return pwd_context.needs_update(hashed_password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """在准入控制下验证密码，过载时抛出OverloadedError"""
+    return await password_admission.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """在准入控制下生成密码哈希，过载时抛出OverloadedError"""
+    return await password_admission.run(get_password_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建访问令牌"""
@@ -25,7 +97,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
     
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
+    with observe(JWT_DURATION, "encode"):
+        encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
 def create_refresh_token(data: dict) -> str:
@@ -33,13 +106,15 @@ def create_refresh_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=settings.refresh_token_expire_days)
     to_encode.update({"exp": expire, "type": "refresh"})
-    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
+    with observe(JWT_DURATION, "encode"):
+        encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
 def verify_token(token: str) -> Optional[dict]:
     """验证令牌"""
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        with observe(JWT_DURATION, "decode"):
+            payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         return payload
     except JWTError:
         return None
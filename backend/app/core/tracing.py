@@ -0,0 +1,412 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import functools
+import inspect
+import json
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from pymongo import monitoring
+import requests
+from .config import settings
+
+# W3C Trace Context: version-trace_id-parent_id-flags
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_SAMPLED_FLAG = 0x01
+
+SERVER, INTERNAL, CLIENT = "server", "internal", "client"
+
+
+def _new_trace_id() -> str:
+    return f"{random.getrandbits(128) or 1:032x}"
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64) or 1:016x}"
+
+
+class SpanContext:
+    """链路标识；未被采样的请求只携带标识用于向下游传递，不记录任何数据"""
+
+    __slots__ = ("trace_id", "span_id", "sampled", "tracestate")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool, tracestate: Optional[str] = None):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+        self.tracestate = tracestate
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class Span(SpanContext):
+    """一次被采样的操作"""
+
+    __slots__ = ("name", "kind", "parent_id", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str],
+                 attributes: dict = None, tracestate: Optional[str] = None, start_ns: int = None):
+        super().__init__(trace_id, _new_span_id(), True, tracestate)
+        self.name = name
+        self.kind = kind
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.status = "ok"
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        self.status = "error"
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def end(self, end_ns: int = None):
+        self.end_ns = end_ns or time.time_ns()
+        tracer.exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "service": settings.tracing_service_name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+# 当前请求所在的span（或未采样请求的链路标识）
+_current_span: ContextVar[Optional[SpanContext]] = ContextVar("current_span", default=None)
+
+def current_span() -> Optional[SpanContext]:
+    return _current_span.get()
+
+
+class Sampler:
+    """比例采样 + 每秒链路数上限
+
+    有上游采样决定时沿用上游的决定，否则按 ratio 抽样；
+    无论哪种情况，每秒采样的链路数都不超过 max_per_second，保证高负载下追踪开销有上限。
+    """
+
+    def __init__(self, ratio: float, max_per_second: float):
+        self.ratio = ratio
+        self.max_per_second = max_per_second
+        self._tokens = max_per_second
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def should_sample(self, parent_sampled: Optional[bool]) -> bool:
+        if parent_sampled is False:
+            return False
+        if parent_sampled is None and random.random() >= self.ratio:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_per_second, self._tokens + (now - self._updated) * self.max_per_second)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class SpanExporter:
+    """在后台线程中批量输出span，队列满时丢弃而不阻塞请求
+
+    file: 每个span一行JSON（JSON Lines），console: 输出到标准错误，便于本地查看。
+    """
+
+    MAX_QUEUE = 10000
+    BATCH_SIZE = 512
+
+    def __init__(self, kind: str, path: str):
+        if kind not in ("file", "console"):
+            raise ValueError(f"不支持的追踪导出方式: {kind}")
+        self.kind = kind
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=self.MAX_QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            self._write([span for span in batch if span is not None])
+            if stop:
+                return
+
+    def _write(self, spans):
+        if not spans:
+            return
+        if self.kind == "console":
+            for span in spans:
+                print(
+                    f"[trace {span.trace_id[:8]}] {span.name} {(span.end_ns - span.start_ns) / 1e6:.2f}ms "
+                    f"span={span.span_id} parent={span.parent_id or '-'} {span.status} "
+                    f"{json.dumps(span.attributes, ensure_ascii=False, default=str)}",
+                    file=sys.stderr
+                )
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+    def shutdown(self):
+        """写出队列中剩余的span"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = settings.tracing_enabled
+        self.sampler = Sampler(settings.tracing_sample_ratio, settings.tracing_max_traces_per_second)
+        self.exporter = SpanExporter(settings.tracing_exporter, settings.tracing_file)
+
+    def shutdown(self):
+        self.exporter.shutdown()
+
+tracer = Tracer()
+
+
+@contextmanager
+def start_span(name: str, kind: str = INTERNAL, attributes: dict = None):
+    """在当前span下创建子span；当前请求未被采样时什么也不做，返回None"""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        yield None
+        return
+    span = Span(name, kind, parent.trace_id, parent.span_id, attributes, parent.tracestate)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+def traced(name: str = None):
+    """把函数调用记录为span，支持同步和异步函数
+
+    异步生成器按需迭代，调用本身不做任何工作，原样返回不记录span。
+    """
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+        if inspect.isasyncgenfunction(fn):
+            return fn
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                parent = _current_span.get()
+                if parent is None or not parent.sampled:
+                    return await fn(*args, **kwargs)
+                with start_span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            parent = _current_span.get()
+            if parent is None or not parent.sampled:
+                return fn(*args, **kwargs)
+            with start_span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def trace_methods(cls):
+    """为服务类的所有公开静态方法加上 traced"""
+    for attr_name, attr in list(vars(cls).items()):
+        if attr_name.startswith("_") or not isinstance(attr, staticmethod):
+            continue
+        setattr(cls, attr_name, staticmethod(traced(f"{cls.__name__}.{attr_name}")(attr.__func__)))
+    return cls
+
+
+def inject_headers(headers: dict = None) -> dict:
+    """把当前链路写入出站请求的 traceparent/tracestate 头"""
+    headers = dict(headers or {})
+    span = _current_span.get()
+    if span is not None:
+        headers["traceparent"] = span.traceparent
+        if span.tracestate:
+            headers["tracestate"] = span.tracestate
+    return headers
+
+def traced_http_request(method: str, url: str, **kwargs) -> requests.Response:
+    """发出HTTP请求并记录客户端span；URL不含查询参数，避免记录密钥等敏感信息"""
+    with start_span(f"HTTP {method}", CLIENT, {"http.method": method, "http.url": url}) as span:
+        kwargs["headers"] = inject_headers(kwargs.get("headers"))
+        response = requests.request(method, url, **kwargs)
+        if span is not None:
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.set_error(f"HTTP {response.status_code}")
+        return response
+
+
+def parse_traceparent(value: str, tracestate: Optional[str] = None) -> Optional[SpanContext]:
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & _SAMPLED_FLAG), tracestate)
+
+
+class TracingCommandListener(monitoring.CommandListener):
+    """为被采样请求中的每条MongoDB命令记录客户端span
+
+    Motor在线程池中执行驱动调用时会复制contextvars，因此监听器能拿到发起命令的span。
+    只记录集合和命令名，不记录查询内容。
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            return
+        collection = event.command.get(event.command_name)
+        host, port = event.connection_id
+        span = Span(
+            f"mongodb.{event.command_name}", CLIENT, parent.trace_id, parent.span_id,
+            {
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": collection if isinstance(collection, str) else None,
+                "net.peer.name": host,
+                "net.peer.port": port,
+            },
+            parent.tracestate
+        )
+        with self._lock:
+            self._pending[self._key(event)] = span
+
+    def _finish(self, event, error: Optional[str] = None):
+        with self._lock:
+            span = self._pending.pop(self._key(event), None)
+        if span is None:
+            return
+        if error:
+            span.set_error(error)
+        span.end(span.start_ns + event.duration_micros * 1000)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, event.failure.get("errmsg") or event.failure.get("codeName") or "failed")
+
+
+class TracingMiddleware:
+    """为每个请求创建服务端span，读取上游的 traceparent
+
+    未被采样的请求只生成链路标识（用于向下游传递），不分配span也不导出任何数据。
+    """
+
+    def __init__(self, app, tracer: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        tracestate = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                parent = value.decode("latin-1")
+            elif name == b"tracestate":
+                tracestate = value.decode("latin-1")
+        parent = parse_traceparent(parent, tracestate) if parent else None
+
+        sampled = self.tracer.sampler.should_sample(parent.sampled if parent else None)
+        trace_id = parent.trace_id if parent else _new_trace_id()
+        if not sampled:
+            token = _current_span.set(SpanContext(trace_id, _new_span_id(), False, tracestate))
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _current_span.reset(token)
+            return
+
+        span = Span(
+            f"{scope['method']} {scope['path']}", SERVER, trace_id,
+            parent.span_id if parent else None,
+            {"http.method": scope["method"], "http.target": scope["path"]},
+            tracestate
+        )
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = _current_span.set(span)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                span.name = f"{scope['method']} {route.path}"
+                span.set_attribute("http.route", route.path)
+            span.set_attribute("http.status_code", status_code)
+            if status_code >= 500 and span.status == "ok":
+                span.set_error(f"HTTP {status_code}")
+            span.end()
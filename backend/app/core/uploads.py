@@ -0,0 +1,291 @@
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from urllib.parse import parse_qs
+import asyncio
+import mimetypes
+import os
+import re
+import stat
+import threading
+from .config import settings
+from .metrics import record_cache
+
+mimetypes.add_type("image/webp", ".webp")
+
+# 头像按内容哈希存放，路径不变则内容不变
+_CONTENT_ADDRESSED = re.compile(r"^avatars/[0-9a-f]{2}/([0-9a-f]{64})/(\d+)\.(webp|jpg)$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MUTABLE_CACHE_CONTROL = "public, no-cache"
+
+
+class _CachedFile:
+    __slots__ = ("body", "etag", "last_modified", "mtime_ns")
+
+    def __init__(self, body: bytes, etag: str, last_modified: str, mtime_ns: int):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.mtime_ns = mtime_ns
+
+
+class FileCache:
+    """按字节数限制容量的LRU缓存，只缓存小文件"""
+
+    def __init__(self, max_bytes: int, max_file_size: int):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.size = 0
+        self._entries: "OrderedDict[str, _CachedFile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[_CachedFile]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+            return entry
+
+    def put(self, path: str, entry: _CachedFile):
+        size = len(entry.body)
+        if size > self.max_file_size or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self._entries[path] = entry
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+
+def select_variant(relative_path: str, query_string: bytes) -> str:
+    """按 ?size= / ?format= 选择头像的其他尺寸或格式
+
+    size 取不小于请求值的最小尺寸，超过最大尺寸时取最大尺寸。
+    """
+    match = _CONTENT_ADDRESSED.match(relative_path)
+    if match is None or not query_string:
+        return relative_path
+    query = parse_qs(query_string.decode("latin-1"))
+    size, ext = int(match.group(2)), match.group(3)
+    requested = query.get("size", [""])[0]
+    if requested.isdigit():
+        sizes = sorted(settings.avatar_sizes)
+        size = next((s for s in sizes if s >= int(requested)), sizes[-1])
+    requested_format = query.get("format", [""])[0].lower()
+    if requested_format in ("jpeg", "jpg", "webp"):
+        ext = "jpg" if requested_format == "jpeg" else requested_format
+    return f"{relative_path.rsplit('/', 1)[0]}/{size}.{ext}"
+
+def parse_range(header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """解析单个字节范围，返回闭区间 (start, end)；多段范围不支持，返回None按完整内容响应
+
+    范围无法满足时抛出ValueError。
+    """
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            raise ValueError("unsatisfiable")
+        return max(0, file_size - length), file_size - 1
+    start = int(start)
+    end = min(int(end), file_size - 1) if end else file_size - 1
+    if start >= file_size or start > end:
+        raise ValueError("unsatisfiable")
+    return start, end
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match 使用弱比较"""
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class UploadsApp:
+    """上传文件服务
+
+    - 内容寻址的头像路径返回一年有效期的 immutable 缓存头和强ETag，其他文件每次需用ETag重新验证
+    - 支持 If-None-Match / If-Modified-Since（304）、Range / If-Range（206、416）和HEAD
+    - 服务器支持ASGI的 pathsend / zerocopysend 扩展时由服务器直接发送文件，否则在线程池中分块读取
+    - 小文件可缓存在进程内的LRU中，命中时不再访问磁盘
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, directory: str, cache: Optional[FileCache] = None):
+        self.directory = os.path.realpath(directory)
+        self.cache = cache
+
+    def _resolve(self, relative_path: str) -> Optional[str]:
+        full_path = os.path.realpath(os.path.join(self.directory, relative_path))
+        if os.path.commonpath([full_path, self.directory]) != self.directory:
+            return None
+        return full_path
+
+    @staticmethod
+    async def _respond(send, status: int, headers: list, body: bytes = b"", head: bool = False):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if head else body})
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+        method = scope["method"]
+        if method not in ("GET", "HEAD"):
+            await self._respond(send, 405, [(b"allow", b"GET, HEAD"), (b"content-length", b"0")])
+            return
+
+        relative_path = scope["path"].lstrip("/")
+        relative_path = select_variant(relative_path, scope.get("query_string", b""))
+        full_path = self._resolve(relative_path) if relative_path else None
+        immutable = _CONTENT_ADDRESSED.match(relative_path) is not None
+
+        entry = self.cache.get(full_path) if self.cache is not None and full_path else None
+        loop = asyncio.get_running_loop()
+        stat_result = None
+        if entry is None or not immutable:
+            try:
+                stat_result = await loop.run_in_executor(None, os.stat, full_path) if full_path else None
+            except (FileNotFoundError, NotADirectoryError):
+                stat_result = None
+            if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                await self._respond(send, 404, [(b"content-type", b"text/plain; charset=utf-8"),
+                                                (b"content-length", b"9")], b"Not Found", method == "HEAD")
+                return
+            if entry is not None and entry.mtime_ns != stat_result.st_mtime_ns:
+                entry = None
+        if self.cache is not None:
+            record_cache("uploads", entry is not None)
+
+        if entry is not None:
+            etag, last_modified, file_size = entry.etag, entry.last_modified, len(entry.body)
+        else:
+            file_size = stat_result.st_size
+            if immutable:
+                # 文件名由内容哈希决定，直接作为强ETag
+                match = _CONTENT_ADDRESSED.match(relative_path)
+                etag = f'"{match.group(1)[:32]}-{match.group(2)}-{match.group(3)}"'
+            else:
+                etag = f'"{stat_result.st_mtime_ns:x}-{file_size:x}"'
+            last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+        headers = {
+            b"etag": etag.encode(),
+            b"last-modified": last_modified.encode(),
+            b"cache-control": (IMMUTABLE_CACHE_CONTROL if immutable else MUTABLE_CACHE_CONTROL).encode(),
+            b"accept-ranges": b"bytes",
+            b"x-content-type-options": b"nosniff",
+        }
+        request_headers = {}
+        for name, value in scope["headers"]:
+            if name in (b"if-none-match", b"if-modified-since", b"range", b"if-range"):
+                request_headers[name] = value.decode("latin-1")
+
+        if self._not_modified(request_headers, etag, stat_result):
+            await self._respond(send, 304, list(headers.items()))
+            return
+
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        headers[b"content-type"] = media_type.encode()
+
+        start, end, status = 0, file_size - 1, 200
+        range_header = request_headers.get(b"range")
+        if_range = request_headers.get(b"if-range")
+        if range_header and (if_range is None or if_range.strip() == etag):
+            try:
+                byte_range = parse_range(range_header, file_size)
+            except ValueError:
+                headers[b"content-range"] = f"bytes */{file_size}".encode()
+                headers[b"content-length"] = b"0"
+                await self._respond(send, 416, list(headers.items()))
+                return
+            if byte_range is not None:
+                start, end = byte_range
+                status = 206
+                headers[b"content-range"] = f"bytes {start}-{end}/{file_size}".encode()
+        length = max(0, end - start + 1)
+        headers[b"content-length"] = str(length).encode()
+
+        if entry is not None:
+            await self._respond(send, status, list(headers.items()), entry.body[start:end + 1], method == "HEAD")
+            return
+
+        if (self.cache is not None and method == "GET" and status == 200
+                and file_size <= self.cache.max_file_size):
+            body = await loop.run_in_executor(None, self._read_file, full_path)
+            self.cache.put(full_path, _CachedFile(body, etag, last_modified, stat_result.st_mtime_ns))
+            await self._respond(send, status, list(headers.items()), body)
+            return
+
+        await send({"type": "http.response.start", "status": status, "headers": list(headers.items())})
+        if method == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await self._send_file(scope, send, loop, full_path, start, length, file_size)
+
+    @staticmethod
+    def _not_modified(request_headers: dict, etag: str, stat_result) -> bool:
+        if_none_match = request_headers.get(b"if-none-match")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, etag)
+        if_modified_since = request_headers.get(b"if-modified-since")
+        if not if_modified_since:
+            return False
+        if stat_result is None:
+            # 缓存命中的内容寻址文件，客户端持有的任何版本都是最新的
+            return True
+        try:
+            return int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def _read_file(path: str, offset: int = 0, count: int = -1) -> bytes:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(count)
+
+    async def _send_file(self, scope, send, loop, path: str, start: int, length: int, file_size: int):
+        extensions = scope.get("extensions") or {}
+        if "http.response.pathsend" in extensions and start == 0 and length == file_size:
+            await send({"type": "http.response.pathsend", "path": path})
+            return
+        if "http.response.zerocopysend" in extensions:
+            with open(path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f,
+                            "offset": start, "count": length})
+            return
+
+        offset, remaining = start, length
+        while remaining > 0:
+            chunk = await loop.run_in_executor(None, self._read_file, path, offset, min(self.CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            offset += len(chunk)
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def create_uploads_app() -> UploadsApp:
+    cache = None
+    if settings.uploads_cache_max_bytes > 0:
+        cache = FileCache(settings.uploads_cache_max_bytes, settings.uploads_cache_max_file_size)
+    return UploadsApp(settings.upload_dir, cache)
@@ -0,0 +1,178 @@
+from typing import Callable, Dict, Optional, Tuple
+import time
+from .config import settings
+
+class VerificationCodeStore:
+    """验证码存储接口
+
+    key 由调用方拼接（如 "login:13800138000"），所有操作都需要是原子的，
+    这样同一个验证码在多个并发请求中只能被成功消费一次。
+    """
+
+    async def save(self, key: str, code: str, ttl: int) -> None:
+        """保存验证码并重置尝试次数"""
+        raise NotImplementedError
+
+    async def get(self, key: str) -> Optional[str]:
+        """读取验证码（不删除）"""
+        raise NotImplementedError
+
+    async def pop(self, key: str) -> Optional[str]:
+        """原子地读取并删除验证码"""
+        raise NotImplementedError
+
+    async def consume(self, key: str, code: str) -> bool:
+        """验证码匹配时原子地删除并返回True"""
+        raise NotImplementedError
+
+    async def incr_attempts(self, key: str, ttl: int) -> int:
+        """尝试次数加一并返回当前次数"""
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        """删除验证码及其尝试次数"""
+        raise NotImplementedError
+
+
+class MemoryVerificationCodeStore(VerificationCodeStore):
+    """进程内TTL存储，适用于单进程部署"""
+
+    # 每写入多少次顺带清理一次过期数据
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._codes: Dict[str, Tuple[str, float]] = {}
+        self._attempts: Dict[str, Tuple[int, float]] = {}
+        self._writes = 0
+
+    def _alive(self, table: dict, key: str):
+        item = table.get(key)
+        if item is None:
+            return None
+        if item[1] <= self._clock():
+            del table[key]
+            return None
+        return item
+
+    def _maybe_purge(self):
+        self._writes += 1
+        if self._writes % self.PURGE_INTERVAL:
+            return
+        now = self._clock()
+        for table in (self._codes, self._attempts):
+            for key in [k for k, v in table.items() if v[1] <= now]:
+                del table[key]
+
+    async def save(self, key: str, code: str, ttl: int) -> None:
+        self._maybe_purge()
+        self._codes[key] = (code, self._clock() + ttl)
+        self._attempts.pop(key, None)
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._alive(self._codes, key)
+        return item[0] if item else None
+
+    async def pop(self, key: str) -> Optional[str]:
+        item = self._alive(self._codes, key)
+        if item is None:
+            return None
+        del self._codes[key]
+        self._attempts.pop(key, None)
+        return item[0]
+
+    async def consume(self, key: str, code: str) -> bool:
+        item = self._alive(self._codes, key)
+        if item is None or item[0] != code:
+            return False
+        del self._codes[key]
+        self._attempts.pop(key, None)
+        return True
+
+    async def incr_attempts(self, key: str, ttl: int) -> int:
+        self._maybe_purge()
+        item = self._alive(self._attempts, key)
+        count, expires_at = item if item else (0, self._clock() + ttl)
+        self._attempts[key] = (count + 1, expires_at)
+        return count + 1
+
+    async def delete(self, key: str) -> None:
+        self._codes.pop(key, None)
+        self._attempts.pop(key, None)
+
+
+# 仅当验证码匹配时删除，保证同一验证码只能被消费一次
+_CONSUME_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
+
+# 首次计数时设置过期时间，避免尝试次数永久残留
+_INCR_SCRIPT = """
+local n = redis.call('INCR', KEYS[1])
+if n == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return n
+"""
+
+
+class RedisVerificationCodeStore(VerificationCodeStore):
+    """Redis存储，适用于多worker部署"""
+
+    def __init__(self, client=None, prefix: str = "vc:"):
+        if client is None:
+            from .redis_client import get_redis
+            client = get_redis()
+        self._redis = client
+        self._prefix = prefix
+        self._consume = client.register_script(_CONSUME_SCRIPT)
+        self._incr = client.register_script(_INCR_SCRIPT)
+
+    def _keys(self, key: str) -> Tuple[str, str]:
+        return f"{self._prefix}{key}", f"{self._prefix}{key}:attempts"
+
+    async def save(self, key: str, code: str, ttl: int) -> None:
+        code_key, attempts_key = self._keys(key)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(code_key, code, ex=ttl)
+            pipe.delete(attempts_key)
+            await pipe.execute()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._redis.get(self._keys(key)[0])
+
+    async def pop(self, key: str) -> Optional[str]:
+        code_key, attempts_key = self._keys(key)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.getdel(code_key)
+            pipe.delete(attempts_key)
+            code, _ = await pipe.execute()
+        return code
+
+    async def consume(self, key: str, code: str) -> bool:
+        return bool(await self._consume(keys=list(self._keys(key)), args=[code]))
+
+    async def incr_attempts(self, key: str, ttl: int) -> int:
+        return int(await self._incr(keys=[self._keys(key)[1]], args=[ttl]))
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(*self._keys(key))
+
+
+_store: Optional[VerificationCodeStore] = None
+
+def get_verification_store() -> VerificationCodeStore:
+    """根据配置获取验证码存储"""
+    global _store
+    if _store is None:
+        if settings.verification_code_backend == "redis":
+            _store = RedisVerificationCodeStore()
+        elif settings.verification_code_backend == "memory":
+            _store = MemoryVerificationCodeStore()
+        else:
+            raise ValueError(f"不支持的验证码存储: {settings.verification_code_backend}")
+    return _store
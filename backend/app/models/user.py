@@ -41,6 +41,7 @@ class UserModel(BaseModel):
     is_verified: bool = False
     email_verified: bool = False
     phone_verified: bool = False
+    is_admin: bool = False
     
     # 微信信息
     wechat_openid: Optional[str] = None
@@ -110,7 +111,7 @@ class VIPSubscriptionModel(BaseModel):
     currency: str = "CNY"
     status: str = "active"  # active, expired, cancelled
     start_date: datetime = Field(default_factory=datetime.utcnow)
-    end_date: datetime
+    end_date: Optional[datetime] = None  # 终身会员为空
     payment_method: Optional[str] = None
     transaction_id: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
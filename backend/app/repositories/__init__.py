@@ -0,0 +1,22 @@
+from typing import Optional
+from app.core.config import settings
+from .base import (
+    UserRepository, SessionRepository, SubscriptionRepository, AnalyticsRepository, ExportRepository,
+    Repositories, InsufficientBalanceError
+)
+
+_repositories: Optional[Repositories] = None
+
+def get_repositories() -> Repositories:
+    """根据配置获取数据访问层（mongo 或 memory）"""
+    global _repositories
+    if _repositories is None:
+        if settings.storage_backend == "mongo":
+            from .mongo import create_mongo_repositories
+            _repositories = create_mongo_repositories()
+        elif settings.storage_backend == "memory":
+            from .memory import create_memory_repositories
+            _repositories = create_memory_repositories()
+        else:
+            raise ValueError(f"不支持的存储后端: {settings.storage_backend}")
+    return _repositories
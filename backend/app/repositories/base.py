@@ -0,0 +1,178 @@
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+class InsufficientBalanceError(Exception):
+    """余额不足，购买未生效"""
+
+
+# 管理后台可按前缀搜索的字段，以小写形式冗余存放在 search.<字段> 并建索引
+SEARCH_FIELDS = ("username", "nickname", "email", "phone")
+
+def normalize_search_value(value) -> Optional[str]:
+    return value.strip().lower() if isinstance(value, str) else None
+
+def search_fields(fields: dict) -> dict:
+    """本次写入涉及的搜索字段对应的 search.<字段> 更新"""
+    return {
+        f"search.{field}": normalize_search_value(fields[field])
+        for field in SEARCH_FIELDS if field in fields
+    }
+
+# 用户目录可筛选的字段及其默认值；注册时不写入这些字段，缺失或为null的文档按默认值匹配
+FILTER_DEFAULTS = {"is_active": True, "is_vip": False, "vip_level": 0}
+
+
+class UserRepository:
+    """用户数据访问接口，返回原始文档（dict）"""
+
+    # 可按值精确查找的字段
+    LOOKUP_FIELDS = ("username", "email", "phone", "wechat_openid")
+
+    async def get_by_id(self, user_id: str, tolerant: bool = False) -> Optional[dict]:
+        """根据ID获取用户，tolerant为True时允许读到稍旧的数据"""
+        raise NotImplementedError
+
+    async def get_by_ids(self, user_ids: List[str]) -> List[dict]:
+        """批量获取用户"""
+        raise NotImplementedError
+
+    async def find_by(self, field: str, value) -> Optional[dict]:
+        """按 LOOKUP_FIELDS 中的字段查找用户"""
+        raise NotImplementedError
+
+    async def insert(self, document: dict) -> Optional[str]:
+        """插入用户，返回新用户ID；LOOKUP_FIELDS 与已有用户冲突时返回None"""
+        raise NotImplementedError
+
+    async def insert_many(self, documents: List[dict]) -> Tuple[int, List[dict]]:
+        """无序批量插入，单条失败不影响其余文档
+
+        返回 (插入数, 失败列表)，失败项为 {"index": 批内序号, "code": 错误码, "key": 冲突的键, "message": 说明}，
+        唯一键冲突的错误码为 11000。
+        """
+        raise NotImplementedError
+
+    async def update(self, user_id: str, fields: dict, expected: dict = None) -> bool:
+        """更新字段；给定expected时仅在当前值与之相同时更新，返回是否有修改"""
+        raise NotImplementedError
+
+    async def update_and_get(self, user_id: str, fields: dict) -> Optional[dict]:
+        """更新字段并返回更新后的用户"""
+        raise NotImplementedError
+
+    async def find_expired_vip_ids(self, now: datetime, limit: int) -> List[str]:
+        """按到期时间升序返回已过期但仍为VIP的用户ID"""
+        raise NotImplementedError
+
+    async def downgrade_vips(self, user_ids: List[str], now: datetime) -> int:
+        """把仍处于过期状态的用户降级为普通用户，返回降级人数（期间续费的用户不受影响）"""
+        raise NotImplementedError
+
+    async def list_users(self, filters: dict, limit: int, sort: str = "_id",
+                         search: Optional[Tuple[str, str]] = None, after: Optional[tuple] = None) -> List[dict]:
+        """管理后台用户列表，按键集分页
+
+        sort 为 _id 或 created_at 时按新到旧排序；给定 search=(字段, 前缀) 时按该字段的小写值升序。
+        after 为上一页最后一条记录的排序键：(_id,)、(created_at, _id) 或 (搜索字段值, _id)。
+        """
+        raise NotImplementedError
+
+    async def backfill_search_fields(self, batch_size: int = 1000) -> int:
+        """为缺少 search 字段的存量用户补齐，返回处理的用户数"""
+        raise NotImplementedError
+
+
+class SessionRepository:
+    """用户会话（刷新令牌）数据访问接口"""
+
+    async def insert(self, document: dict) -> None:
+        raise NotImplementedError
+
+    async def find_active(self, refresh_token: str, now: datetime) -> Optional[dict]:
+        """查找未登出且未过期的会话"""
+        raise NotImplementedError
+
+    async def deactivate(self, refresh_token: str) -> bool:
+        """登出会话，返回是否有修改"""
+        raise NotImplementedError
+
+
+class SubscriptionRepository:
+    """VIP订阅数据访问接口"""
+
+    async def insert(self, document: dict) -> str:
+        raise NotImplementedError
+
+    async def list_by_user(self, user_id: str, limit: int = 20,
+                           before: Optional[Tuple[datetime, str]] = None) -> List[dict]:
+        """按 (created_at, _id) 倒序返回用户的订阅记录，before 为上一页最后一条的 (created_at, _id)"""
+        raise NotImplementedError
+
+    async def get_by_transaction_id(self, transaction_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def purchase(self, document: dict, debit: float, vip_level: int,
+                       days: Optional[int], now: datetime) -> Tuple[dict, bool]:
+        """原子地记录一笔购买并更新用户的VIP状态
+
+        debit > 0 时从 vip_balance 扣款，余额不足抛出 InsufficientBalanceError；
+        到期时间从 max(当前到期时间, now) 起延长 days 天，days 为None表示终身。
+        会在 document 中补充 start_date / end_date。
+        transaction_id 已存在时不做任何修改，返回已有记录；返回 (记录, 是否新建)。
+        """
+        raise NotImplementedError
+
+
+class AnalyticsRepository:
+    """预聚合统计数据访问接口
+
+    每个时间桶一个文档：counters 为计数器，hll 为各去重指标的HyperLogLog寄存器。
+    """
+
+    async def apply(self, rollups: List[dict]) -> None:
+        """批量合并增量，不存在的桶自动创建
+
+        每项为 {"_id": 桶ID, "counters": {路径: 增量}, "hll": {指标: {寄存器: 值}}, "expire_at": 过期时间或None}；
+        计数器相加、寄存器取最大值，多个worker并发写入的结果与顺序无关。
+        """
+        raise NotImplementedError
+
+    async def get_many(self, bucket_ids: List[str]) -> List[dict]:
+        raise NotImplementedError
+
+
+# 可导出的集合
+EXPORT_COLLECTIONS = ("users", "user_sessions", "vipsubscriptions")
+# 导出时始终排除的字段：在数据库端用投影去掉，不会离开数据库
+EXPORT_EXCLUDED_FIELDS = ("hashed_password", "refresh_token", "search")
+
+
+class ExportRepository:
+    """按 _id 顺序流式读取集合，用于数据导出"""
+
+    def iter_documents(self, collection: str, user_id: Optional[str] = None,
+                       lower: Optional[str] = None, upper: Optional[str] = None,
+                       batch_size: int = 1000) -> AsyncIterator[dict]:
+        """逐个产出文档，同一时间只在内存中保留一批
+
+        user_id 限定为某个用户的数据（users 按 _id，其他集合按 user_id）；
+        lower / upper 为 _id 的左闭右开区间，用于分区并行导出。
+        """
+        raise NotImplementedError
+
+    async def split_points(self, collection: str, partitions: int) -> List[str]:
+        """返回把集合按 _id 大致均分为 partitions 段的 partitions-1 个分界点"""
+        raise NotImplementedError
+
+
+class Repositories:
+    """数据访问层入口"""
+
+    def __init__(self, users: UserRepository, sessions: SessionRepository,
+                 subscriptions: SubscriptionRepository, analytics: AnalyticsRepository,
+                 export: ExportRepository):
+        self.users = users
+        self.sessions = sessions
+        self.subscriptions = subscriptions
+        self.analytics = analytics
+        self.export = export
@@ -0,0 +1,328 @@
+from collections import defaultdict
+import copy
+import heapq
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from bson import ObjectId
+from .base import (
+    SEARCH_FIELDS, FILTER_DEFAULTS, EXPORT_EXCLUDED_FIELDS, normalize_search_value,
+    UserRepository, SessionRepository, SubscriptionRepository, AnalyticsRepository, ExportRepository,
+    Repositories, InsufficientBalanceError
+)
+
+class MemoryUserRepository(UserRepository):
+    """进程内用户存储
+
+    主数据按 _id 存放，LOOKUP_FIELDS 各自维护一个 值 -> _id 的二级索引，
+    所有查找都是O(1)的字典访问，适合在没有MongoDB的环境下做基准测试和CPU剖析。
+    读取返回浅拷贝，调用方修改返回值不会影响存储内容。
+    """
+
+    def __init__(self):
+        self._users: Dict[ObjectId, dict] = {}
+        self._indexes: Dict[str, Dict[object, ObjectId]] = {field: {} for field in self.LOOKUP_FIELDS}
+
+    def _index(self, document: dict):
+        for field, index in self._indexes.items():
+            value = document.get(field)
+            if value is not None:
+                index.setdefault(value, document["_id"])
+
+    def _unindex(self, document: dict):
+        for field, index in self._indexes.items():
+            value = document.get(field)
+            if value is not None and index.get(value) == document["_id"]:
+                del index[value]
+
+    async def get_by_id(self, user_id: str, tolerant: bool = False) -> Optional[dict]:
+        user_data = self._users.get(ObjectId(user_id))
+        return dict(user_data) if user_data else None
+
+    async def get_by_ids(self, user_ids: List[str]) -> List[dict]:
+        users = []
+        for user_id in user_ids:
+            user_data = self._users.get(ObjectId(user_id))
+            if user_data:
+                users.append(dict(user_data))
+        return users
+
+    async def find_by(self, field: str, value) -> Optional[dict]:
+        if field not in self.LOOKUP_FIELDS:
+            raise ValueError(f"不支持按 {field} 查找用户")
+        user_id = self._indexes[field].get(value)
+        return dict(self._users[user_id]) if user_id is not None else None
+
+    def _conflict(self, document: dict) -> Optional[str]:
+        """与已有用户重复的 LOOKUP_FIELDS 字段，与MongoDB上的唯一索引行为一致"""
+        return next(
+            (field for field in self.LOOKUP_FIELDS
+             if document.get(field) is not None and document[field] in self._indexes[field]),
+            None
+        )
+
+    async def insert(self, document: dict) -> Optional[str]:
+        if self._conflict(document) is not None:
+            return None
+        document.setdefault("_id", ObjectId())
+        self._users[document["_id"]] = dict(document)
+        self._index(document)
+        return str(document["_id"])
+
+    async def insert_many(self, documents: List[dict]) -> Tuple[int, List[dict]]:
+        inserted, failures = 0, []
+        for index, document in enumerate(documents):
+            conflict = self._conflict(document)
+            if conflict is not None:
+                failures.append({
+                    "index": index,
+                    "code": 11000,
+                    "key": {conflict: document[conflict]},
+                    "message": f"duplicate key: {conflict}",
+                })
+                continue
+            await self.insert(document)
+            inserted += 1
+        return inserted, failures
+
+    async def update(self, user_id: str, fields: dict, expected: dict = None) -> bool:
+        user_data = self._users.get(ObjectId(user_id))
+        if user_data is None:
+            return False
+        if expected and any(user_data.get(k) != v for k, v in expected.items()):
+            return False
+        changed = any(user_data.get(k) != v for k, v in fields.items())
+        if any(field in self._indexes for field in fields):
+            self._unindex(user_data)
+            user_data.update(fields)
+            self._index(user_data)
+        else:
+            user_data.update(fields)
+        return changed
+
+    async def update_and_get(self, user_id: str, fields: dict) -> Optional[dict]:
+        await self.update(user_id, fields)
+        return await self.get_by_id(user_id)
+
+    async def find_expired_vip_ids(self, now: datetime, limit: int) -> List[str]:
+        expired = (
+            (user_data["vip_expire_time"], user_id) for user_id, user_data in self._users.items()
+            if user_data.get("is_vip") and user_data.get("vip_expire_time") and user_data["vip_expire_time"] < now
+        )
+        return [str(user_id) for _, user_id in heapq.nsmallest(limit, expired)]
+
+    async def downgrade_vips(self, user_ids: List[str], now: datetime) -> int:
+        downgraded = 0
+        for user_id in user_ids:
+            user_data = self._users.get(ObjectId(user_id))
+            if (user_data and user_data.get("is_vip") and user_data.get("vip_expire_time")
+                    and user_data["vip_expire_time"] < now):
+                user_data.update({"is_vip": False, "vip_level": 0, "updated_at": now})
+                downgraded += 1
+        return downgraded
+
+    async def list_users(self, filters: dict, limit: int, sort: str = "_id",
+                         search: Optional[Tuple[str, str]] = None, after: Optional[tuple] = None) -> List[dict]:
+        # 逐个扫描，内存后端只用于测试，排序和分页语义与MongoDB实现一致
+        users = [
+            user_data for user_data in self._users.values()
+            if all(
+                (FILTER_DEFAULTS.get(field) if user_data.get(field) is None else user_data[field]) == value
+                for field, value in filters.items()
+            )
+        ]
+        if search is not None:
+            field, prefix = search
+            prefix = normalize_search_value(prefix)
+            users = [user_data for user_data in users
+                     if (normalize_search_value(user_data.get(field)) or "").startswith(prefix)]
+            key = lambda user_data: (normalize_search_value(user_data.get(field)), user_data["_id"])
+            reverse = False
+        elif sort == "created_at":
+            key = lambda user_data: (user_data["created_at"], user_data["_id"])
+            reverse = True
+        else:
+            key = lambda user_data: (user_data["_id"],)
+            reverse = True
+
+        if after is not None:
+            bound = (*after[:-1], ObjectId(after[-1]))
+            users = [user_data for user_data in users if (key(user_data) < bound if reverse else key(user_data) > bound)]
+        users.sort(key=key, reverse=reverse)
+        result = []
+        for user_data in users[:limit]:
+            item = dict(user_data)
+            item["search"] = {f: normalize_search_value(user_data.get(f)) for f in SEARCH_FIELDS}
+            result.append(item)
+        return result
+
+    async def backfill_search_fields(self, batch_size: int = 1000) -> int:
+        # 内存后端在查询时计算小写值，不需要补齐
+        return 0
+
+
+class MemorySessionRepository(SessionRepository):
+    """进程内会话存储，按 refresh_token 索引"""
+
+    def __init__(self):
+        self._sessions: Dict[str, dict] = {}
+
+    async def insert(self, document: dict) -> None:
+        document.setdefault("_id", ObjectId())
+        self._sessions[document["refresh_token"]] = dict(document)
+
+    async def find_active(self, refresh_token: str, now: datetime) -> Optional[dict]:
+        session = self._sessions.get(refresh_token)
+        if session and session["is_active"] and session["expires_at"] > now:
+            return dict(session)
+        return None
+
+    async def deactivate(self, refresh_token: str) -> bool:
+        session = self._sessions.get(refresh_token)
+        if not session or not session["is_active"]:
+            return False
+        session["is_active"] = False
+        return True
+
+
+class MemorySubscriptionRepository(SubscriptionRepository):
+    """进程内订阅存储，按 user_id 和 transaction_id 索引
+
+    purchase 中没有await，在事件循环中天然是原子的。
+    """
+
+    def __init__(self, users: MemoryUserRepository):
+        self._users = users
+        self._by_user: Dict[ObjectId, List[dict]] = defaultdict(list)
+        self._by_transaction: Dict[str, dict] = {}
+
+    async def insert(self, document: dict) -> str:
+        document.setdefault("_id", ObjectId())
+        record = dict(document)
+        self._by_user[ObjectId(document["user_id"])].append(record)
+        if document.get("transaction_id"):
+            self._by_transaction[document["transaction_id"]] = record
+        return str(document["_id"])
+
+    async def list_by_user(self, user_id: str, limit: int = 20,
+                           before: Optional[Tuple[datetime, str]] = None) -> List[dict]:
+        records = sorted(
+            self._by_user.get(ObjectId(user_id), []),
+            key=lambda r: (r["created_at"], r["_id"]), reverse=True
+        )
+        if before is not None:
+            cursor = (before[0], ObjectId(before[1]))
+            records = [r for r in records if (r["created_at"], r["_id"]) < cursor]
+        return [dict(record) for record in records[:limit]]
+
+    async def get_by_transaction_id(self, transaction_id: str) -> Optional[dict]:
+        record = self._by_transaction.get(transaction_id)
+        return dict(record) if record else None
+
+    async def purchase(self, document: dict, debit: float, vip_level: int,
+                       days: Optional[int], now: datetime) -> Tuple[dict, bool]:
+        existing = self._by_transaction.get(document["transaction_id"])
+        if existing is not None:
+            return dict(existing), False
+        user_data = self._users._users.get(ObjectId(document["user_id"]))
+        if user_data is None:
+            raise ValueError("用户不存在")
+        if debit > 0:
+            if user_data.get("vip_balance", 0.0) < debit:
+                raise InsufficientBalanceError()
+            user_data["vip_balance"] = user_data.get("vip_balance", 0.0) - debit
+
+        expire_time = user_data.get("vip_expire_time")
+        is_lifetime = user_data.get("is_vip") and expire_time is None
+        if days is None:
+            expire_time = None
+        elif not is_lifetime:
+            expire_time = max(expire_time or now, now) + timedelta(days=days)
+        user_data.update({
+            "is_vip": True,
+            "vip_level": max(user_data.get("vip_level", 0), vip_level),
+            "vip_expire_time": expire_time,
+            "updated_at": now,
+        })
+        document["end_date"] = expire_time
+        document["start_date"] = expire_time - timedelta(days=days) if days and expire_time else now
+        await self.insert(document)
+        return document, True
+
+
+class MemoryAnalyticsRepository(AnalyticsRepository):
+    """进程内统计存储，结构与 analytics_rollups 文档相同（计数器路径展开为嵌套字典）"""
+
+    def __init__(self):
+        self._rollups: Dict[str, dict] = {}
+
+    async def apply(self, rollups: List[dict]) -> None:
+        for rollup in rollups:
+            document = self._rollups.setdefault(rollup["_id"], {"_id": rollup["_id"], "counters": {}, "hll": {}})
+            if rollup.get("expire_at"):
+                document.setdefault("expire_at", rollup["expire_at"])
+            for path, value in rollup["counters"].items():
+                *parents, leaf = path.split(".")
+                node = document["counters"]
+                for parent in parents:
+                    node = node.setdefault(parent, {})
+                node[leaf] = node.get(leaf, 0) + value
+            for name, sketch in rollup["hll"].items():
+                registers = document["hll"].setdefault(name, {})
+                for index, rank in sketch.items():
+                    if rank > registers.get(index, 0):
+                        registers[index] = rank
+
+    async def get_many(self, bucket_ids: List[str]) -> List[dict]:
+        return [copy.deepcopy(self._rollups[bucket_id]) for bucket_id in bucket_ids if bucket_id in self._rollups]
+
+
+class MemoryExportRepository(ExportRepository):
+    """直接读取其他内存仓库中的数据"""
+
+    def __init__(self, users: MemoryUserRepository, sessions: MemorySessionRepository,
+                 subscriptions: MemorySubscriptionRepository):
+        self._users = users
+        self._sessions = sessions
+        self._subscriptions = subscriptions
+
+    def _documents(self, collection: str) -> List[dict]:
+        if collection == "users":
+            return list(self._users._users.values())
+        if collection == "user_sessions":
+            return list(self._sessions._sessions.values())
+        if collection == "vipsubscriptions":
+            return [record for records in self._subscriptions._by_user.values() for record in records]
+        raise ValueError(f"不支持导出集合: {collection}")
+
+    async def iter_documents(self, collection: str, user_id: Optional[str] = None,
+                             lower: Optional[str] = None, upper: Optional[str] = None,
+                             batch_size: int = 1000) -> AsyncIterator[dict]:
+        documents = self._documents(collection)
+        if user_id is not None:
+            field = "_id" if collection == "users" else "user_id"
+            documents = [document for document in documents if document.get(field) == ObjectId(user_id)]
+        if lower is not None:
+            documents = [document for document in documents if document["_id"] >= ObjectId(lower)]
+        if upper is not None:
+            documents = [document for document in documents if document["_id"] < ObjectId(upper)]
+        for document in sorted(documents, key=lambda document: document["_id"]):
+            yield {key: value for key, value in document.items() if key not in EXPORT_EXCLUDED_FIELDS}
+
+    async def split_points(self, collection: str, partitions: int) -> List[str]:
+        ids = sorted(document["_id"] for document in self._documents(collection))
+        if partitions <= 1 or len(ids) < partitions:
+            return []
+        return [str(ids[len(ids) * i // partitions]) for i in range(1, partitions)]
+
+
+def create_memory_repositories() -> Repositories:
+    users = MemoryUserRepository()
+    sessions = MemorySessionRepository()
+    subscriptions = MemorySubscriptionRepository(users)
+    return Repositories(
+        users=users,
+        sessions=sessions,
+        subscriptions=subscriptions,
+        analytics=MemoryAnalyticsRepository(),
+        export=MemoryExportRepository(users, sessions, subscriptions),
+    )
@@ -0,0 +1,428 @@
+from datetime import datetime, timedelta
+import re
+from typing import AsyncIterator, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from app.core.database import (
+    get_database, get_read_database, get_user_read_database, record_write, record_writes, causal_session
+)
+from .base import (
+    SEARCH_FIELDS, FILTER_DEFAULTS, EXPORT_COLLECTIONS, EXPORT_EXCLUDED_FIELDS, search_fields, normalize_search_value,
+    UserRepository, SessionRepository, SubscriptionRepository, AnalyticsRepository, ExportRepository,
+    Repositories, InsufficientBalanceError
+)
+
+class MongoUserRepository(UserRepository):
+    """基于Motor的用户数据访问，写入后固定读主库"""
+
+    async def get_by_id(self, user_id: str, tolerant: bool = False) -> Optional[dict]:
+        db = await get_user_read_database(user_id) if tolerant else get_database()
+        user_data = await db.users.find_one({"_id": ObjectId(user_id)})
+        if user_data is None and db is not get_database():
+            # 新注册的用户可能尚未复制到从库
+            user_data = await get_database().users.find_one({"_id": ObjectId(user_id)})
+        return user_data
+
+    async def get_by_ids(self, user_ids: List[str]) -> List[dict]:
+        db = get_read_database()
+        cursor = db.users.find({"_id": {"$in": [ObjectId(user_id) for user_id in user_ids]}})
+        return [user_data async for user_data in cursor]
+
+    async def find_by(self, field: str, value) -> Optional[dict]:
+        if field not in self.LOOKUP_FIELDS:
+            raise ValueError(f"不支持按 {field} 查找用户")
+        db = get_database()
+        return await db.users.find_one({field: value})
+
+    async def insert(self, document: dict) -> Optional[str]:
+        db = get_database()
+        document["search"] = {field: normalize_search_value(document.get(field)) for field in SEARCH_FIELDS}
+        try:
+            result = await db.users.insert_one(document)
+        except DuplicateKeyError:
+            # 并发注册时另一请求已先写入，由唯一索引拒绝
+            return None
+        await record_write(str(result.inserted_id))
+        return str(result.inserted_id)
+
+    async def insert_many(self, documents: List[dict]) -> Tuple[int, List[dict]]:
+        if not documents:
+            return 0, []
+        for document in documents:
+            document["search"] = {field: normalize_search_value(document.get(field)) for field in SEARCH_FIELDS}
+        try:
+            result = await get_database().users.insert_many(documents, ordered=False)
+            return len(result.inserted_ids), []
+        except BulkWriteError as e:
+            failures = [
+                {
+                    "index": error["index"],
+                    "code": error["code"],
+                    "key": error.get("keyValue"),
+                    "message": error.get("errmsg"),
+                }
+                for error in e.details.get("writeErrors", [])
+            ]
+            return e.details.get("nInserted", 0), failures
+
+    async def update(self, user_id: str, fields: dict, expected: dict = None) -> bool:
+        db = get_database()
+        query = {"_id": ObjectId(user_id), **(expected or {})}
+        result = await db.users.update_one(query, {"$set": {**fields, **search_fields(fields)}})
+        await record_write(user_id)
+        return result.modified_count > 0
+
+    async def update_and_get(self, user_id: str, fields: dict) -> Optional[dict]:
+        # 同一因果一致性会话内先写后读，读落在从库也能看到本次更新
+        db = get_database()
+        async with causal_session() as session:
+            await db.users.update_one(
+                {"_id": ObjectId(user_id)},
+                {"$set": {**fields, **search_fields(fields)}},
+                session=session
+            )
+            user_data = await get_read_database().users.find_one(
+                {"_id": ObjectId(user_id)}, session=session
+            )
+        await record_write(user_id)
+        return user_data
+
+    async def find_expired_vip_ids(self, now: datetime, limit: int) -> List[str]:
+        db = get_database()
+        # 走 vip_expire_time_1__id_1 部分索引，按到期时间顺序扫描，不会触及非VIP用户
+        cursor = db.users.find(
+            {"is_vip": True, "vip_expire_time": {"$lt": now}},
+            {"_id": 1}
+        ).sort("vip_expire_time", 1).limit(limit).hint("vip_expire_time_1__id_1")
+        return [str(user_data["_id"]) async for user_data in cursor]
+
+    async def downgrade_vips(self, user_ids: List[str], now: datetime) -> int:
+        if not user_ids:
+            return 0
+        db = get_database()
+        result = await db.users.update_many(
+            {
+                "_id": {"$in": [ObjectId(user_id) for user_id in user_ids]},
+                "is_vip": True,
+                "vip_expire_time": {"$lt": now}
+            },
+            {"$set": {"is_vip": False, "vip_level": 0, "updated_at": now}}
+        )
+        # 从库可能仍是VIP状态，这些用户随后的鉴权读取走主库
+        await record_writes(user_ids)
+        return result.modified_count
+
+    # 列表只返回管理后台展示需要的字段
+    LIST_PROJECTION = {
+        "username": 1, "email": 1, "phone": 1, "nickname": 1, "avatar": 1,
+        "is_active": 1, "is_verified": 1, "is_vip": 1, "vip_level": 1, "vip_expire_time": 1,
+        "created_at": 1, "last_login": 1,
+    }
+
+    async def list_users(self, filters: dict, limit: int, sort: str = "_id",
+                         search: Optional[Tuple[str, str]] = None, after: Optional[tuple] = None) -> List[dict]:
+        query = {
+            field: {"$in": [value, None]} if value == FILTER_DEFAULTS.get(field) else value
+            for field, value in filters.items()
+        }
+        projection = dict(self.LIST_PROJECTION)
+        if search is not None:
+            field, prefix = search
+            key, direction = f"search.{field}", ASCENDING
+            # 锚定开头的区分大小写正则可转为 search.<字段> 索引上的范围扫描
+            query[key] = {"$regex": f"^{re.escape(normalize_search_value(prefix))}"}
+            projection[key] = 1
+        elif sort == "created_at":
+            key, direction = "created_at", DESCENDING
+        else:
+            key, direction = "_id", DESCENDING
+
+        order = [(key, direction)] if key == "_id" else [(key, direction), ("_id", direction)]
+        if after is not None:
+            op = "$gt" if direction == ASCENDING else "$lt"
+            if key == "_id":
+                query["_id"] = {op: ObjectId(after[0])}
+            else:
+                query["$or"] = [
+                    {key: {op: after[0]}},
+                    {key: after[0], "_id": {op: ObjectId(after[1])}},
+                ]
+        cursor = get_read_database().users.find(query, projection).sort(order).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def backfill_search_fields(self, batch_size: int = 1000) -> int:
+        db = get_database()
+        source = {field: 1 for field in SEARCH_FIELDS}
+        processed = 0
+        last_id = None
+        while True:
+            query = {"search": {"$exists": False}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = await db.users.find(query, source).sort("_id", ASCENDING).limit(batch_size).to_list(length=batch_size)
+            if not batch:
+                return processed
+            await db.users.bulk_write([
+                UpdateOne({"_id": user_data["_id"]}, {"$set": {
+                    "search": {field: normalize_search_value(user_data.get(field)) for field in SEARCH_FIELDS}
+                }})
+                for user_data in batch
+            ], ordered=False)
+            processed += len(batch)
+            last_id = batch[-1]["_id"]
+
+
+class MongoSessionRepository(SessionRepository):
+
+    async def insert(self, document: dict) -> None:
+        db = get_database()
+        await db.user_sessions.insert_one(document)
+
+    async def find_active(self, refresh_token: str, now: datetime) -> Optional[dict]:
+        db = get_database()
+        return await db.user_sessions.find_one({
+            "refresh_token": refresh_token,
+            "is_active": True,
+            "expires_at": {"$gt": now}
+        })
+
+    async def deactivate(self, refresh_token: str) -> bool:
+        db = get_database()
+        result = await db.user_sessions.update_one(
+            {"refresh_token": refresh_token},
+            {"$set": {"is_active": False}}
+        )
+        return result.modified_count > 0
+
+
+# 单机 mongod 不支持事务时返回的错误码（IllegalOperation）
+TRANSACTIONS_UNSUPPORTED = 20
+
+
+class MongoSubscriptionRepository(SubscriptionRepository):
+
+    # 连接的是单机 mongod 时置为False，之后的购买直接走非事务路径
+    transactions_supported: Optional[bool] = None
+
+    async def insert(self, document: dict) -> str:
+        db = get_database()
+        result = await db.vipsubscriptions.insert_one(document)
+        return str(result.inserted_id)
+
+    async def list_by_user(self, user_id: str, limit: int = 20,
+                           before: Optional[Tuple[datetime, str]] = None) -> List[dict]:
+        db = await get_user_read_database(user_id)
+        query = {"user_id": ObjectId(user_id)}
+        if before is not None:
+            created_at, last_id = before
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": ObjectId(last_id)}},
+            ]
+        # 走 user_id_1_created_at_-1__id_-1 索引，翻页不需要skip
+        cursor = db.vipsubscriptions.find(query).sort(
+            [("created_at", DESCENDING), ("_id", DESCENDING)]
+        ).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def get_by_transaction_id(self, transaction_id: str) -> Optional[dict]:
+        db = get_database()
+        return await db.vipsubscriptions.find_one({"transaction_id": transaction_id})
+
+    @staticmethod
+    def _vip_update(vip_level: int, days: Optional[int], now: datetime) -> list:
+        """用聚合管道在服务器端计算新的VIP状态，不需要先读出用户"""
+        if days is None:
+            expire_time = {"$literal": None}
+        else:
+            # 终身会员（仍是VIP且没有到期时间）购买期限套餐不改变到期时间
+            is_lifetime = {"$and": [
+                {"$eq": ["$is_vip", True]},
+                {"$eq": [{"$ifNull": ["$vip_expire_time", None]}, None]},
+            ]}
+            expire_time = {"$cond": [
+                is_lifetime,
+                {"$literal": None},
+                {"$add": [{"$max": ["$vip_expire_time", now]}, days * 24 * 3600 * 1000]},
+            ]}
+        return [{"$set": {
+            "is_vip": {"$literal": True},
+            "vip_level": {"$max": [{"$ifNull": ["$vip_level", 0]}, vip_level]},
+            "vip_expire_time": expire_time,
+            "updated_at": now,
+        }}]
+
+    async def purchase(self, document: dict, debit: float, vip_level: int,
+                       days: Optional[int], now: datetime) -> Tuple[dict, bool]:
+        db = get_database()
+        user_id = document["user_id"]
+
+        # 重复提交的快速路径；并发的重复提交由 transaction_id 唯一索引拦截
+        existing = await self.get_by_transaction_id(document["transaction_id"])
+        if existing is not None:
+            return existing, False
+
+        async def apply(session):
+            if debit > 0:
+                result = await db.users.update_one(
+                    {"_id": user_id, "vip_balance": {"$gte": debit}},
+                    {"$inc": {"vip_balance": -debit}},
+                    session=session
+                )
+                if result.matched_count == 0:
+                    raise InsufficientBalanceError()
+            user_data = await db.users.find_one_and_update(
+                {"_id": user_id},
+                self._vip_update(vip_level, days, now),
+                projection={"vip_expire_time": 1},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            end_date = user_data.get("vip_expire_time") if user_data else None
+            document["end_date"] = end_date
+            document["start_date"] = end_date - timedelta(days=days) if days and end_date else now
+            await db.vipsubscriptions.insert_one(document, session=session)
+
+        if self.transactions_supported is False:
+            return await self._purchase_without_transaction(document, debit, vip_level, days, now)
+
+        # 扣款、延长会员和写入流水在同一事务中，任何一步失败都不会留下部分修改；
+        # 同一用户的并发购买产生写冲突时 with_transaction 会自动重试
+        async with await db.client.start_session() as session:
+            try:
+                await session.with_transaction(apply)
+            except DuplicateKeyError:
+                document.pop("_id", None)
+                return await self.get_by_transaction_id(document["transaction_id"]), False
+            except OperationFailure as e:
+                # 单机部署：事务中的第一个操作即被拒绝，尚未修改任何数据
+                if e.code != TRANSACTIONS_UNSUPPORTED:
+                    raise
+                MongoSubscriptionRepository.transactions_supported = False
+                document.pop("_id", None)
+                return await self._purchase_without_transaction(document, debit, vip_level, days, now)
+        MongoSubscriptionRepository.transactions_supported = True
+        await record_write(str(user_id))
+        return document, True
+
+    async def _purchase_without_transaction(self, document: dict, debit: float, vip_level: int,
+                                            days: Optional[int], now: datetime) -> Tuple[dict, bool]:
+        """单机 mongod 上的购买：不使用事务，按步骤执行并在扣款失败时撤销
+
+        先以 pending 状态写入流水，由 transaction_id 唯一索引保证同一交易只处理一次；
+        扣款带余额条件，余额不足时删除流水；最后延长会员并把流水置为 active。
+        进程在两步之间退出时会留下 pending 流水，需要人工核对。
+        """
+        db = get_database()
+        user_id = document["user_id"]
+        status = document["status"]
+        document.update({"status": "pending", "start_date": now, "end_date": None})
+        try:
+            await db.vipsubscriptions.insert_one(document)
+        except DuplicateKeyError:
+            document.pop("_id", None)
+            return await self.get_by_transaction_id(document["transaction_id"]), False
+
+        if debit > 0:
+            result = await db.users.update_one(
+                {"_id": user_id, "vip_balance": {"$gte": debit}},
+                {"$inc": {"vip_balance": -debit}}
+            )
+            if result.matched_count == 0:
+                await db.vipsubscriptions.delete_one({"_id": document["_id"]})
+                raise InsufficientBalanceError()
+        user_data = await db.users.find_one_and_update(
+            {"_id": user_id},
+            self._vip_update(vip_level, days, now),
+            projection={"vip_expire_time": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        end_date = user_data.get("vip_expire_time") if user_data else None
+        document["status"] = status
+        document["end_date"] = end_date
+        document["start_date"] = end_date - timedelta(days=days) if days and end_date else now
+        await db.vipsubscriptions.update_one({"_id": document["_id"]}, {"$set": {
+            "status": status, "start_date": document["start_date"], "end_date": end_date,
+        }})
+        await record_write(str(user_id))
+        return document, True
+
+
+class MongoAnalyticsRepository(AnalyticsRepository):
+
+    async def apply(self, rollups: List[dict]) -> None:
+        requests = []
+        for rollup in rollups:
+            update = {}
+            if rollup["counters"]:
+                update["$inc"] = {f"counters.{path}": value for path, value in rollup["counters"].items()}
+            registers = {
+                f"hll.{name}.{index}": rank
+                for name, sketch in rollup["hll"].items()
+                for index, rank in sketch.items()
+            }
+            if registers:
+                update["$max"] = registers
+            if rollup.get("expire_at"):
+                update["$setOnInsert"] = {"expire_at": rollup["expire_at"]}
+            if update:
+                requests.append(UpdateOne({"_id": rollup["_id"]}, update, upsert=True))
+        if requests:
+            # 各桶互不相关，无序执行一次往返写完
+            await get_database().analytics_rollups.bulk_write(requests, ordered=False)
+
+    async def get_many(self, bucket_ids: List[str]) -> List[dict]:
+        cursor = get_read_database().analytics_rollups.find({"_id": {"$in": bucket_ids}})
+        return [rollup async for rollup in cursor]
+
+
+class MongoExportRepository(ExportRepository):
+
+    async def iter_documents(self, collection: str, user_id: Optional[str] = None,
+                             lower: Optional[str] = None, upper: Optional[str] = None,
+                             batch_size: int = 1000) -> AsyncIterator[dict]:
+        if collection not in EXPORT_COLLECTIONS:
+            raise ValueError(f"不支持导出集合: {collection}")
+        query, id_conditions = {}, {}
+        if user_id is not None:
+            if collection == "users":
+                id_conditions["$eq"] = ObjectId(user_id)
+            else:
+                query["user_id"] = ObjectId(user_id)
+        if lower is not None:
+            id_conditions["$gte"] = ObjectId(lower)
+        if upper is not None:
+            id_conditions["$lt"] = ObjectId(upper)
+        if id_conditions:
+            query["_id"] = id_conditions
+        # 导出走从库，按 _id 索引顺序分批读取，不在服务器端排序
+        cursor = get_read_database()[collection].find(
+            query,
+            {field: 0 for field in EXPORT_EXCLUDED_FIELDS}
+        ).sort("_id", ASCENDING).batch_size(batch_size)
+        async for document in cursor:
+            yield document
+
+    async def split_points(self, collection: str, partitions: int) -> List[str]:
+        if partitions <= 1:
+            return []
+        # 随机抽样估计 _id 的分位点，$sample 在抽样比例较小时不扫描全集合
+        sample = await get_read_database()[collection].aggregate([
+            {"$sample": {"size": min(10000, partitions * 100)}},
+            {"$project": {"_id": 1}},
+        ]).to_list(length=None)
+        ids = sorted({document["_id"] for document in sample})
+        if len(ids) < partitions:
+            return []
+        return [str(ids[len(ids) * i // partitions]) for i in range(1, partitions)]
+
+
+def create_mongo_repositories() -> Repositories:
+    return Repositories(
+        users=MongoUserRepository(),
+        sessions=MongoSessionRepository(),
+        subscriptions=MongoSubscriptionRepository(),
+        analytics=MongoAnalyticsRepository(),
+        export=MongoExportRepository(),
+    )
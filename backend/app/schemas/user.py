@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr, validator
 from typing import Optional
 from datetime import datetime
+import re
 
 # 基础用户模式
 class UserBase(BaseModel):
@@ -26,6 +27,49 @@ class UserCreate(BaseModel):
     wechat_openid: Optional[str] = None
     wechat_unionid: Optional[str] = None
 
+# 批量导入的一行，password 为明文，hashed_password 为已有的bcrypt哈希（二选一，可都为空）
+class UserImportRow(BaseModel):
+    username: Optional[str] = None
+    email: Optional[EmailStr] = None
+    phone: Optional[str] = None
+    password: Optional[str] = None
+    hashed_password: Optional[str] = None
+    nickname: Optional[str] = None
+    avatar: Optional[str] = None
+    gender: Optional[str] = None
+    birthday: Optional[datetime] = None
+    bio: Optional[str] = None
+    wechat_openid: Optional[str] = None
+    wechat_unionid: Optional[str] = None
+    is_active: bool = True
+    is_verified: bool = False
+    email_verified: bool = False
+    phone_verified: bool = False
+    is_vip: bool = False
+    vip_level: int = 0
+    vip_expire_time: Optional[datetime] = None
+    vip_balance: float = 0.0
+    created_at: Optional[datetime] = None
+    last_login: Optional[datetime] = None
+
+    @validator("phone")
+    def validate_phone(cls, v):
+        if v is not None and not re.match(r"^1[3-9]\d{9}$", v):
+            raise ValueError("手机号格式不正确")
+        return v
+
+    @validator("password")
+    def validate_password(cls, v):
+        if v is not None and len(v) < 6:
+            raise ValueError("密码长度至少6位")
+        return v
+
+    @validator("hashed_password")
+    def validate_hashed_password(cls, v):
+        if v is not None and not re.match(r"^\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}$", v):
+            raise ValueError("只接受bcrypt格式的密码哈希")
+        return v
+
 # 用户注册
 class UserRegister(BaseModel):
     username: Optional[str] = None
@@ -118,7 +162,8 @@ class VIPSubscriptionCreate(BaseModel):
     plan_type: str  # monthly, yearly, lifetime
     amount: float
     currency: str = "CNY"
-    payment_method: Optional[str] = None
+    payment_method: Optional[str] = None  # balance: 从VIP余额扣款
+    transaction_id: Optional[str] = None  # 支付流水号，重复提交同一流水号只生效一次
 
 class VIPSubscriptionResponse(BaseModel):
     id: str
@@ -128,7 +173,7 @@ class VIPSubscriptionResponse(BaseModel):
     currency: str
     status: str
     start_date: datetime
-    end_date: datetime
+    end_date: Optional[datetime] = None
     payment_method: Optional[str] = None
     transaction_id: Optional[str] = None
     created_at: datetime
@@ -0,0 +1,117 @@
+from app.core.tracing import trace_methods
+from app.repositories import get_repositories
+from app.repositories.base import FILTER_DEFAULTS, SEARCH_FIELDS
+from bson import ObjectId
+from datetime import datetime
+from typing import Optional, Tuple
+import base64
+import binascii
+import json
+
+# 单页上限，避免一次请求返回过多文档
+MAX_PAGE_SIZE = 100
+SORTS = ("_id", "created_at")
+
+
+def infer_search_field(query: str) -> str:
+    """未指定搜索字段时按内容推断：含@为邮箱，纯数字为手机号，否则为用户名"""
+    if "@" in query:
+        return "email"
+    if query.isdigit():
+        return "phone"
+    return "username"
+
+def encode_cursor(mode: str, user_data: dict) -> str:
+    """游标记录排序方式和上一页最后一条的排序键，对客户端不透明"""
+    if mode == "created_at":
+        key = [user_data["created_at"].isoformat(), str(user_data["_id"])]
+    elif mode == "_id":
+        key = [str(user_data["_id"])]
+    else:
+        key = [user_data["search"][mode.split(":", 1)[1]], str(user_data["_id"])]
+    raw = json.dumps([mode, key], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, mode: str) -> Optional[tuple]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        cursor_mode, key = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    # 游标只能用于生成它的同一种排序/搜索
+    if cursor_mode != mode or not key or not ObjectId.is_valid(key[-1]):
+        return None
+    if mode == "created_at":
+        try:
+            return datetime.fromisoformat(key[0]), key[1]
+        except (TypeError, ValueError):
+            return None
+    return tuple(key)
+
+
+def directory_entry(user_data: dict) -> dict:
+    return {
+        "id": str(user_data["_id"]),
+        "username": user_data.get("username"),
+        "email": user_data.get("email"),
+        "phone": user_data.get("phone"),
+        "nickname": user_data.get("nickname"),
+        "avatar": user_data.get("avatar"),
+        "is_active": user_data.get("is_active", FILTER_DEFAULTS["is_active"]),
+        "is_verified": user_data.get("is_verified", False),
+        "is_vip": user_data.get("is_vip", FILTER_DEFAULTS["is_vip"]),
+        "vip_level": user_data.get("vip_level", FILTER_DEFAULTS["vip_level"]),
+        "vip_expire_time": user_data.get("vip_expire_time"),
+        "created_at": user_data.get("created_at"),
+        "last_login": user_data.get("last_login"),
+    }
+
+
+@trace_methods
+class AdminService:
+
+    @staticmethod
+    async def list_users(limit: int = 20, cursor: Optional[str] = None, sort: str = "_id",
+                         query: Optional[str] = None, search_field: Optional[str] = None,
+                         is_active: Optional[bool] = None, is_vip: Optional[bool] = None,
+                         vip_level: Optional[int] = None) -> Tuple[Optional[dict], str]:
+        """用户目录：按筛选条件和前缀搜索返回一页用户，next_cursor 为空表示没有更多
+
+        搜索时结果按搜索字段的小写值排序，否则按 _id 或 created_at 从新到旧。
+        """
+        if sort not in SORTS:
+            return None, "不支持的排序字段"
+        search = None
+        mode = sort
+        if query and query.strip():
+            search_field = search_field or infer_search_field(query.strip())
+            if search_field not in SEARCH_FIELDS:
+                return None, "不支持的搜索字段"
+            search = (search_field, query)
+            mode = f"search:{search_field}"
+
+        after = None
+        if cursor:
+            after = decode_cursor(cursor, mode)
+            if after is None:
+                return None, "无效的分页游标"
+
+        filters = {}
+        if is_active is not None:
+            filters["is_active"] = is_active
+        if is_vip is not None:
+            filters["is_vip"] = is_vip
+        if vip_level is not None:
+            filters["vip_level"] = vip_level
+
+        limit = min(limit, MAX_PAGE_SIZE)
+        users = await get_repositories().users.list_users(filters, limit, sort, search, after)
+        return {
+            "items": [directory_entry(user_data) for user_data in users],
+            "next_cursor": encode_cursor(mode, users[-1]) if len(users) == limit else None,
+        }, "获取成功"
+
+    @staticmethod
+    async def backfill_search_fields() -> int:
+        """为存量用户补齐搜索用的小写字段，部署本功能后执行一次"""
+        return await get_repositories().users.backfill_search_fields()
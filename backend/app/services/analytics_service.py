@@ -0,0 +1,176 @@
+from app.core.config import settings
+from app.core.hyperloglog import hll_estimate, hll_merge, hll_register
+from app.core.tracing import trace_methods
+from app.repositories import get_repositories
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+GRANULARITIES = ("hour", "day", "month")
+MAX_SERIES_POINTS = 1000
+
+
+def bucket_id(granularity: str, moment: datetime) -> str:
+    """统计桶ID（UTC）：hour:2024-01-31T08 / day:2024-01-31 / month:2024-01"""
+    if granularity == "hour":
+        return f"hour:{moment:%Y-%m-%dT%H}"
+    if granularity == "day":
+        return f"day:{moment:%Y-%m-%d}"
+    return f"month:{moment:%Y-%m}"
+
+def bucket_range(granularity: str, start: datetime, end: datetime) -> List[str]:
+    """start 到 end（含）之间各桶的ID"""
+    ids = []
+    moment = start
+    while moment <= end and len(ids) <= MAX_SERIES_POINTS:
+        ids.append(bucket_id(granularity, moment))
+        if granularity == "hour":
+            moment += timedelta(hours=1)
+        elif granularity == "day":
+            moment += timedelta(days=1)
+        else:
+            moment = (moment.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return ids
+
+
+class RollupBuffer:
+    """在进程内累加统计事件，由定时任务合并写入 analytics_rollups
+
+    记录事件只修改字典，不访问数据库；每个事件同时计入小时、天、月三个桶。
+    计数器和HyperLogLog寄存器在缓冲区内先行合并，一个刷新周期内无论发生多少事件，
+    每个桶最多产生一次upsert（$inc 计数器，$max 寄存器）。
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Counter] = {}
+        self._sketches: Dict[str, Dict[str, Dict[str, int]]] = {}
+
+    def _record(self, user_id: str, counter: Optional[str], now: datetime = None):
+        if not settings.analytics_enabled:
+            return
+        now = now or datetime.utcnow()
+        index, rank = hll_register(user_id)
+        index = str(index)
+        for granularity in GRANULARITIES:
+            bucket = bucket_id(granularity, now)
+            if counter:
+                self._counters.setdefault(bucket, Counter())[counter] += 1
+            registers = self._sketches.setdefault(bucket, {}).setdefault("active", {})
+            if rank > registers.get(index, 0):
+                registers[index] = rank
+
+    def record_registration(self, user_id: str, login_type: str):
+        self._record(user_id, f"registrations.{login_type}")
+
+    def record_login(self, user_id: str, method: str):
+        self._record(user_id, f"logins.{method}")
+
+    def record_activity(self, user_id: str):
+        """只计入活跃用户（如刷新令牌），不增加计数器"""
+        self._record(user_id, None)
+
+    def record_vip_purchase(self, user_id: str, plan_type: str, conversion: bool):
+        self._record(user_id, f"vip.purchases.{plan_type}")
+        if conversion:
+            self._record(user_id, "vip.conversions")
+
+    def drain(self) -> List[dict]:
+        """取出缓冲区中的全部增量"""
+        counters, sketches = self._counters, self._sketches
+        self._counters, self._sketches = {}, {}
+        retention = timedelta(days=settings.analytics_hourly_retention_days)
+        rollups = []
+        for bucket in counters.keys() | sketches.keys():
+            expire_at = None
+            if bucket.startswith("hour:"):
+                expire_at = datetime.strptime(bucket[5:], "%Y-%m-%dT%H") + retention
+            rollups.append({
+                "_id": bucket,
+                "counters": dict(counters.get(bucket, {})),
+                "hll": sketches.get(bucket, {}),
+                "expire_at": expire_at,
+            })
+        return rollups
+
+    def restore(self, rollups: List[dict]):
+        """写入失败时把增量放回缓冲区，下次刷新重试"""
+        for rollup in rollups:
+            self._counters.setdefault(rollup["_id"], Counter()).update(rollup["counters"])
+            buffered = self._sketches.setdefault(rollup["_id"], {})
+            for name, sketch in rollup["hll"].items():
+                buffered[name] = hll_merge([buffered.get(name, {}), sketch])
+
+
+analytics = RollupBuffer()
+
+
+def _active(rollup: Optional[dict]) -> int:
+    return hll_estimate(rollup["hll"].get("active", {})) if rollup and rollup.get("hll") else 0
+
+
+@trace_methods
+class AnalyticsService:
+
+    @staticmethod
+    async def flush() -> int:
+        """把缓冲的增量写入数据库，返回写入的桶数"""
+        rollups = analytics.drain()
+        if not rollups:
+            return 0
+        try:
+            await get_repositories().analytics.apply(rollups)
+        except BaseException:
+            # 包括关闭时定时任务被取消，增量放回缓冲区由最后一次刷新写出
+            analytics.restore(rollups)
+            raise
+        return len(rollups)
+
+    @staticmethod
+    async def summary(day: date) -> dict:
+        """某一天的看板数据：当天计数器、DAU，以及截至当天的滚动7天/30天活跃用户
+
+        最多读取31个文档，合并1024个寄存器，耗时与用户数无关。
+        """
+        end = datetime(day.year, day.month, day.day)
+        day_ids = bucket_range("day", end - timedelta(days=29), end)
+        month_id = bucket_id("month", end)
+        rollups = {
+            rollup["_id"]: rollup
+            for rollup in await get_repositories().analytics.get_many(day_ids + [month_id])
+        }
+        sketches = [rollups[bucket]["hll"].get("active", {}) for bucket in day_ids
+                    if bucket in rollups and rollups[bucket].get("hll")]
+        week_sketches = [rollups[bucket]["hll"].get("active", {}) for bucket in day_ids[-7:]
+                         if bucket in rollups and rollups[bucket].get("hll")]
+        today = rollups.get(day_ids[-1])
+        return {
+            "date": day.isoformat(),
+            "counters": today.get("counters", {}) if today else {},
+            "dau": _active(today),
+            "wau": hll_estimate(hll_merge(week_sketches)),
+            "mau": hll_estimate(hll_merge(sketches)),
+            "month_active": _active(rollups.get(month_id)),
+        }
+
+    @staticmethod
+    async def series(granularity: str, start: datetime, end: datetime) -> Tuple[Optional[List[dict]], str]:
+        """按小时/天/月返回区间内每个桶的计数器和活跃用户数"""
+        if granularity not in GRANULARITIES:
+            return None, "不支持的时间粒度"
+        if start > end:
+            return None, "开始时间不能晚于结束时间"
+        bucket_ids = bucket_range(granularity, start, end)
+        if len(bucket_ids) > MAX_SERIES_POINTS:
+            return None, f"时间范围过大，最多{MAX_SERIES_POINTS}个数据点"
+        rollups = {
+            rollup["_id"]: rollup
+            for rollup in await get_repositories().analytics.get_many(bucket_ids)
+        }
+        return [
+            {
+                "bucket": bucket.split(":", 1)[1],
+                "counters": rollups[bucket].get("counters", {}) if bucket in rollups else {},
+                "active": _active(rollups.get(bucket)),
+            }
+            for bucket in bucket_ids
+        ], "获取成功"
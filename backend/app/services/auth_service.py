@@ -1,17 +1,21 @@
 from app.models.user import UserModel, VerificationCodeModel, UserSessionModel, PyObjectId
 from app.schemas.user import UserRegister, UserLogin, WechatLogin
 from app.core.security import (
-    verify_password, get_password_hash, create_access_token, 
+    verify_password_async, password_needs_update, create_access_token, 
     create_refresh_token, verify_token
 )
-from app.core.database import get_database
+from app.repositories import get_repositories
+from app.core.config import settings
+from app.core.deadline import max_time_ms
+from app.core.tracing import trace_methods, traced_http_request
 from app.services.user_service import UserService
+from app.services.analytics_service import analytics
 from datetime import datetime, timedelta
-import requests
 from typing import Optional, Tuple
 import re
 from bson import ObjectId
 
+@trace_methods
 class AuthService:
     
     @staticmethod
@@ -52,7 +56,7 @@ class AuthService:
                                      code_type: str = "login") -> Tuple[str, int]:
         """创建验证码"""
         code = await UserService.generate_verification_code(phone, email, code_type)
-        return code, 300  # 5分钟过期
+        return code, settings.verification_code_expire_seconds
     
     @staticmethod
     async def verify_code(phone: str = None, email: str = None, 
@@ -85,6 +89,8 @@ class AuthService:
             )
             
             user, message = await UserService.create_user(user_create)
+            if user:
+                analytics.record_registration(str(user.id), "password")
             return user, message
             
         elif user_data.login_type == "sms":
@@ -115,11 +121,8 @@ class AuthService:
             user, message = await UserService.create_user(user_create)
             if user:
                 # 更新手机号验证状态
-                db = get_database()
-                await db.users.update_one(
-                    {"_id": user.id},
-                    {"$set": {"phone_verified": True}}
-                )
+                await get_repositories().users.update(str(user.id), {"phone_verified": True})
+                analytics.record_registration(str(user.id), "sms")
             
             return user, message
         
@@ -137,9 +140,13 @@ class AuthService:
             if not user or not user.hashed_password:
                 return None, "用户名或密码错误"
             
-            if not verify_password(login_data.password, user.hashed_password):
+            if not await verify_password_async(login_data.password, user.hashed_password):
                 return None, "用户名或密码错误"
             
+            # 哈希方案或cost已变更时在后台重新计算
+            if password_needs_update(user.hashed_password):
+                UserService.schedule_password_rehash(str(user.id), login_data.password, user.hashed_password)
+            
         elif login_data.login_type == "sms":
             if not login_data.phone or not login_data.verification_code:
                 return None, "手机号和验证码不能为空"
@@ -164,11 +171,8 @@ class AuthService:
             return None, "账户已被禁用"
         
         # 更新最后登录时间
-        db = get_database()
-        await db.users.update_one(
-            {"_id": user.id},
-            {"$set": {"last_login": datetime.utcnow()}}
-        )
+        await get_repositories().users.update(str(user.id), {"last_login": datetime.utcnow()})
+        analytics.record_login(str(user.id), login_data.login_type)
         
         return user, "登录成功"
     
@@ -190,7 +194,7 @@ class AuthService:
                 "grant_type": "authorization_code"
             }
             
-            response = requests.get(token_url, params=token_params)
+            response = traced_http_request("GET", token_url, params=token_params, timeout=max_time_ms(10000) / 1000)
             token_data = response.json()
             
             if "errcode" in token_data:
@@ -210,24 +214,19 @@ class AuthService:
                 "lang": "zh_CN"
             }
             
-            response = requests.get(user_info_url, params=user_params)
+            response = traced_http_request("GET", user_info_url, params=user_params, timeout=max_time_ms(10000) / 1000)
             user_info = response.json()
             
             if "errcode" in user_info:
                 return None, f"获取微信用户信息失败: {user_info.get('errmsg', '未知错误')}"
             
             # 查找或创建用户
-            db = get_database()
-            user_data = await db.users.find_one({"wechat_openid": openid})
+            user = await UserService.get_user_by_wechat_openid(openid)
             
-            if user_data:
-                user_data["_id"] = PyObjectId(user_data["_id"])
-                user = UserModel(**user_data)
+            if user:
                 # 更新最后登录时间
-                await db.users.update_one(
-                    {"_id": user.id},
-                    {"$set": {"last_login": datetime.utcnow()}}
-                )
+                await get_repositories().users.update(str(user.id), {"last_login": datetime.utcnow()})
+                analytics.record_login(str(user.id), "wechat")
                 return user, "登录成功"
             else:
                 # 创建新用户
@@ -240,6 +239,8 @@ class AuthService:
                 )
                 
                 user, message = await UserService.create_user(user_create)
+                if user:
+                    analytics.record_registration(str(user.id), "wechat")
                 return user, message
                 
         except Exception as e:
@@ -268,8 +269,7 @@ class AuthService:
             expires_at=datetime.utcnow() + timedelta(days=7)
         )
         
-        db = get_database()
-        await db.user_sessions.insert_one(session.dict())
+        await get_repositories().sessions.insert(session.dict())
         return session
     
     @staticmethod
@@ -282,18 +282,14 @@ class AuthService:
                 return None
             
             # 验证刷新令牌是否在数据库中
-            db = get_database()
-            session_data = await db.user_sessions.find_one({
-                "refresh_token": refresh_token,
-                "is_active": True,
-                "expires_at": {"$gt": datetime.utcnow()}
-            })
+            session_data = await get_repositories().sessions.find_active(refresh_token, datetime.utcnow())
             
             if not session_data:
                 return None
             
             # 创建新的访问令牌
             access_token = create_access_token(data={"sub": user_id})
+            analytics.record_activity(user_id)
             return access_token
             
         except Exception:
@@ -303,11 +299,6 @@ class AuthService:
     async def logout_user(refresh_token: str) -> bool:
         """用户登出"""
         try:
-            db = get_database()
-            result = await db.user_sessions.update_one(
-                {"refresh_token": refresh_token},
-                {"$set": {"is_active": False}}
-            )
-            return result.modified_count > 0
+            return await get_repositories().sessions.deactivate(refresh_token)
         except Exception:
             return False 
\ No newline at end of file
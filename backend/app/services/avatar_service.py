@@ -0,0 +1,156 @@
+from app.core.admission import AdmissionController
+from app.core.config import settings
+from app.core.tracing import trace_methods
+from app.repositories import get_repositories
+from datetime import datetime
+from typing import AsyncIterator, Optional, Tuple
+import aiofiles
+import aiofiles.os
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from PIL import Image, ImageOps
+
+# 接受的原图格式（以解码结果为准，不信任扩展名和Content-Type）
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+
+AVATAR_DIR = os.path.join(settings.upload_dir, "avatars")
+
+# 解码和缩放在专用线程池中执行，Pillow在这些操作中会释放GIL
+image_admission = AdmissionController(
+    "image-processing",
+    concurrency=settings.image_processing_concurrency or os.cpu_count() or 1,
+    latency_budget=settings.image_processing_latency_budget_ms / 1000,
+    initial_service_time=0.05
+)
+
+
+class UploadTooLarge(Exception):
+    """上传内容超过 max_file_size"""
+
+
+def avatar_path(digest: str) -> str:
+    """内容寻址的存储目录：avatars/<前两位>/<sha256>"""
+    return os.path.join(AVATAR_DIR, digest[:2], digest)
+
+def avatar_url(digest: str, size: int = None, ext: str = "webp") -> str:
+    return f"/uploads/avatars/{digest[:2]}/{digest}/{size or settings.avatar_sizes[0]}.{ext}"
+
+def variant_names() -> list:
+    return [f"{size}.{ext}" for size in settings.avatar_sizes for ext in ("webp", "jpg")]
+
+def avatar_exists(digest: str) -> bool:
+    directory = avatar_path(digest)
+    return all(os.path.exists(os.path.join(directory, name)) for name in variant_names())
+
+
+def render_variants(source_path: str, digest: str) -> Optional[str]:
+    """解码原图并生成各尺寸的WebP/JPEG，成功返回None，图片无效时返回错误信息
+
+    在线程池中执行。先写入临时目录再整体改名，其他请求不会看到生成了一半的目录。
+    """
+    sizes = sorted(settings.avatar_sizes, reverse=True)
+    try:
+        with Image.open(source_path) as image:
+            if image.format not in ALLOWED_FORMATS:
+                return "不支持的图片格式"
+            if image.width * image.height > settings.avatar_max_pixels:
+                return "图片尺寸过大"
+            # JPEG可以在解码时直接按2的幂缩小，大图只解码需要的分辨率
+            image.draft("RGB", (sizes[0], sizes[0]))
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return "无法识别的图片文件"
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    # 居中裁剪为正方形，再从大到小逐级缩放
+    image = ImageOps.fit(image, (sizes[0], sizes[0]), Image.LANCZOS)
+
+    final_dir = avatar_path(digest)
+    os.makedirs(os.path.dirname(final_dir), exist_ok=True)
+    tmp_dir = os.path.join(os.path.dirname(final_dir), f".{digest}.{uuid.uuid4().hex}.tmp")
+    os.makedirs(tmp_dir)
+    try:
+        for size in sizes:
+            if image.width != size:
+                image = image.resize((size, size), Image.LANCZOS)
+            image.save(os.path.join(tmp_dir, f"{size}.webp"), "WEBP",
+                       quality=settings.avatar_webp_quality, method=4)
+            flat = image
+            if has_alpha:
+                flat = Image.new("RGB", image.size, (255, 255, 255))
+                flat.paste(image, mask=image.getchannel("A"))
+            flat.save(os.path.join(tmp_dir, f"{size}.jpg"), "JPEG",
+                      quality=settings.avatar_jpeg_quality, optimize=True, progressive=True)
+        try:
+            os.rename(tmp_dir, final_dir)
+        except OSError:
+            # 相同内容被并发上传，对方已经生成完毕
+            if not avatar_exists(digest):
+                shutil.rmtree(final_dir, ignore_errors=True)
+                os.rename(tmp_dir, final_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return None
+
+
+@trace_methods
+class AvatarService:
+
+    CHUNK_SIZE = 64 * 1024
+
+    @staticmethod
+    async def save_upload(chunks: AsyncIterator[bytes]) -> Tuple[str, str, int]:
+        """把请求体分块写入临时文件，边写边计算sha256，超过 max_file_size 立即中止
+
+        返回 (临时文件路径, sha256, 字节数)，调用方负责删除临时文件。
+        """
+        fd, tmp_path = tempfile.mkstemp(prefix="avatar-", suffix=".upload")
+        os.close(fd)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if size > settings.max_file_size:
+                        raise UploadTooLarge()
+                    digest.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            await aiofiles.os.remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest(), size
+
+    @staticmethod
+    async def upload_avatar(user_id: str, chunks: AsyncIterator[bytes]) -> Tuple[Optional[dict], str]:
+        """保存头像并更新用户资料，相同内容的图片只处理一次"""
+        tmp_path, digest, size = await AvatarService.save_upload(chunks)
+        try:
+            if size == 0:
+                return None, "上传内容为空"
+            deduplicated = avatar_exists(digest)
+            if not deduplicated:
+                error = await image_admission.run(render_variants, tmp_path, digest)
+                if error:
+                    return None, error
+        finally:
+            await aiofiles.os.remove(tmp_path)
+
+        url = avatar_url(digest)
+        await get_repositories().users.update(user_id, {"avatar": url, "updated_at": datetime.utcnow()})
+        return {
+            "avatar": url,
+            "variants": {
+                str(size): {ext: avatar_url(digest, size, ext) for ext in ("webp", "jpg")}
+                for size in settings.avatar_sizes
+            },
+            "sha256": digest,
+            "deduplicated": deduplicated,
+        }, "头像上传成功"
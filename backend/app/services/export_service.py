@@ -0,0 +1,113 @@
+from app.core.config import settings
+from app.core.tracing import trace_methods
+from app.repositories import get_repositories
+from app.repositories.base import EXPORT_COLLECTIONS
+from bson import ObjectId
+from datetime import date, datetime
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+import hashlib
+import hmac
+import json
+import zlib
+
+FORMATS = ("ndjson", "gzip")
+# 攒够这么多字节再输出一次，减少小块写入
+FLUSH_BYTES = 64 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+def pseudonymize(value) -> str:
+    """用 secret_key 做HMAC，同一个值在各次导出中得到相同结果，便于在数仓中关联"""
+    digest = hmac.new(settings.secret_key.encode(), str(value).encode(), hashlib.sha256).hexdigest()
+    return f"hmac:{digest[:32]}"
+
+def redact_document(document: dict, redact: Iterable[str]) -> dict:
+    for field in redact:
+        if document.get(field) is not None:
+            document[field] = pseudonymize(document[field])
+    return document
+
+def encode_line(document: dict) -> bytes:
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode() + b"\n"
+
+
+class ExportEncoder:
+    """把NDJSON行编码为输出块，gzip格式时流式压缩"""
+
+    def __init__(self, fmt: str):
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的导出格式: {fmt}")
+        # wbits=31 输出带gzip头的流
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if fmt == "gzip" else None
+
+    def encode(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) if self._compressor else data
+
+    def finish(self) -> bytes:
+        return self._compressor.flush() if self._compressor else b""
+
+
+def export_filename(name: str, fmt: str) -> str:
+    return f"{name}.ndjson" + (".gz" if fmt == "gzip" else "")
+
+
+@trace_methods
+class ExportService:
+
+    @staticmethod
+    async def iter_lines(collection: str, user_id: Optional[str] = None, redact: Iterable[str] = (),
+                         lower: Optional[str] = None, upper: Optional[str] = None,
+                         wrap: bool = False) -> AsyncIterator[bytes]:
+        """逐条产出导出行；wrap 为True时每行为 {"collection": 集合, "document": 文档}"""
+        redact = tuple(redact)
+        documents = get_repositories().export.iter_documents(
+            collection, user_id, lower, upper, settings.export_batch_size
+        )
+        async for document in documents:
+            document = redact_document(document, redact)
+            yield encode_line({"collection": collection, "document": document} if wrap else document)
+
+    @staticmethod
+    async def stream(targets: List[Tuple[str, Optional[str]]], fmt: str = "ndjson", redact: Iterable[str] = (),
+                     lower: Optional[str] = None, upper: Optional[str] = None) -> AsyncIterator[bytes]:
+        """导出一个或多个 (集合, user_id)，产出编码后的数据块
+
+        同一时间只在内存中保留数据库的一批文档和不超过 FLUSH_BYTES 的待输出数据。
+        导出多个集合时每行带上集合名。
+        """
+        encoder = ExportEncoder(fmt)
+        buffer: List[bytes] = []
+        size = 0
+        for collection, user_id in targets:
+            async for line in ExportService.iter_lines(collection, user_id, redact, lower, upper,
+                                                       wrap=len(targets) > 1):
+                buffer.append(line)
+                size += len(line)
+                if size >= FLUSH_BYTES:
+                    chunk = encoder.encode(b"".join(buffer))
+                    buffer, size = [], 0
+                    if chunk:
+                        yield chunk
+        chunk = encoder.encode(b"".join(buffer)) + encoder.finish()
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    async def partitions(collection: str, count: int) -> List[Tuple[Optional[str], Optional[str]]]:
+        """把集合按 _id 划分为最多 count 个左闭右开区间，首尾区间不设边界"""
+        points = await get_repositories().export.split_points(collection, count)
+        bounds = [None, *points, None]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+
+def user_export_targets(user_id: str) -> List[Tuple[str, Optional[str]]]:
+    """单个用户的全部数据"""
+    return [(collection, user_id) for collection in EXPORT_COLLECTIONS]
@@ -0,0 +1,241 @@
+from app.core.config import settings
+from app.core.security import build_pwd_context, pwd_context
+from app.core.tracing import trace_methods
+from app.repositories import get_repositories
+from app.schemas.user import UserImportRow
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pydantic import ValidationError
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+import asyncio
+import csv
+import json
+import multiprocessing
+import time
+
+# 结果中最多保留的错误明细条数
+MAX_REPORTED_ERRORS = 100
+# 每个子进程任务哈希的密码数，任务太小时进程间通信的开销占比过高
+HASH_BATCH_SIZE = 16
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_worker_context = None
+
+
+def _hash_passwords(passwords: List[str], rounds: int) -> List[str]:
+    """在子进程中执行：按与服务器相同的策略计算密码哈希"""
+    global _worker_context
+    if _worker_context is None:
+        _worker_context = build_pwd_context(bcrypt_rounds=rounds)
+    return [_worker_context.hash(password) for password in passwords]
+
+def get_hash_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """哈希进程池，首次调用时创建
+
+    默认进程数为 import_hash_workers，避免管理后台的导入占满web服务器的CPU；命令行导入可传入更大的值。
+    子进程用 forkserver（不支持时用 spawn）启动，不从已运行事件循环、Motor和追踪线程的进程fork。
+    """
+    global _hash_pool
+    if _hash_pool is None:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=max_workers or settings.import_hash_workers or 1, mp_context=context
+        )
+    return _hash_pool
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """把字节流切分为文本行，只在内存中保留不完整的最后一行"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+async def parse_rows(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """逐行解析NDJSON或CSV（首行为表头），产出 (行号, 数据, 错误)
+
+    CSV按行解析，字段值中不能包含换行。空单元格视为未提供。
+    """
+    header = None
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        if fmt == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            if len(values) != len(header):
+                yield line_no, None, "列数与表头不一致"
+                continue
+            yield line_no, {name: value for name, value in zip(header, values) if value != ""}, None
+        else:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_no, None, "不是有效的JSON"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, "每行应为一个JSON对象"
+                continue
+            yield line_no, row, None
+
+
+class ImportStats:
+    """导入进度统计"""
+
+    def __init__(self, rows: int = 0, inserted: int = 0, duplicates: int = 0, invalid: int = 0, failed: int = 0):
+        self.rows = rows
+        self.inserted = inserted
+        self.duplicates = duplicates
+        self.invalid = invalid
+        self.failed = failed
+        self.errors: List[dict] = []
+        self.started = time.perf_counter()
+        self._initial_rows = rows
+
+    def add_error(self, line: int, reason: str, key: dict = None):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            error = {"line": line, "reason": reason}
+            if key:
+                error["key"] = key
+            self.errors.append(error)
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return (self.rows - self._initial_rows) / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "elapsed_seconds": round(time.perf_counter() - self.started, 2),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "errors": self.errors,
+        }
+
+
+def build_document(row: UserImportRow, now: datetime) -> dict:
+    """按 UserModel 的字段构造用户文档"""
+    document = row.dict(exclude={"password"})
+    document["created_at"] = row.created_at or now
+    document["updated_at"] = now
+    document.setdefault("is_admin", False)
+    return document
+
+
+@trace_methods
+class ImportService:
+
+    @staticmethod
+    async def hash_passwords(passwords: List[str]) -> List[str]:
+        """在进程池中并行计算密码哈希，bcrypt cost 与服务器当前策略一致"""
+        rounds = pwd_context.to_dict().get("bcrypt__rounds") or settings.bcrypt_rounds
+        loop = asyncio.get_running_loop()
+        pool = get_hash_pool()
+        batches = await asyncio.gather(*[
+            loop.run_in_executor(pool, _hash_passwords, passwords[i:i + HASH_BATCH_SIZE], rounds)
+            for i in range(0, len(passwords), HASH_BATCH_SIZE)
+        ])
+        return [hashed for batch in batches for hashed in batch]
+
+    @staticmethod
+    async def import_chunk(rows: List[Tuple[int, dict]], stats: ImportStats):
+        """校验、哈希并插入一批行，结果累加到 stats"""
+        now = datetime.utcnow()
+        documents, lines, plaintext = [], [], []
+        for line, raw in rows:
+            try:
+                row = UserImportRow(**raw)
+            except ValidationError as e:
+                stats.invalid += 1
+                stats.add_error(line, "; ".join(
+                    f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+                ))
+                continue
+            except TypeError as e:
+                stats.invalid += 1
+                stats.add_error(line, str(e))
+                continue
+            if not (row.username or row.email or row.phone or row.wechat_openid):
+                stats.invalid += 1
+                stats.add_error(line, "用户名、邮箱、手机号和微信openid至少提供一个")
+                continue
+            document = build_document(row, now)
+            if row.password and not row.hashed_password:
+                plaintext.append((len(documents), row.password))
+            documents.append(document)
+            lines.append(line)
+
+        if plaintext:
+            hashed = await ImportService.hash_passwords([password for _, password in plaintext])
+            for (index, _), value in zip(plaintext, hashed):
+                documents[index]["hashed_password"] = value
+
+        inserted, failures = await get_repositories().users.insert_many(documents)
+        stats.inserted += inserted
+        for failure in failures:
+            line = lines[failure["index"]]
+            if failure["code"] == 11000:
+                stats.duplicates += 1
+                stats.add_error(line, "用户已存在", failure.get("key"))
+            else:
+                stats.failed += 1
+                stats.add_error(line, failure.get("message") or f"写入失败（错误码 {failure['code']}）")
+
+    @staticmethod
+    async def import_users(lines: AsyncIterator[str], fmt: str = "ndjson", chunk_size: int = None,
+                           stats: ImportStats = None,
+                           on_chunk: Callable[[ImportStats], None] = None) -> ImportStats:
+        """流式导入用户，每 chunk_size 行处理一次，内存占用与输入大小无关
+
+        stats.rows 大于0时跳过前 stats.rows 个数据行，用于从断点继续；
+        每批写入完成后调用 on_chunk（保存断点、输出进度）。
+        """
+        if fmt not in ("ndjson", "csv"):
+            raise ValueError(f"不支持的格式: {fmt}")
+        chunk_size = chunk_size or settings.import_chunk_size
+        stats = stats or ImportStats()
+        skip = stats.rows
+        seen = 0
+        chunk: List[Tuple[int, dict]] = []
+
+        async def flush():
+            await ImportService.import_chunk(chunk, stats)
+            stats.rows += len(chunk)
+            chunk.clear()
+            if on_chunk is not None:
+                on_chunk(stats)
+
+        async for line, row, error in parse_rows(lines, fmt):
+            seen += 1
+            if seen <= skip:
+                continue
+            if error is not None:
+                stats.rows += 1
+                stats.invalid += 1
+                stats.add_error(line, error)
+                continue
+            chunk.append((line, row))
+            if len(chunk) >= chunk_size:
+                await flush()
+        if chunk:
+            await flush()
+        return stats
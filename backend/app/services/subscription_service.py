@@ -0,0 +1,115 @@
+from app.core.tracing import trace_methods
+from app.repositories import get_repositories, InsufficientBalanceError
+from app.services.analytics_service import analytics
+from app.schemas.user import VIPSubscriptionCreate
+from bson import ObjectId
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+import binascii
+import uuid
+
+# 套餐：有效天数（None为终身）、VIP等级和价格
+VIP_PLANS = {
+    "monthly": {"days": 30, "vip_level": 1, "price": 30.0},
+    "yearly": {"days": 365, "vip_level": 1, "price": 298.0},
+    "lifetime": {"days": None, "vip_level": 2, "price": 998.0},
+}
+
+
+def encode_cursor(record: dict) -> str:
+    """分页游标：上一页最后一条记录的 (created_at, _id)，对客户端不透明"""
+    raw = f"{record['created_at'].isoformat()}|{record['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, str]]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, last_id = raw.split("|", 1)
+        if not ObjectId.is_valid(last_id):
+            return None
+        return datetime.fromisoformat(created_at), last_id
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def subscription_response(record: dict) -> dict:
+    return {
+        "id": str(record["_id"]),
+        "user_id": str(record["user_id"]),
+        "plan_type": record["plan_type"],
+        "amount": record["amount"],
+        "currency": record.get("currency", "CNY"),
+        "status": record.get("status", "active"),
+        "start_date": record["start_date"],
+        "end_date": record.get("end_date"),
+        "payment_method": record.get("payment_method"),
+        "transaction_id": record.get("transaction_id"),
+        "created_at": record["created_at"],
+    }
+
+
+@trace_methods
+class SubscriptionService:
+
+    @staticmethod
+    async def purchase(user_id: str, subscription: VIPSubscriptionCreate, conversion: bool = False,
+                       payment_verified: bool = False) -> Tuple[Optional[dict], str]:
+        """购买VIP套餐
+
+        余额支付时在同一事务中扣款、延长会员并写入订阅流水；
+        同一 transaction_id 重复提交只生效一次，返回第一次的记录。
+        其他支付方式不扣余额，只能在支付已确认后（payment_verified，如管理员补单）调用，
+        且必须带上外部支付流水号。
+        conversion 表示购买前不是有效VIP，用于统计付费转化。
+        """
+        plan = VIP_PLANS.get(subscription.plan_type)
+        if plan is None:
+            return None, "不支持的套餐类型"
+        if subscription.amount != plan["price"]:
+            return None, "支付金额与套餐价格不符"
+        if subscription.payment_method != "balance":
+            if not payment_verified:
+                return None, "仅支持余额支付，其他支付方式需由支付回调确认"
+            if not subscription.transaction_id:
+                return None, "外部支付需要提供支付流水号"
+
+        now = datetime.utcnow()
+        document = {
+            "user_id": ObjectId(user_id),
+            "plan_type": subscription.plan_type,
+            "amount": subscription.amount,
+            "currency": subscription.currency,
+            "status": "active",
+            "payment_method": subscription.payment_method,
+            "transaction_id": subscription.transaction_id or uuid.uuid4().hex,
+            "created_at": now,
+        }
+        debit = subscription.amount if subscription.payment_method == "balance" else 0.0
+        try:
+            record, created = await get_repositories().subscriptions.purchase(
+                document, debit, plan["vip_level"], plan["days"], now
+            )
+        except InsufficientBalanceError:
+            return None, "VIP余额不足"
+
+        if record is None or str(record["user_id"]) != user_id:
+            return None, "交易号已被使用"
+        if created:
+            analytics.record_vip_purchase(user_id, subscription.plan_type, conversion)
+        return subscription_response(record), "购买成功" if created else "该交易已处理"
+
+    @staticmethod
+    async def list_subscriptions(user_id: str, limit: int = 20,
+                                 cursor: Optional[str] = None) -> Tuple[Optional[dict], str]:
+        """按时间倒序分页返回订阅记录，next_cursor 为空表示没有更多"""
+        before = None
+        if cursor:
+            before = decode_cursor(cursor)
+            if before is None:
+                return None, "无效的分页游标"
+        records: List[dict] = await get_repositories().subscriptions.list_by_user(user_id, limit, before)
+        return {
+            "items": [subscription_response(record) for record in records],
+            "next_cursor": encode_cursor(records[-1]) if len(records) == limit else None,
+        }, "获取成功"
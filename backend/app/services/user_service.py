@@ -1,68 +1,75 @@
-from app.models.user import UserModel, VerificationCodeModel, PyObjectId
+from app.models.user import UserModel, PyObjectId
 from app.schemas.user import UserCreate, UserUpdate, PasswordChange, BindRequest, VIPSubscriptionCreate
-from app.core.security import verify_password, get_password_hash
-from app.core.database import get_database
-from datetime import datetime, timedelta
+from app.core.admission import OverloadedError
+from app.core.security import (
+    verify_password_async, get_password_hash_async, generate_verification_code, password_admission
+)
+from app.repositories import get_repositories
+from app.core.verification_store import get_verification_store
+from app.core.config import settings
+from app.core.tracing import trace_methods
+from datetime import datetime
 from typing import Optional, List, Tuple
+import asyncio
+import contextvars
+import logging
 import os
 import shutil
 from PIL import Image
 import uuid
-import random
-import string
-from bson import ObjectId
 
+logger = logging.getLogger("app.user")
+
+@trace_methods
 class UserService:
     
+    # 持有后台任务的引用，避免任务在完成前被回收
+    _background_tasks = set()
+    
+    @staticmethod
+    def _to_user(user_data: Optional[dict]) -> Optional[UserModel]:
+        """把数据库文档转换为用户模型"""
+        if not user_data:
+            return None
+        if not isinstance(user_data["_id"], PyObjectId):
+            user_data["_id"] = PyObjectId(user_data["_id"])
+        return UserModel(**user_data)
+    
     @staticmethod
-    async def get_user_by_id(user_id: str) -> Optional[UserModel]:
-        """根据ID获取用户"""
-        db = get_database()
-        user_data = await db.users.find_one({"_id": ObjectId(user_id)})
-        if user_data:
-            if not isinstance(user_data["_id"], PyObjectId):
-                user_data["_id"] = PyObjectId(user_data["_id"])
-            return UserModel(**user_data)
-        return None
+    async def get_user_by_id(user_id: str, tolerant: bool = False) -> Optional[UserModel]:
+        """根据ID获取用户，tolerant为True时允许从从库读取"""
+        user_data = await get_repositories().users.get_by_id(user_id, tolerant=tolerant)
+        return UserService._to_user(user_data)
+    
+    @staticmethod
+    async def get_users_by_ids(user_ids: List[str]) -> List[UserModel]:
+        """批量获取用户（从库优先）"""
+        users = await get_repositories().users.get_by_ids(user_ids)
+        return [UserService._to_user(user_data) for user_data in users]
     
     @staticmethod
     async def get_user_by_username(username: str) -> Optional[UserModel]:
         """根据用户名获取用户"""
-        db = get_database()
-        user_data = await db.users.find_one({"username": username})
-        if user_data:
-            if not isinstance(user_data["_id"], PyObjectId):
-                user_data["_id"] = PyObjectId(user_data["_id"])
-            return UserModel(**user_data)
-        return None
+        return UserService._to_user(await get_repositories().users.find_by("username", username))
     
     @staticmethod
     async def get_user_by_email(email: str) -> Optional[UserModel]:
         """根据邮箱获取用户"""
-        db = get_database()
-        user_data = await db.users.find_one({"email": email})
-        if user_data:
-            if not isinstance(user_data["_id"], PyObjectId):
-                user_data["_id"] = PyObjectId(user_data["_id"])
-            return UserModel(**user_data)
-        return None
+        return UserService._to_user(await get_repositories().users.find_by("email", email))
     
     @staticmethod
     async def get_user_by_phone(phone: str) -> Optional[UserModel]:
         """根据手机号获取用户"""
-        db = get_database()
-        user_data = await db.users.find_one({"phone": phone})
-        if user_data:
-            if not isinstance(user_data["_id"], PyObjectId):
-                user_data["_id"] = PyObjectId(user_data["_id"])
-            return UserModel(**user_data)
-        return None
+        return UserService._to_user(await get_repositories().users.find_by("phone", phone))
+    
+    @staticmethod
+    async def get_user_by_wechat_openid(openid: str) -> Optional[UserModel]:
+        """根据微信openid获取用户"""
+        return UserService._to_user(await get_repositories().users.find_by("wechat_openid", openid))
     
     @staticmethod
     async def create_user(user_data: UserCreate) -> Tuple[Optional[UserModel], str]:
         """创建新用户"""
-        db = get_database()
-        
         # 检查用户名是否已存在
         if user_data.username:
             existing_user = await UserService.get_user_by_username(user_data.username)
@@ -84,15 +91,17 @@ class UserService:
         # 创建用户模型
         user_dict = user_data.dict()
         if user_data.password:
-            user_dict["hashed_password"] = get_password_hash(user_data.password)
+            user_dict["hashed_password"] = await get_password_hash_async(user_data.password)
             del user_dict["password"]
         
         user_dict["created_at"] = datetime.utcnow()
         user_dict["updated_at"] = datetime.utcnow()
         
-        # 插入数据库
-        result = await db.users.insert_one(user_dict)
-        user_dict["_id"] = PyObjectId(result.inserted_id)
+        # 插入数据库；上面的检查与插入之间可能有并发注册抢先写入，以唯一索引为准
+        user_id = await get_repositories().users.insert(user_dict)
+        if user_id is None:
+            return None, "该用户已注册"
+        user_dict["_id"] = PyObjectId(user_id)
         
         return UserModel(**user_dict), "用户创建成功"
     
@@ -107,15 +116,12 @@ class UserService:
         update_data = user_data.dict(exclude_unset=True)
         update_data["updated_at"] = datetime.utcnow()
         
-        db = get_database()
-        await db.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": update_data}
-        )
+        user_data = await get_repositories().users.update_and_get(user_id, update_data)
+        if not user_data:
+            return None, "用户不存在"
         
         # 返回更新后的用户
-        updated_user = await UserService.get_user_by_id(user_id)
-        return updated_user, "资料更新成功"
+        return UserService._to_user(user_data), "资料更新成功"
     
     @staticmethod
     async def change_password(user_id: str, password_data: PasswordChange) -> Tuple[bool, str]:
@@ -125,7 +131,7 @@ class UserService:
             return False, "用户不存在或未设置密码"
         
         # 验证旧密码
-        if not verify_password(password_data.old_password, user.hashed_password):
+        if not await verify_password_async(password_data.old_password, user.hashed_password):
             return False, "旧密码错误"
         
         # 验证新密码强度
@@ -133,19 +139,48 @@ class UserService:
             return False, "新密码长度至少6位"
         
         # 更新密码
-        db = get_database()
-        await db.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {
-                "$set": {
-                    "hashed_password": get_password_hash(password_data.new_password),
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
+        await get_repositories().users.update(user_id, {
+            "hashed_password": await get_password_hash_async(password_data.new_password),
+            "updated_at": datetime.utcnow()
+        })
         
         return True, "密码修改成功"
     
+    @staticmethod
+    async def rehash_password(user_id: str, password: str, old_hash: str) -> bool:
+        """按当前哈希策略重新计算密码哈希"""
+        # 迁移优先级低于登录，哈希线程池有排队时放弃，下次登录再迁移
+        if password_admission.estimated_wait() > 0:
+            return False
+        try:
+            new_hash = await get_password_hash_async(password)
+        except OverloadedError:
+            return False
+        
+        # 仅当密码未在此期间被修改时才写入
+        return await get_repositories().users.update(
+            user_id,
+            {"hashed_password": new_hash, "updated_at": datetime.utcnow()},
+            expected={"hashed_password": old_hash}
+        )
+    
+    @staticmethod
+    def schedule_password_rehash(user_id: str, password: str, old_hash: str):
+        """在后台迁移密码哈希，不占用登录请求的响应时间"""
+        # 使用新的上下文，不继承登录请求剩余的截止时间和pymongo超时
+        task = asyncio.create_task(
+            UserService.rehash_password(user_id, password, old_hash), context=contextvars.Context()
+        )
+        UserService._background_tasks.add(task)
+        task.add_done_callback(UserService._rehash_done)
+    
+    @staticmethod
+    def _rehash_done(task: asyncio.Task):
+        UserService._background_tasks.discard(task)
+        # 迁移失败不影响登录，记录后等下次登录重试
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("密码哈希迁移失败: %r", task.exception())
+    
     @staticmethod
     async def verify_user_credentials(username_or_email: str, password: str) -> Optional[UserModel]:
         """验证用户凭据"""
@@ -157,65 +192,53 @@ class UserService:
         if not user or not user.hashed_password:
             return None
         
-        if not verify_password(password, user.hashed_password):
+        if not await verify_password_async(password, user.hashed_password):
             return None
         
         return user
     
+    @staticmethod
+    def _verification_key(phone: str = None, email: str = None, code_type: str = "register") -> str:
+        """验证码存储键"""
+        return f"{code_type}:{phone or email}"
+    
     @staticmethod
     async def generate_verification_code(phone: str = None, email: str = None, code_type: str = "register") -> str:
         """生成验证码"""
-        code = ''.join(random.choices(string.digits, k=6))
-        
-        # 创建验证码记录
-        verification_code = VerificationCodeModel(
-            phone=phone,
-            email=email,
-            code=code,
-            type=code_type,
-            expires_at=datetime.utcnow() + timedelta(minutes=5)
-        )
+        code = generate_verification_code()
         
-        db = get_database()
-        await db.verification_codes.insert_one(verification_code.dict())
+        # 覆盖同一手机号/邮箱之前的验证码，过期后自动清除
+        store = get_verification_store()
+        await store.save(
+            UserService._verification_key(phone, email, code_type),
+            code,
+            settings.verification_code_expire_seconds
+        )
         
         return code
     
     @staticmethod
     async def verify_code(phone: str = None, email: str = None, code: str = None, code_type: str = "register") -> bool:
         """验证验证码"""
-        db = get_database()
-        
-        # 查找验证码
-        query = {
-            "code": code,
-            "type": code_type,
-            "is_used": False,
-            "expires_at": {"$gt": datetime.utcnow()}
-        }
-        
-        if phone:
-            query["phone"] = phone
-        elif email:
-            query["email"] = email
+        if not code:
+            return False
         
-        verification_code = await db.verification_codes.find_one(query)
+        store = get_verification_store()
+        key = UserService._verification_key(phone, email, code_type)
         
-        if not verification_code:
+        # 超过尝试次数后作废验证码，防止暴力枚举
+        attempts = await store.incr_attempts(key, settings.verification_code_expire_seconds)
+        if attempts > settings.verification_code_max_attempts:
+            await store.delete(key)
             return False
         
-        # 标记验证码为已使用
-        await db.verification_codes.update_one(
-            {"_id": verification_code["_id"]},
-            {"$set": {"is_used": True}}
-        )
-        
-        return True
+        # 匹配时原子删除，验证码只能使用一次
+        return await store.consume(key, code)
     
     @staticmethod
     async def get_vip_info(user_id: str) -> dict:
         """获取VIP信息"""
-        user = await UserService.get_user_by_id(user_id)
+        user = await UserService.get_user_by_id(user_id, tolerant=True)
         if not user:
             return {}
         
@@ -0,0 +1,55 @@
+from app.core.config import settings
+from app.core.metrics import VIP_SWEEP_DOWNGRADED, VIP_SWEEP_DURATION
+from app.core.tracing import trace_methods
+from app.repositories import get_repositories
+from datetime import datetime
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("app.vip")
+
+
+@trace_methods
+class VIPService:
+
+    @staticmethod
+    async def sweep_expired(batch_size: int = None) -> dict:
+        """把已过期的VIP降级为普通用户
+
+        每批按到期时间取出一批用户ID，再用一次 update_many 降级，直到没有过期用户。
+        批次之间让出事件循环，不影响同一进程中的请求处理。
+        """
+        batch_size = batch_size or settings.vip_sweep_batch_size
+        users = get_repositories().users
+        now = datetime.utcnow()
+        started = time.perf_counter()
+        scanned = downgraded = batches = 0
+
+        while True:
+            user_ids = await users.find_expired_vip_ids(now, batch_size)
+            if not user_ids:
+                break
+            batches += 1
+            scanned += len(user_ids)
+            modified = await users.downgrade_vips(user_ids, now)
+            downgraded += modified
+            # 整批都未能降级时停止，避免反复取到同一批用户
+            if len(user_ids) < batch_size or modified == 0:
+                break
+            await asyncio.sleep(0)
+
+        elapsed = time.perf_counter() - started
+        VIP_SWEEP_DURATION.observe(elapsed)
+        VIP_SWEEP_DOWNGRADED.inc(downgraded)
+        stats = {
+            "scanned": scanned,
+            "downgraded": downgraded,
+            "batches": batches,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "users_per_second": round(downgraded / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        if downgraded:
+            logger.info("VIP过期清理: 降级 %(downgraded)d 人，%(batches)d 批，耗时 %(elapsed_ms).1fms，"
+                        "%(users_per_second).0f 人/秒", stats)
+        return stats
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+指标中间件开销微基准
+
+直接调用ASGI应用（不经过网络），对比有无 MetricsMiddleware 时单个请求的耗时，
+得到每个请求额外增加的开销。
+
+用法: python -m benchmarks.bench_metrics [--requests 20000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from app.core.metrics import MetricsMiddleware, JWT_DURATION, observe
+
+def build_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return PlainTextResponse("pong")
+
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+async def drive(app, requests: int) -> float:
+    """顺序发送请求，返回每个请求的平均耗时（微秒）"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/ping", "raw_path": b"/ping",
+        "root_path": "", "query_string": b"", "headers": [],
+        "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    # 预热
+    for _ in range(min(1000, requests)):
+        await app(dict(scope), receive, send)
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / requests * 1_000_000
+
+def bench_observe(iterations: int) -> float:
+    """单次 observe() 的耗时（微秒）"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        with observe(JWT_DURATION, "bench"):
+            pass
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+def main():
+    parser = argparse.ArgumentParser(description="指标中间件开销微基准")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    baseline_app = build_app(with_metrics=False)
+    metrics_app = build_app(with_metrics=True)
+
+    # 交替运行多轮取最小值，减少噪声
+    baseline, instrumented = [], []
+    for _ in range(args.rounds):
+        baseline.append(asyncio.run(drive(baseline_app, args.requests)))
+        instrumented.append(asyncio.run(drive(metrics_app, args.requests)))
+
+    best_baseline = min(baseline)
+    best_instrumented = min(instrumented)
+    print(f"无指标中间件:   {best_baseline:8.2f} µs/请求")
+    print(f"有指标中间件:   {best_instrumented:8.2f} µs/请求")
+    print(f"每请求额外开销: {best_instrumented - best_baseline:8.2f} µs")
+    print(f"observe() 单次: {bench_observe(args.requests):8.2f} µs")
+
+if __name__ == "__main__":
+    main()
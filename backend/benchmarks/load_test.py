@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+端到端压测工具
+
+按权重混合注册、密码登录、短信登录、刷新令牌、/auth/me 和修改资料等请求，
+以固定并发持续压测一段时间，统计每个接口的吞吐量和 p50/p95/p99 延迟，并可输出JSON报告用于版本间对比。
+
+默认在进程内通过ASGI直接驱动应用（不经过网络），使用内存存储，不依赖MongoDB和Redis；
+指定 --storage mongo 时使用本地MongoDB，指定 --url 时通过网络压测已启动的服务。
+
+用法:
+    python -m benchmarks.load_test --concurrency 50 --duration 30 --output report.json
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --mix me=10,password_login=1
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+API_PREFIX = "/api/v1"
+
+# 默认请求混合：读多写少，登录和注册占少数
+DEFAULT_MIX = {
+    "me": 40,
+    "refresh": 20,
+    "profile_update": 15,
+    "password_login": 15,
+    "sms_login": 5,
+    "register": 5,
+}
+
+# 验证码接口目前在返回消息中带出验证码
+CODE_PATTERN = re.compile(r"验证码: (\d+)")
+
+
+class Account:
+    """压测账号及其当前令牌"""
+
+    __slots__ = ("username", "phone", "password", "access_token", "refresh_token", "lock")
+
+    def __init__(self, username=None, phone=None, password=None):
+        self.username = username
+        self.phone = phone
+        self.password = password
+        self.access_token = None
+        self.refresh_token = None
+        # 同一手机号的新验证码会覆盖旧验证码，短信登录需串行
+        self.lock = asyncio.Lock()
+
+    def update_tokens(self, data: dict):
+        self.access_token = data.get("access_token", self.access_token)
+        self.refresh_token = data.get("refresh_token", self.refresh_token)
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.access_token}"}
+
+
+class Stats:
+    """按接口汇总请求结果"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def record(self, name: str, seconds: float, status):
+        self.latencies[name].append(seconds)
+        self.statuses[name][str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[name] += 1
+
+    @staticmethod
+    def percentile(sorted_values, p: float) -> float:
+        if not sorted_values:
+            return 0.0
+        index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+        return sorted_values[index]
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in sorted(self.latencies):
+            values = sorted(self.latencies[name])
+            endpoints[name] = {
+                "count": len(values),
+                "errors": self.errors[name],
+                "status": dict(self.statuses[name]),
+                "rps": round(len(values) / elapsed, 2),
+                "mean_ms": round(sum(values) / len(values) * 1000, 3),
+                "p50_ms": round(self.percentile(values, 50) * 1000, 3),
+                "p95_ms": round(self.percentile(values, 95) * 1000, 3),
+                "p99_ms": round(self.percentile(values, 99) * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+            }
+        total = sum(item["count"] for item in endpoints.values())
+        return {
+            "total_requests": total,
+            "total_errors": sum(item["errors"] for item in endpoints.values()),
+            "rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+class LoadTest:
+    """压测场景：每种操作对应一个协程方法，结果记录到 stats"""
+
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, password: str):
+        self.client = client
+        self.stats = stats
+        self.password = password
+        self.password_accounts = []
+        self.sms_accounts = []
+        self._seq = itertools.count()
+        self._run_id = uuid.uuid4().hex[:6]
+
+    async def _request(self, name: str, method: str, path: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, API_PREFIX + path, **kwargs)
+        except httpx.HTTPError as e:
+            self.stats.record(name, time.perf_counter() - started, type(e).__name__)
+            return None
+        self.stats.record(name, time.perf_counter() - started, response.status_code)
+        return response
+
+    def _new_username(self) -> str:
+        return f"lt_{self._run_id}_{next(self._seq)}"
+
+    def _new_phone(self) -> str:
+        # 19x号段 + 8位序号，保证同一轮压测内不重复
+        return f"19{random.randint(0, 9)}{next(self._seq) % 10 ** 8:08d}"
+
+    async def _verification_code(self, phone: str, code_type: str):
+        response = await self._request(
+            "verification_code", "POST", "/auth/verification-code",
+            json={"phone": phone, "type": code_type}
+        )
+        if response is None or response.status_code != 200:
+            return None
+        match = CODE_PATTERN.search(response.json().get("message", ""))
+        return match.group(1) if match else None
+
+    async def register_password(self, record: bool = True):
+        account = Account(username=self._new_username(), password=self.password)
+        response = await self._request(
+            "register" if record else "setup_register", "POST", "/auth/register",
+            json={"username": account.username, "password": account.password, "login_type": "password"}
+        )
+        if response is not None and response.status_code == 200:
+            account.update_tokens(response.json())
+            self.password_accounts.append(account)
+            return account
+        return None
+
+    async def register_sms(self):
+        account = Account(phone=self._new_phone())
+        code = await self._verification_code(account.phone, "register")
+        if code is None:
+            return None
+        response = await self._request(
+            "setup_sms_register", "POST", "/auth/register",
+            json={"phone": account.phone, "verification_code": code, "login_type": "sms"}
+        )
+        if response is not None and response.status_code == 200:
+            account.update_tokens(response.json())
+            self.sms_accounts.append(account)
+            return account
+        return None
+
+    async def register(self):
+        await self.register_password()
+
+    async def password_login(self):
+        account = random.choice(self.password_accounts)
+        response = await self._request(
+            "password_login", "POST", "/auth/login",
+            json={"username": account.username, "password": account.password, "login_type": "password"}
+        )
+        if response is not None and response.status_code == 200:
+            account.update_tokens(response.json())
+
+    async def sms_login(self):
+        account = random.choice(self.sms_accounts)
+        async with account.lock:
+            code = await self._verification_code(account.phone, "login")
+            if code is None:
+                return
+            response = await self._request(
+                "sms_login", "POST", "/auth/login",
+                json={"phone": account.phone, "verification_code": code, "login_type": "sms"}
+            )
+        if response is not None and response.status_code == 200:
+            account.update_tokens(response.json())
+
+    async def refresh(self):
+        account = random.choice(self.password_accounts)
+        response = await self._request(
+            "refresh", "POST", "/auth/refresh", params={"refresh_token": account.refresh_token}
+        )
+        if response is not None and response.status_code == 200:
+            account.update_tokens(response.json())
+
+    async def me(self):
+        account = random.choice(self.password_accounts)
+        await self._request("me", "GET", "/auth/me", headers=account.headers)
+
+    async def profile_update(self):
+        account = random.choice(self.password_accounts)
+        await self._request(
+            "profile_update", "PUT", "/users/profile", headers=account.headers,
+            json={"nickname": f"nick{random.randint(0, 9999)}", "bio": "load test"}
+        )
+
+    async def setup(self, users: int, sms_users: int, concurrency: int):
+        """预先注册账号，供登录和已认证接口使用"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(coro_fn):
+            async with semaphore:
+                return await coro_fn()
+
+        await asyncio.gather(
+            *[limited(lambda: self.register_password(record=False)) for _ in range(users)],
+            *[limited(self.register_sms) for _ in range(sms_users)],
+        )
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"未知的操作: {name}，可选: {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def worker(test: LoadTest, operations, weights, deadline: float):
+    while time.monotonic() < deadline:
+        operation = random.choices(operations, weights)[0]
+        await getattr(test, operation)()
+
+
+def configure_environment(args):
+    """在导入应用前设置进程内压测使用的配置"""
+    os.environ.setdefault("STORAGE_BACKEND", args.storage)
+    os.environ.setdefault("BCRYPT_ROUNDS", str(args.bcrypt_rounds))
+    # 压测流量全部来自同一个IP，限流会让大部分请求变成429
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+
+async def run(args) -> dict:
+    started_at = datetime.utcnow().isoformat() + "Z"
+    app = None
+    if args.url:
+        transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=args.concurrency))
+        base_url = args.url.rstrip("/")
+    else:
+        configure_environment(args)
+        from main import app
+        await app.router.startup()
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://loadtest"
+
+    stats = Stats()
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout) as client:
+            test = LoadTest(client, stats, args.password)
+            setup_started = time.perf_counter()
+            await test.setup(args.users, args.sms_users, args.concurrency)
+            setup_elapsed = time.perf_counter() - setup_started
+            if not test.password_accounts:
+                raise SystemExit("预注册账号失败，请检查服务是否可用")
+
+            mix = dict(args.mix)
+            if not test.sms_accounts:
+                mix.pop("sms_login", None)
+            operations, weights = list(mix), list(mix.values())
+
+            # 预热阶段的结果不计入报告
+            test.stats = stats = Stats()
+            started = time.perf_counter()
+            deadline = time.monotonic() + args.duration
+            await asyncio.gather(*[
+                worker(test, operations, weights, deadline) for _ in range(args.concurrency)
+            ])
+            elapsed = time.perf_counter() - started
+    finally:
+        if app is not None:
+            await app.router.shutdown()
+
+    report = {
+        "started_at": started_at,
+        "target": args.url or f"in-process ({os.environ.get('STORAGE_BACKEND')})",
+        "python": platform.python_version(),
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 3),
+        "setup_s": round(setup_elapsed, 3),
+        "users": len(test.password_accounts),
+        "sms_users": len(test.sms_accounts),
+        "mix": mix,
+        **stats.summary(elapsed),
+    }
+    return report
+
+
+def print_report(report: dict):
+    print(f"目标: {report['target']}  并发: {report['concurrency']}  时长: {report['duration_s']}s")
+    header = f"{'接口':<20}{'请求数':>8}{'错误':>7}{'RPS':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, item in report["endpoints"].items():
+        print(f"{name:<20}{item['count']:>8}{item['errors']:>7}{item['rps']:>10.1f}"
+              f"{item['p50_ms']:>10.2f}{item['p95_ms']:>10.2f}{item['p99_ms']:>10.2f}{item['max_ms']:>10.2f}")
+    print("-" * len(header))
+    print(f"合计 {report['total_requests']} 个请求，{report['total_errors']} 个错误，{report['rps']:.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用户认证系统压测")
+    parser.add_argument("--url", help="压测已启动的服务，如 http://127.0.0.1:8000；不指定时在进程内运行")
+    parser.add_argument("--storage", choices=("memory", "mongo"), default="memory", help="进程内运行时的存储后端")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="压测时长（秒）")
+    parser.add_argument("--users", type=int, default=50, help="预注册的密码账号数")
+    parser.add_argument("--sms-users", type=int, default=10, help="预注册的短信账号数")
+    parser.add_argument("--password", default="LoadTest123")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="进程内运行时的bcrypt轮数")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="操作权重，如 me=40,refresh=20")
+    parser.add_argument("--timeout", type=float, default=30.0, help="单个请求超时（秒）")
+    parser.add_argument("--seed", type=int, help="随机种子，便于复现请求序列")
+    parser.add_argument("--output", help="JSON报告输出路径")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
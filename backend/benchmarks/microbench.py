@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+安全与序列化热点函数微基准
+
+覆盖 create_access_token / create_refresh_token / verify_token、当前bcrypt cost下的
+verify_password / get_password_hash、由MongoDB文档构造 UserModel，以及 LoginResponse 的序列化。
+
+每个基准先预热，再自动确定每轮迭代次数（单轮至少 --min-time 秒），重复 --repeat 轮，
+记录各轮单次耗时的中位数和最小值。计时期间关闭GC，减少抖动。
+与基线对比时使用最小值：干扰只会让耗时变长，最小值受机器负载的影响最小。
+
+用法:
+    python -m benchmarks.microbench                          # 运行并打印结果
+    python -m benchmarks.microbench --save-baseline          # 保存为基线
+    python -m benchmarks.microbench --compare                # 与基线对比，退化超过阈值时退出码为1
+    python -m benchmarks.microbench --compare --threshold 0.2 --filter token
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "microbench.json")
+
+# 基准注册表：名称 -> 返回被测可调用对象的准备函数
+BENCHMARKS = {}
+
+def benchmark(name: str):
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def sample_user_document() -> dict:
+    """与 users 集合中字段齐全的文档结构一致"""
+    now = datetime.utcnow()
+    return {
+        "_id": ObjectId(),
+        "username": "benchmark_user",
+        "email": "bench@example.com",
+        "phone": "13800138000",
+        "hashed_password": "$2b$12$" + "x" * 53,
+        "nickname": "基准用户",
+        "avatar": "/uploads/avatars/ab/abcdef/128.webp",
+        "gender": "other",
+        "birthday": datetime(1990, 1, 1),
+        "bio": "用于微基准的用户",
+        "is_active": True,
+        "is_verified": True,
+        "email_verified": True,
+        "phone_verified": True,
+        "wechat_openid": None,
+        "wechat_unionid": None,
+        "is_vip": True,
+        "vip_level": 1,
+        "vip_expire_time": now + timedelta(days=30),
+        "vip_balance": 12.5,
+        "created_at": now,
+        "updated_at": now,
+        "last_login": now,
+    }
+
+
+@benchmark("create_access_token")
+def bench_create_access_token():
+    from app.core.security import create_access_token
+    data = {"sub": str(ObjectId())}
+    return lambda: create_access_token(data)
+
+@benchmark("create_refresh_token")
+def bench_create_refresh_token():
+    from app.core.security import create_refresh_token
+    data = {"sub": str(ObjectId())}
+    return lambda: create_refresh_token(data)
+
+@benchmark("verify_token")
+def bench_verify_token():
+    from app.core.security import create_access_token, verify_token
+    token = create_access_token({"sub": str(ObjectId())})
+    return lambda: verify_token(token)
+
+@benchmark("verify_password")
+def bench_verify_password():
+    from app.core.security import get_password_hash, verify_password
+    hashed = get_password_hash("Benchmark123")
+    return lambda: verify_password("Benchmark123", hashed)
+
+@benchmark("get_password_hash")
+def bench_get_password_hash():
+    from app.core.security import get_password_hash
+    return lambda: get_password_hash("Benchmark123")
+
+@benchmark("user_model_from_document")
+def bench_user_model():
+    from app.services.user_service import UserService
+    document = sample_user_document()
+    # _to_user 会原地替换 _id，每次使用副本
+    return lambda: UserService._to_user(dict(document))
+
+@benchmark("login_response_serialize")
+def bench_login_response():
+    from app.core.security import create_access_token, create_refresh_token
+    from app.schemas.user import LoginResponse
+    from app.services.user_service import UserService
+    user = UserService._to_user(sample_user_document())
+    access_token = create_access_token({"sub": str(user.id)})
+    refresh_token = create_refresh_token({"sub": str(user.id)})
+
+    # 与FastAPI处理 response_model 的路径一致：校验为响应模型，转换为JSON兼容结构后编码
+    def serialize():
+        response = LoginResponse(access_token=access_token, refresh_token=refresh_token, user=user)
+        return json.dumps(response.model_dump(mode="json"), ensure_ascii=False).encode("utf-8")
+    return serialize
+
+
+def time_loop(fn, number: int) -> float:
+    """执行 fn number 次，返回总耗时（秒）"""
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        return time.perf_counter() - started
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def calibrate(fn, min_time: float) -> int:
+    """类似 timeit.autorange：找到单轮耗时不少于 min_time 的迭代次数"""
+    number = 1
+    while True:
+        if time_loop(fn, number) >= min_time:
+            return number
+        number *= 2
+
+def run_benchmark(fn, warmup: float, min_time: float, repeat: int) -> dict:
+    warmup_until = time.perf_counter() + warmup
+    while time.perf_counter() < warmup_until:
+        fn()
+    number = calibrate(fn, min_time)
+    samples = [time_loop(fn, number) / number for _ in range(repeat)]
+    return {
+        "median_us": round(statistics.median(samples) * 1e6, 3),
+        "min_us": round(min(samples) * 1e6, 3),
+        "stdev_us": round(statistics.stdev(samples) * 1e6, 3) if len(samples) > 1 else 0.0,
+        "iterations": number,
+        "repeat": repeat,
+    }
+
+
+def environment() -> dict:
+    from app.core.config import settings
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "password_hash_scheme": settings.password_hash_scheme,
+        "bcrypt_rounds": settings.bcrypt_rounds,
+    }
+
+def run_all(names, args) -> dict:
+    results = {}
+    for name in names:
+        fn = BENCHMARKS[name]()
+        results[name] = run_benchmark(fn, args.warmup, args.min_time, args.repeat)
+        print(f"{name:<28}{results[name]['median_us']:>14.2f} us  "
+              f"(±{results[name]['stdev_us']:.2f}, {results[name]['iterations']}x{args.repeat})")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """返回退化超过阈值的基准名称"""
+    regressions = []
+    base_results = baseline.get("results", {})
+    print(f"\n{'基准（最小值）':<28}{'基线(us)':>14}{'当前(us)':>14}{'变化':>10}")
+    for name, result in results.items():
+        base = base_results.get(name)
+        if base is None:
+            print(f"{name:<28}{'-':>14}{result['min_us']:>14.2f}{'新增':>10}")
+            continue
+        change = result["min_us"] / base["min_us"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  ❌ 退化"
+        print(f"{name:<28}{base['min_us']:>14.2f}{result['min_us']:>14.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="安全与序列化热点函数微基准")
+    parser.add_argument("--filter", help="只运行名称包含该字符串的基准")
+    parser.add_argument("--warmup", type=float, default=0.5, help="每个基准的预热时间（秒）")
+    parser.add_argument("--min-time", type=float, default=0.2, help="单轮最短耗时（秒）")
+    parser.add_argument("--repeat", type=int, default=7, help="计时轮数")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--compare", action="store_true", help="与基线对比")
+    parser.add_argument("--threshold", type=float, default=0.15, help="允许的最大退化比例")
+    parser.add_argument("--output", help="JSON结果输出路径")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.filter or args.filter in name]
+    if not names:
+        raise SystemExit(f"没有匹配 {args.filter} 的基准，可选: {', '.join(BENCHMARKS)}")
+
+    report = {
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "environment": environment(),
+        "results": run_all(names, args),
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        # 只运行部分基准时保留其余基准的基线
+        results = {**baseline.get("results", {}), **report["results"]}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**report, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存到 {args.baseline}")
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            raise SystemExit(f"基线文件不存在: {args.baseline}，请先使用 --save-baseline 生成")
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != report["environment"]:
+            print("\n⚠️ 基线与当前运行环境不同（Python版本、CPU或哈希参数），对比结果仅供参考")
+        regressions = compare(report["results"], baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} 个基准退化超过 {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\n没有超过 {args.threshold:.0%} 的退化")
+
+
+if __name__ == "__main__":
+    main()
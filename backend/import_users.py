@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+批量导入用户
+
+输入为NDJSON（每行一个JSON对象）或CSV（首行为表头），字段与 UserModel 一致：
+password 为明文时在进程池中计算哈希，hashed_password 为已有的bcrypt哈希时原样保存。
+按批校验后用无序 insert_many 写入，已存在的用户名/邮箱/手机号/微信openid计为重复，不中断导入。
+
+每批写入后把进度保存到断点文件，中断后使用相同命令加 --resume 从断点继续；
+断点之后、崩溃之前已写入的行在重跑时会被识别为重复，不会重复创建。
+
+用法:
+    python import_users.py members.ndjson
+    python import_users.py members.csv --format csv --chunk-size 2000
+    python import_users.py members.ndjson --resume
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from app.core.config import settings
+from app.core.database import connect_to_mongo, close_mongo_connection, ensure_indexes, failed_unique_indexes
+from app.core.security import configure_password_hashing
+from app.services.import_service import ImportService, ImportStats, get_hash_pool, shutdown_hash_pool
+
+
+def load_checkpoint(path: str, source: str) -> ImportStats:
+    if not os.path.exists(path):
+        return ImportStats()
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("source") != os.path.abspath(source):
+        raise SystemExit(f"断点文件 {path} 属于 {checkpoint.get('source')}，与本次输入不一致")
+    stats = ImportStats(**{key: checkpoint[key] for key in ("rows", "inserted", "duplicates", "invalid", "failed")})
+    print(f"从断点继续：跳过已处理的 {stats.rows} 行")
+    return stats
+
+def save_checkpoint(path: str, source: str, stats: ImportStats):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(source), **stats.as_dict()}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def print_progress(stats: ImportStats):
+    sys.stderr.write(
+        f"\r已处理 {stats.rows:>10,} 行  插入 {stats.inserted:,}  重复 {stats.duplicates:,}  "
+        f"无效 {stats.invalid:,}  失败 {stats.failed:,}  {stats.rows_per_second:,.0f} 行/秒"
+    )
+    sys.stderr.flush()
+
+
+async def read_lines(path: str):
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="批量导入用户")
+    parser.add_argument("input", help="NDJSON或CSV文件")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="输入格式，默认按扩展名判断")
+    parser.add_argument("--chunk-size", type=int, default=settings.import_chunk_size, help="每批行数")
+    parser.add_argument("--checkpoint", help="断点文件，默认为 <输入文件>.checkpoint.json")
+    parser.add_argument("--resume", action="store_true", help="从断点继续")
+    parser.add_argument("--hash-workers", type=int, default=os.cpu_count() or 1, help="计算密码哈希的进程数")
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "ndjson")
+    checkpoint = args.checkpoint or args.input + ".checkpoint.json"
+    stats = load_checkpoint(checkpoint, args.input) if args.resume else ImportStats()
+
+    configure_password_hashing()
+    if settings.storage_backend == "mongo":
+        await connect_to_mongo()
+        await ensure_indexes()
+        if failed_unique_indexes("users"):
+            await close_mongo_connection()
+            raise SystemExit("users 集合存在重复数据，唯一索引未建立，无法识别重复用户；请先清理日志中列出的重复值")
+    get_hash_pool(args.hash_workers)
+
+    def on_chunk(current: ImportStats):
+        save_checkpoint(checkpoint, args.input, current)
+        print_progress(current)
+
+    try:
+        stats = await ImportService.import_users(
+            read_lines(args.input), fmt, args.chunk_size, stats, on_chunk
+        )
+    finally:
+        shutdown_hash_pool()
+        await close_mongo_connection()
+
+    print_progress(stats)
+    sys.stderr.write("\n")
+    report = stats.as_dict()
+    for error in report.pop("errors")[:20]:
+        print(f"  第 {error['line']} 行: {error['reason']} {json.dumps(error.get('key') or '', ensure_ascii=False)}")
+    print(json.dumps(report, ensure_ascii=False))
+    print(f"✅ 导入完成，断点文件: {checkpoint}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
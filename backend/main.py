@@ -1,9 +1,25 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse
 from app.core.config import settings
-from app.core.database import connect_to_mongo, close_mongo_connection
+from app.core.database import connect_to_mongo, close_mongo_connection, check_database, ensure_indexes
+from app.core.redis_client import close_redis_connection
+from app.core.admission import OverloadedError
+from app.core.security import configure_password_hashing
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.metrics import MetricsMiddleware, metrics_response
+from app.core.db_monitor import DBTimingMiddleware
+from app.core.deadline import DeadlineMiddleware
+from app.core.uploads import create_uploads_app
+from app.core.scheduler import scheduler
+from app.services.vip_service import VIPService
+from app.services.analytics_service import AnalyticsService
+from app.services.import_service import shutdown_hash_pool
+from app.core.profiler import ProfilerMiddleware, profiler
+from app.core.tracing import TracingMiddleware, tracer
 from app.api.v1 import router as api_router
+from pymongo.errors import PyMongoError
+import math
 import os
 
 # 创建FastAPI应用
@@ -24,22 +40,85 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 挂载静态文件
+# 注册/登录支持 Idempotency-Key，客户端重试时重放第一次的响应
+app.add_middleware(
+    IdempotencyMiddleware,
+    paths=["/api/v1/auth/register", "/api/v1/auth/login"]
+)
+
+# 采样剖析，位于截止时间中间件之内，与处理请求的协程在同一个任务中
+app.add_middleware(ProfilerMiddleware)
+
+# 请求截止时间，剩余预算传递给MongoDB操作，客户端断开时取消处理
+app.add_middleware(
+    DeadlineMiddleware,
+    default_timeout=settings.request_timeout_seconds,
+    route_timeouts=settings.route_timeouts
+)
+
+# 每个请求的数据库访问次数和耗时（Server-Timing响应头）
+app.add_middleware(DBTimingMiddleware)
+
+# 请求耗时指标，添加在业务中间件之后以包住它们
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
+# 链路追踪，位于最外层以覆盖整个请求
+if settings.tracing_enabled:
+    app.add_middleware(TracingMiddleware)
+
+# 上传文件服务：内容寻址的头像长期缓存，支持条件请求、Range和 ?size= 选择尺寸
 if os.path.exists(settings.upload_dir):
-    app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads")
+    app.mount("/uploads", create_uploads_app(), name="uploads")
 
 # 包含API路由
 app.include_router(api_router, prefix="/api/v1")
 
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request, exc: OverloadedError):
+    """密码哈希排队超出延迟预算时快速失败"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    )
+
+@app.exception_handler(PyMongoError)
+async def mongo_error_handler(request, exc: PyMongoError):
+    """数据库操作超出时间预算时返回504"""
+    if exc.timeout:
+        return JSONResponse(status_code=504, content={"detail": "请求处理超时"})
+    return JSONResponse(status_code=500, content={"detail": "数据库错误"})
+
+# 定时任务，随应用启动
+if settings.vip_sweep_enabled:
+    scheduler.add("vip-sweep", settings.vip_sweep_interval_seconds, VIPService.sweep_expired)
+if settings.analytics_enabled:
+    scheduler.add("analytics-flush", settings.analytics_flush_interval_seconds, AnalyticsService.flush)
+
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时连接MongoDB"""
-    await connect_to_mongo()
+    """应用启动时确定密码哈希策略，连接MongoDB并启动定时任务"""
+    configure_password_hashing()
+    if settings.storage_backend == "mongo":
+        await connect_to_mongo()
+        await ensure_indexes()
+    scheduler.start()
+    if settings.profiling_enabled:
+        profiler.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """应用关闭时断开MongoDB连接"""
+    """应用关闭时停止定时任务，写出剩余统计和剖析结果，断开MongoDB和Redis连接并导出剩余的追踪数据"""
+    await scheduler.stop()
+    if settings.analytics_enabled:
+        await AnalyticsService.flush()
+    if profiler.enabled:
+        profiler.stop()
+    shutdown_hash_pool()
     await close_mongo_connection()
+    await close_redis_connection()
+    tracer.shutdown()
 
 @app.get("/")
 def read_root():
@@ -53,6 +132,25 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """就绪检查：数据库可用时返回200，否则返回503"""
+    if settings.storage_backend != "mongo":
+        return {"status": "ready", "storage": settings.storage_backend}
+    try:
+        mongodb = await check_database()
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unavailable", "mongodb": {"error": str(e)}}
+        )
+    return {"status": "ready", "mongodb": mongodb}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus指标"""
+    return metrics_response()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
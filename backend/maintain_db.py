@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+数据库维护
+
+purge: 清理已过期或已使用的验证码、已登出或已过期的会话
+    按 _id 顺序把集合切成每段 MAINTENANCE_BATCH_SIZE 个文档的区间，逐段删除区间内满足条件的文档，
+    每段扫描量有上限，并按 MAINTENANCE_BATCHES_PER_SECOND 限速，避免长时间占用主库和复制带宽。
+    会话在登出或过期 SESSION_RETENTION_DAYS 天后才删除，期间仍可用于审计。
+    --archive 先把文档复制到 <集合>_archive 再删除；--dry-run 只统计将要清理的文档数和字节数；
+    --compact 在清理后对集合执行 compact，把空闲空间还给操作系统（执行期间会阻塞该集合的部分操作）。
+
+clear: 清空全部集合（仅用于开发环境，需要 --yes 确认）
+
+连接参数和数据库名读取 Settings（MONGODB_URL / MONGODB_DATABASE）。
+
+用法:
+    python maintain_db.py purge --dry-run
+    python maintain_db.py purge --archive --compact
+    python maintain_db.py purge user_sessions --batch-size 5000 --rate 20
+    python maintain_db.py clear --yes
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from app.core.config import settings
+from app.core.database import connect_to_mongo, close_mongo_connection, get_database
+
+CLEAR_COLLECTIONS = ("users", "user_sessions", "verification_codes", "vipsubscriptions")
+
+
+def purge_filters(now: datetime) -> dict:
+    """各集合待清理文档的条件"""
+    session_cutoff = now - timedelta(days=settings.session_retention_days)
+    return {
+        "verification_codes": {"$or": [{"expires_at": {"$lt": now}}, {"is_used": True}]},
+        "user_sessions": {"$or": [
+            {"expires_at": {"$lt": session_cutoff}},
+            {"is_active": False, "created_at": {"$lt": session_cutoff}},
+        ]},
+    }
+
+
+async def storage_size(db, collection: str) -> int:
+    try:
+        stats = await db.command("collStats", collection)
+    except OperationFailure:
+        return 0
+    return stats.get("storageSize", 0)
+
+
+async def id_windows(db, collection: str, batch_size: int):
+    """按 _id 顺序产出左闭右开区间 (lower, upper)，每段最多 batch_size 个文档，最后一段 upper 为None
+
+    只读取 _id 索引确定边界，不加载文档。
+    """
+    first = await db[collection].find_one({}, {"_id": 1}, sort=[("_id", 1)])
+    if first is None:
+        return
+    lower = first["_id"]
+    while True:
+        cursor = db[collection].find({"_id": {"$gt": lower}}, {"_id": 1}).sort("_id", 1).skip(batch_size - 1).limit(1)
+        boundary = await cursor.to_list(1)
+        upper = boundary[0]["_id"] if boundary else None
+        yield lower, upper
+        if upper is None:
+            return
+        lower = upper
+
+
+async def measure(db, collection: str, query: dict) -> tuple:
+    """满足条件的文档数和BSON总字节数"""
+    result = await db[collection].aggregate([
+        {"$match": query},
+        {"$group": {"_id": None, "documents": {"$sum": 1}, "bytes": {"$sum": {"$bsonSize": "$$ROOT"}}}},
+    ]).to_list(1)
+    return (result[0]["documents"], result[0]["bytes"]) if result else (0, 0)
+
+
+async def archive(db, collection: str, query: dict) -> list:
+    """把满足条件的文档复制到归档集合，返回已归档的 _id；重跑时已归档的文档不会重复写入"""
+    documents = await db[collection].find(query).to_list(None)
+    if not documents:
+        return []
+    try:
+        await db[f"{collection}_archive"].insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+    return [document["_id"] for document in documents]
+
+
+async def purge_collection(db, collection: str, condition: dict, args) -> dict:
+    interval = 1 / args.rate if args.rate > 0 else 0
+    report = {"collection": collection, "batches": 0, "documents": 0, "bytes": 0}
+    started = time.perf_counter()
+    async for lower, upper in id_windows(db, collection, args.batch_size):
+        batch_started = time.monotonic()
+        id_range = {"$gte": lower}
+        if upper is not None:
+            id_range["$lt"] = upper
+        query = {"_id": id_range, **condition}
+
+        documents, size = await measure(db, collection, query)
+        if documents and not args.dry_run:
+            if args.archive:
+                ids = await archive(db, collection, query)
+                # 只删除已归档的文档
+                result = await db[collection].delete_many({"_id": {"$in": ids}, **condition})
+            else:
+                result = await db[collection].delete_many(query)
+            # 统计与删除之间文档可能变化，字节数按实际删除数折算
+            if result.deleted_count != documents:
+                size = size * result.deleted_count // documents
+            documents = result.deleted_count
+
+        report["batches"] += 1
+        report["documents"] += documents
+        report["bytes"] += size
+        print(f"\r{collection}: {report['batches']:,} 批  {report['documents']:,} 个文档  "
+              f"{report['bytes'] / 1024 / 1024:,.1f} MB", end="", flush=True)
+        remaining = interval - (time.monotonic() - batch_started)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+    print()
+    report["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+async def purge(args):
+    targets = purge_filters(datetime.utcnow())
+    db = get_database()
+    reports = []
+    for collection in args.collections or list(targets):
+        before = await storage_size(db, collection)
+        report = await purge_collection(db, collection, targets[collection], args)
+        if args.compact and not args.dry_run:
+            try:
+                await db.command("compact", collection)
+            except OperationFailure as e:
+                print(f"⚠️  {collection} compact 失败: {e}")
+            report["storage_bytes_before"] = before
+            report["storage_bytes_after"] = await storage_size(db, collection)
+        reports.append(report)
+
+    for report in reports:
+        print(json.dumps(report, ensure_ascii=False))
+    total_documents = sum(report["documents"] for report in reports)
+    total_bytes = sum(report["bytes"] for report in reports)
+    action = "可清理" if args.dry_run else ("已归档并清理" if args.archive else "已清理")
+    print(f"✅ {action} {total_documents:,} 个文档，{total_bytes / 1024 / 1024:,.1f} MB")
+
+
+async def clear(args):
+    if not args.yes:
+        raise SystemExit(f"将清空 {settings.mongodb_database} 中的 {', '.join(CLEAR_COLLECTIONS)}，确认请加 --yes")
+    db = get_database()
+    for collection in CLEAR_COLLECTIONS:
+        result = await db[collection].delete_many({})
+        print(f"已清空集合 {collection}，删除文档数: {result.deleted_count}")
+    print("✅ 数据库清理完成！")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="数据库维护")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    purge_parser = commands.add_parser("purge", help="清理过期验证码和失效会话")
+    purge_parser.add_argument("collections", nargs="*", help="要清理的集合，默认全部（verification_codes, user_sessions）")
+    purge_parser.add_argument("--batch-size", type=int, default=settings.maintenance_batch_size, help="每批扫描的文档数")
+    purge_parser.add_argument("--rate", type=float, default=settings.maintenance_batches_per_second,
+                              help="每秒最多处理的批数，0表示不限速")
+    purge_parser.add_argument("--archive", action="store_true", help="删除前复制到 <集合>_archive")
+    purge_parser.add_argument("--compact", action="store_true", help="清理后压缩集合")
+    purge_parser.add_argument("--dry-run", action="store_true", help="只统计不删除")
+
+    clear_parser = commands.add_parser("clear", help="清空全部集合（开发环境）")
+    clear_parser.add_argument("--yes", action="store_true", help="确认清空")
+
+    args = parser.parse_args()
+    if args.command == "purge":
+        unknown = set(args.collections) - set(purge_filters(datetime.utcnow()))
+        if unknown:
+            parser.error(f"不支持清理集合: {', '.join(sorted(unknown))}")
+        if args.batch_size < 1:
+            parser.error("--batch-size 必须大于0")
+
+    await connect_to_mongo()
+    try:
+        await (purge(args) if args.command == "purge" else clear(args))
+    finally:
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+生成大规模测试数据
+
+按 UserModel 的结构生成N个用户，可配置账号密码/短信/微信用户的比例、VIP比例、
+每个用户的会话数和验证码数量，用于评估索引选择、缓存和VIP过期清理等在真实数据量下的表现。
+
+- 所有密码用户共用一个预先计算的哈希（密码由 --password 指定），不在生成时做bcrypt
+- 按批分给多个进程，各进程独立生成并用无序 insert_many 写入，生成和写入同时利用多个CPU核
+- 注册时间在 --days 天内分布，_id 的时间戳与注册时间一致；部分VIP已过期、部分会话已失效，
+  与线上数据的分布相近
+- 同一 --seed 和参数生成的数据相同；--start 可在已有数据之后追加
+
+验证码写入 verification_codes 集合（VerificationCodeModel 结构），供数据维护工具的清理测试使用；
+应用运行时的验证码在 VERIFICATION_CODE_BACKEND 配置的存储中，不受影响。
+
+用法:
+    python seed_data.py 1000000                          # 一百万用户
+    python seed_data.py 100000 --vip-ratio 0.2 --sessions-per-user 3 --workers 8
+    python seed_data.py 1000000 --drop                   # 先清空集合，写完后再建索引（更快）
+    python seed_data.py 100000 --dry-run                 # 只生成不写入，测量生成速度
+"""
+
+import argparse
+import calendar
+import math
+import multiprocessing
+import os
+import random
+import secrets
+import struct
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.core.config import settings
+from app.repositories.base import SEARCH_FIELDS, normalize_search_value
+
+GENDERS = ("male", "female", "other", None)
+DEVICES = ("iPhone15,2; iOS 17.2", "Pixel 8; Android 14", "Chrome 120; Windows 10", "Safari 17; macOS 14", None)
+CODE_TYPES = ("login", "register", "reset")
+
+# 工作进程内的状态，由 init_worker 设置
+_options = None
+_database = None
+
+
+def object_id_at(moment: datetime, rng: random.Random) -> ObjectId:
+    """时间戳为 moment（UTC，不带时区）的ObjectId，其余8字节随机"""
+    return ObjectId(struct.pack(">I", calendar.timegm(moment.utctimetuple())) + rng.getrandbits(64).to_bytes(8, "big"))
+
+
+def generate_user(n: int, rng: random.Random, now: datetime, options: dict) -> dict:
+    prefix = options["prefix"]
+    created_at = now - timedelta(seconds=rng.random() * options["days"] * 86400)
+    roll = rng.random()
+    user = {
+        "_id": object_id_at(created_at, rng),
+        "username": None,
+        "email": None,
+        "phone": None,
+        "hashed_password": None,
+        "nickname": None,
+        "avatar": None,
+        "gender": rng.choice(GENDERS),
+        "birthday": None,
+        "bio": None,
+        "is_active": rng.random() >= 0.02,
+        "is_verified": False,
+        "email_verified": False,
+        "phone_verified": False,
+        "is_admin": False,
+        "wechat_openid": None,
+        "wechat_unionid": None,
+        "is_vip": False,
+        "vip_level": 0,
+        "vip_expire_time": None,
+        "vip_balance": 0.0,
+        "created_at": created_at,
+        "updated_at": created_at,
+        "last_login": None,
+    }
+    if roll < options["password_ratio"]:
+        user["username"] = f"{prefix}{n}"
+        user["nickname"] = user["username"]
+        user["hashed_password"] = options["hashed_password"]
+        if rng.random() < 0.6:
+            user["email"] = f"{prefix}{n}@example.com"
+            user["email_verified"] = rng.random() < 0.5
+    elif roll < options["password_ratio"] + options["sms_ratio"]:
+        # 按序号生成，保证手机号互不相同（最多十亿个）
+        user["phone"] = f"1{3 + n // 10 ** 9 % 7}{n % 10 ** 9:09d}"
+        user["nickname"] = f"用户{user['phone'][-4:]}"
+        user["phone_verified"] = True
+    else:
+        user["wechat_openid"] = f"o{prefix}{n:x}{rng.getrandbits(48):012x}"
+        user["wechat_unionid"] = f"u{rng.getrandbits(96):024x}" if rng.random() < 0.7 else None
+        user["nickname"] = f"微信用户{user['wechat_openid'][-6:]}"
+        user["avatar"] = f"https://thirdwx.qlogo.cn/mmopen/{rng.getrandbits(64):016x}/132"
+    user["is_verified"] = user["email_verified"] or user["phone_verified"]
+
+    if rng.random() < options["vip_ratio"]:
+        user["is_vip"] = True
+        user["vip_level"] = 2 if rng.random() < 0.1 else 1
+        # 少量终身会员；其余到期时间在过去30天到未来一年之间，部分等待过期清理
+        if rng.random() >= 0.02:
+            user["vip_expire_time"] = now + timedelta(days=rng.uniform(-30, 365))
+        user["vip_balance"] = round(rng.uniform(0, 500), 2)
+
+    if rng.random() < 0.9:
+        user["last_login"] = created_at + (now - created_at) * rng.random()
+    user["search"] = {field: normalize_search_value(user[field]) for field in SEARCH_FIELDS}
+    return user
+
+
+def generate_sessions(user: dict, rng: random.Random, now: datetime, mean: float) -> list:
+    # 泊松分布的会话数，均值为 mean
+    count, threshold, product = 0, math.exp(-mean), rng.random()
+    while product > threshold:
+        count += 1
+        product *= rng.random()
+    sessions = []
+    for _ in range(count):
+        created_at = user["created_at"] + (now - user["created_at"]) * rng.random()
+        sessions.append({
+            "_id": object_id_at(created_at, rng),
+            "user_id": user["_id"],
+            "refresh_token": secrets.token_urlsafe(32),
+            "device_info": rng.choice(DEVICES),
+            "ip_address": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+            "is_active": rng.random() < 0.7,
+            "created_at": created_at,
+            "expires_at": created_at + timedelta(days=7),
+        })
+    return sessions
+
+
+def generate_code(user: dict, rng: random.Random, now: datetime) -> dict:
+    created_at = now - timedelta(seconds=rng.random() * 7 * 86400)
+    code = {
+        "_id": object_id_at(created_at, rng),
+        "phone": user["phone"] or f"1{rng.randrange(3, 10)}{rng.randrange(10 ** 9):09d}",
+        "email": None,
+        "code": f"{rng.randrange(10 ** 6):06d}",
+        "type": rng.choice(CODE_TYPES),
+        "is_used": rng.random() < 0.6,
+        "expires_at": created_at + timedelta(seconds=settings.verification_code_expire_seconds),
+        "created_at": created_at,
+    }
+    return code
+
+
+def generate_batch(start: int, count: int, options: dict) -> dict:
+    """生成序号 [start, start+count) 的用户及其会话和验证码"""
+    rng = random.Random(options["seed"] * 1_000_003 + start)
+    now = options["now"]
+    users, sessions, codes = [], [], []
+    for n in range(start, start + count):
+        user = generate_user(n, rng, now, options)
+        users.append(user)
+        sessions.extend(generate_sessions(user, rng, now, options["sessions_per_user"]))
+        if rng.random() < options["codes_per_user"]:
+            codes.append(generate_code(user, rng, now))
+    return {"users": users, "user_sessions": sessions, "verification_codes": codes}
+
+
+def init_worker(options: dict):
+    global _options, _database
+    _options = options
+    if not options["dry_run"]:
+        from pymongo import MongoClient
+        from app.core.database import client_options
+        _database = MongoClient(settings.mongodb_url, **client_options())[settings.mongodb_database]
+
+
+def run_batch(batch: tuple) -> dict:
+    from pymongo.errors import BulkWriteError
+    start, count = batch
+    collections = generate_batch(start, count, _options)
+    inserted = {}
+    for name, documents in collections.items():
+        if _options["dry_run"] or not documents:
+            inserted[name] = len(documents)
+            continue
+        try:
+            inserted[name] = len(_database[name].insert_many(documents, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            # 重复运行时已存在的用户被唯一索引拒绝，其余照常写入
+            inserted[name] = e.details.get("nInserted", 0)
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成大规模测试数据")
+    parser.add_argument("users", type=int, help="用户数")
+    parser.add_argument("--password-ratio", type=float, default=0.5, help="账号密码用户比例")
+    parser.add_argument("--sms-ratio", type=float, default=0.35, help="短信用户比例，其余为微信用户")
+    parser.add_argument("--vip-ratio", type=float, default=0.1, help="VIP比例")
+    parser.add_argument("--sessions-per-user", type=float, default=1.5, help="每个用户的平均会话数")
+    parser.add_argument("--codes-per-user", type=float, default=0.2, help="每个用户生成一条验证码记录的概率")
+    parser.add_argument("--days", type=int, default=365, help="注册时间分布的天数")
+    parser.add_argument("--password", default="Passw0rd!", help="密码用户的统一密码")
+    parser.add_argument("--prefix", default="seed", help="用户名、邮箱和openid的前缀")
+    parser.add_argument("--start", type=int, default=0, help="起始序号，用于追加数据")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--batch-size", type=int, default=5000, help="每批用户数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="进程数")
+    parser.add_argument("--drop", action="store_true", help="先删除 users / user_sessions / verification_codes 集合")
+    parser.add_argument("--dry-run", action="store_true", help="只生成不写入")
+    args = parser.parse_args()
+    if args.password_ratio + args.sms_ratio > 1:
+        parser.error("--password-ratio 与 --sms-ratio 之和不能超过1")
+
+    from app.core.security import configure_password_hashing, get_password_hash
+    # 与服务器相同的哈希方案和cost，只计算一次
+    configure_password_hashing()
+    options = {
+        "prefix": args.prefix,
+        "password_ratio": args.password_ratio,
+        "sms_ratio": args.sms_ratio,
+        "vip_ratio": args.vip_ratio,
+        "sessions_per_user": args.sessions_per_user,
+        "codes_per_user": args.codes_per_user,
+        "days": args.days,
+        "seed": args.seed,
+        "now": datetime.utcnow(),
+        "hashed_password": get_password_hash(args.password),
+        "dry_run": args.dry_run,
+    }
+
+    if args.drop and not args.dry_run:
+        from pymongo import MongoClient
+        from app.core.database import client_options
+        database = MongoClient(settings.mongodb_url, **client_options())[settings.mongodb_database]
+        for name in ("users", "user_sessions", "verification_codes"):
+            database.drop_collection(name)
+        print(f"已删除 {settings.mongodb_database} 中的 users / user_sessions / verification_codes")
+
+    end = args.start + args.users
+    batches = [(start, min(args.batch_size, end - start)) for start in range(args.start, end, args.batch_size)]
+    totals = {"users": 0, "user_sessions": 0, "verification_codes": 0}
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(options,)) as pool:
+        for inserted in pool.imap_unordered(run_batch, batches):
+            for name, count in inserted.items():
+                totals[name] += count
+            elapsed = time.perf_counter() - started
+            print(f"\r用户 {totals['users']:>11,}  会话 {totals['user_sessions']:>11,}  "
+                  f"验证码 {totals['verification_codes']:>9,}  {totals['users'] / elapsed:,.0f} 用户/秒",
+                  end="", flush=True)
+    print()
+
+    if args.drop and not args.dry_run:
+        # 数据写完后再建索引，比逐条维护索引快得多
+        import asyncio
+        from app.core.database import connect_to_mongo, close_mongo_connection, ensure_indexes
+
+        async def build_indexes():
+            await connect_to_mongo()
+            await ensure_indexes()
+            await close_mongo_connection()
+        asyncio.run(build_indexes())
+
+    elapsed = time.perf_counter() - started
+    action = "生成" if args.dry_run else "写入"
+    print(f"✅ {action} {totals['users']:,} 个用户，{totals['user_sessions']:,} 个会话，"
+          f"{totals['verification_codes']:,} 条验证码，耗时 {elapsed:.1f}秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+
+# 测试使用内存存储和最低的bcrypt成本，不依赖MongoDB和Redis
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("VERIFICATION_CODE_BACKEND", "memory")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
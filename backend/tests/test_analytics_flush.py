@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services import analytics_service
+from app.services.analytics_service import AnalyticsService, RollupBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    buffer = RollupBuffer()
+    monkeypatch.setattr(settings, "analytics_enabled", True)
+    monkeypatch.setattr(analytics_service, "analytics", buffer)
+    buffer.record_login("user", "password")
+    return buffer
+
+
+def login_counts(rollups) -> list:
+    return sorted(rollup["counters"].get("logins.password", 0) for rollup in rollups)
+
+
+async def test_cancelled_flush_restores_rollups(buffer, monkeypatch):
+    started = asyncio.Event()
+
+    async def apply(rollups):
+        started.set()
+        await asyncio.Event().wait()
+
+    repositories = SimpleNamespace(analytics=SimpleNamespace(apply=apply))
+    monkeypatch.setattr(analytics_service, "get_repositories", lambda: repositories)
+
+    # 关闭时定时任务在写入中途被取消
+    task = asyncio.create_task(AnalyticsService.flush())
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert login_counts(buffer.drain()) == [1, 1, 1]
+
+
+async def test_failed_flush_restores_rollups(buffer, monkeypatch):
+    async def apply(rollups):
+        raise RuntimeError("写入失败")
+
+    repositories = SimpleNamespace(analytics=SimpleNamespace(apply=apply))
+    monkeypatch.setattr(analytics_service, "get_repositories", lambda: repositories)
+
+    with pytest.raises(RuntimeError):
+        await AnalyticsService.flush()
+
+    assert login_counts(buffer.drain()) == [1, 1, 1]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.repositories import mongo
+from app.repositories.memory import create_memory_repositories
+from app.repositories.mongo import MongoUserRepository
+from app.schemas.user import UserCreate
+from app.services import user_service
+from app.services.user_service import UserService
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def repositories(monkeypatch):
+    repositories = create_memory_repositories()
+    monkeypatch.setattr(user_service, "get_repositories", lambda: repositories)
+    return repositories
+
+
+@pytest.fixture
+def hash_barrier(monkeypatch):
+    """让并发的注册请求都通过存在性检查后再一起写入"""
+    barrier = asyncio.Barrier(2)
+
+    async def get_password_hash_async(password: str) -> str:
+        await barrier.wait()
+        return f"hashed:{password}"
+
+    monkeypatch.setattr(user_service, "get_password_hash_async", get_password_hash_async)
+    return barrier
+
+
+@pytest.mark.parametrize("field, value", [
+    ("username", "alice"),
+    ("email", "alice@example.com"),
+    ("phone", "13800138000"),
+])
+async def test_concurrent_registration_creates_one_user(repositories, hash_barrier, field, value):
+    user_data = UserCreate(password="Passw0rd!", **{field: value})
+    results = await asyncio.gather(UserService.create_user(user_data), UserService.create_user(user_data))
+
+    created = [user for user, _ in results if user is not None]
+    assert len(created) == 1
+    assert sorted(message for _, message in results) == ["用户创建成功", "该用户已注册"]
+    assert str((await repositories.users.find_by(field, value))["_id"]) == str(created[0].id)
+
+
+async def test_concurrent_wechat_registration_creates_one_user(repositories):
+    # 微信登录先按openid查找再创建，create_user 本身不检查openid，冲突由插入时发现
+    user_data = UserCreate(wechat_openid="o-alice", nickname="微信用户")
+    results = await asyncio.gather(UserService.create_user(user_data), UserService.create_user(user_data))
+
+    assert sorted(message for _, message in results) == ["用户创建成功", "该用户已注册"]
+
+
+async def test_mongo_insert_returns_none_on_duplicate_key(monkeypatch):
+    class Users:
+        async def insert_one(self, document):
+            raise DuplicateKeyError("E11000 duplicate key error collection: users index: username_1")
+
+    class Database:
+        users = Users()
+
+    async def record_write(user_id: str):
+        raise AssertionError("冲突的插入不应记录写入")
+
+    monkeypatch.setattr(mongo, "get_database", lambda: Database())
+    monkeypatch.setattr(mongo, "record_write", record_write)
+    assert await MongoUserRepository().insert({"username": "alice"}) is None
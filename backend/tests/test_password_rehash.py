@@ -0,0 +1,34 @@
+import time
+
+import pymongo
+import pytest
+from pymongo import _csot
+
+from app.core import deadline
+from app.core.deadline import remaining_time
+from app.services.user_service import UserService
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_rehash_does_not_inherit_request_deadline(monkeypatch):
+    seen = {}
+
+    async def rehash_password(user_id: str, password: str, old_hash: str) -> bool:
+        seen["remaining"] = remaining_time()
+        seen["mongo_timeout"] = _csot.get_timeout()
+        return True
+
+    monkeypatch.setattr(UserService, "rehash_password", staticmethod(rehash_password))
+
+    # 模拟登录请求即将用完的时间预算
+    token = deadline._deadline.set(time.monotonic() + 0.01)
+    try:
+        with pymongo.timeout(0.01):
+            UserService.schedule_password_rehash("user", "Passw0rd!", "old-hash")
+    finally:
+        deadline._deadline.reset(token)
+
+    task = next(iter(UserService._background_tasks))
+    assert await task is True
+    assert seen == {"remaining": None, "mongo_timeout": None}
@@ -0,0 +1,83 @@
+import asyncio
+import contextvars
+import os
+
+import fakeredis
+import pytest
+
+from app.core import database, redis_client
+from app.core.config import settings
+
+pytestmark = pytest.mark.anyio
+
+REPLSET_URL = os.environ.get("MONGODB_TEST_REPLSET_URL")
+
+
+@pytest.fixture
+def shared_pins(monkeypatch):
+    """用fakeredis共享最近写入记录，主库和从库用哨兵对象代替"""
+    primary, secondary = object(), object()
+    monkeypatch.setattr(database.db, "database", primary)
+    monkeypatch.setattr(database.db, "tolerant_database", secondary)
+    monkeypatch.setattr(settings, "mongodb_primary_pin_backend", "redis")
+    monkeypatch.setattr(redis_client.redis_client, "client", fakeredis.FakeAsyncRedis(decode_responses=True))
+    monkeypatch.setattr(database, "_recent_writes", {})
+    return primary, secondary
+
+
+async def in_other_worker(coro_fn, *args):
+    """在没有当前请求上下文和进程内写入记录的环境中执行，模拟另一个worker"""
+    saved = dict(database._recent_writes)
+    database._recent_writes.clear()
+    try:
+        return await asyncio.get_running_loop().create_task(coro_fn(*args), context=contextvars.Context())
+    finally:
+        database._recent_writes.update(saved)
+
+
+async def test_unwritten_user_reads_secondary(shared_pins):
+    primary, secondary = shared_pins
+    assert await in_other_worker(database.get_user_read_database, "u1") is secondary
+
+
+async def test_write_pins_user_across_workers(shared_pins):
+    primary, secondary = shared_pins
+    await in_other_worker(database.record_write, "u1")
+    assert await in_other_worker(database.get_user_read_database, "u1") is primary
+    assert await in_other_worker(database.get_user_read_database, "u2") is secondary
+
+
+async def test_memory_backend_pins_only_within_worker(shared_pins, monkeypatch):
+    primary, secondary = shared_pins
+    monkeypatch.setattr(settings, "mongodb_primary_pin_backend", "memory")
+    await in_other_worker(database.record_write, "u1")
+    assert await in_other_worker(database.get_user_read_database, "u1") is secondary
+
+
+@pytest.mark.skipif(not REPLSET_URL, reason="需要 MONGODB_TEST_REPLSET_URL 指向单节点副本集")
+async def test_replica_set_read_your_writes(monkeypatch):
+    from app.repositories.mongo import MongoUserRepository
+
+    monkeypatch.setattr(settings, "mongodb_url", REPLSET_URL)
+    monkeypatch.setattr(settings, "mongodb_database", "user_auth_test_read_your_writes")
+    monkeypatch.setattr(settings, "mongodb_primary_pin_backend", "redis")
+    monkeypatch.setattr(redis_client.redis_client, "client", fakeredis.FakeAsyncRedis(decode_responses=True))
+    await database.connect_to_mongo()
+    try:
+        hello = await database.db.client.admin.command("hello")
+        if "setName" not in hello:
+            pytest.skip("MONGODB_TEST_REPLSET_URL 不是副本集")
+        repository = MongoUserRepository()
+        user_id = await in_other_worker(repository.insert, {"username": "ryw", "nickname": "before"})
+        await in_other_worker(repository.update, user_id, {"nickname": "after"})
+
+        assert await in_other_worker(database.get_user_read_database, user_id) is database.db.database
+        user_data = await in_other_worker(repository.get_by_id, user_id, True)
+        assert user_data["nickname"] == "after"
+
+        # 因果一致性会话内先写后读，读偏好为从库优先时也能读到本次更新
+        user_data = await in_other_worker(repository.update_and_get, user_id, {"nickname": "causal"})
+        assert user_data["nickname"] == "causal"
+    finally:
+        await database.db.client.drop_database(settings.mongodb_database)
+        await database.close_mongo_connection()
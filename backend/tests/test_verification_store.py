@@ -0,0 +1,126 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from app.core.config import settings
+from app.core.verification_store import MemoryVerificationCodeStore, RedisVerificationCodeStore
+from app.services import user_service
+from app.services.user_service import UserService
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(params=["memory", "redis"])
+async def store(request, clock):
+    if request.param == "memory":
+        yield MemoryVerificationCodeStore(clock=clock)
+    else:
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        yield RedisVerificationCodeStore(client=client)
+        await client.aclose()
+
+
+async def expire(store, clock, seconds: float):
+    """让TTL过去：内存存储拨快时钟，Redis等待真实时间"""
+    if isinstance(store, MemoryVerificationCodeStore):
+        clock.now += seconds
+    else:
+        await asyncio.sleep(seconds)
+
+
+async def test_save_and_get(store):
+    await store.save("login:13800138000", "123456", 60)
+    assert await store.get("login:13800138000") == "123456"
+    assert await store.get("login:13900139000") is None
+
+
+async def test_save_overwrites_code_and_resets_attempts(store):
+    await store.save("login:13800138000", "111111", 60)
+    assert await store.incr_attempts("login:13800138000", 60) == 1
+    await store.save("login:13800138000", "222222", 60)
+    assert await store.get("login:13800138000") == "222222"
+    assert await store.incr_attempts("login:13800138000", 60) == 1
+
+
+async def test_pop_returns_code_once(store):
+    await store.save("reset:a@example.com", "654321", 60)
+    assert await store.pop("reset:a@example.com") == "654321"
+    assert await store.pop("reset:a@example.com") is None
+
+
+async def test_concurrent_pop_succeeds_once(store):
+    await store.save("reset:a@example.com", "654321", 60)
+    results = await asyncio.gather(*[store.pop("reset:a@example.com") for _ in range(20)])
+    assert results.count("654321") == 1
+    assert results.count(None) == 19
+
+
+async def test_consume_requires_matching_code(store):
+    await store.save("login:13800138000", "123456", 60)
+    assert await store.consume("login:13800138000", "000000") is False
+    assert await store.get("login:13800138000") == "123456"
+    assert await store.consume("login:13800138000", "123456") is True
+    assert await store.consume("login:13800138000", "123456") is False
+
+
+async def test_concurrent_consume_succeeds_once(store):
+    await store.save("login:13800138000", "123456", 60)
+    results = await asyncio.gather(*[store.consume("login:13800138000", "123456") for _ in range(20)])
+    assert results.count(True) == 1
+
+
+async def test_attempts_are_counted(store):
+    counts = [await store.incr_attempts("login:13800138000", 60) for _ in range(3)]
+    assert counts == [1, 2, 3]
+    await store.delete("login:13800138000")
+    assert await store.incr_attempts("login:13800138000", 60) == 1
+
+
+async def test_code_expires(store, clock):
+    await store.save("login:13800138000", "123456", 1)
+    await expire(store, clock, 1.1)
+    assert await store.get("login:13800138000") is None
+    assert await store.consume("login:13800138000", "123456") is False
+
+
+async def test_attempts_expire(store, clock):
+    await store.incr_attempts("login:13800138000", 1)
+    await store.incr_attempts("login:13800138000", 1)
+    await expire(store, clock, 1.1)
+    assert await store.incr_attempts("login:13800138000", 1) == 1
+
+
+async def test_lockout_after_max_attempts(store, monkeypatch):
+    monkeypatch.setattr(user_service, "get_verification_store", lambda: store)
+    monkeypatch.setattr(settings, "verification_code_max_attempts", 3)
+    code = await UserService.generate_verification_code(phone="13800138000", code_type="login")
+    wrong = "000000" if code != "000000" else "111111"
+
+    for _ in range(3):
+        assert await UserService.verify_code(phone="13800138000", code=wrong, code_type="login") is False
+    # 超过次数后即使验证码正确也失败，且验证码被作废
+    assert await UserService.verify_code(phone="13800138000", code=code, code_type="login") is False
+    assert await store.get("login:13800138000") is None
+
+
+async def test_correct_code_within_attempts(store, monkeypatch):
+    monkeypatch.setattr(user_service, "get_verification_store", lambda: store)
+    code = await UserService.generate_verification_code(email="a@example.com", code_type="register")
+    wrong = "000000" if code != "000000" else "111111"
+    assert await UserService.verify_code(email="a@example.com", code=wrong, code_type="register") is False
+    assert await UserService.verify_code(email="a@example.com", code=code, code_type="register") is True
+    assert await UserService.verify_code(email="a@example.com", code=code, code_type="register") is False